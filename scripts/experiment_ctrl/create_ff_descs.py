@@ -14,6 +14,8 @@ import os
 
 import yaml
 
+import sweep
+
 
 SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
 
@@ -114,6 +116,43 @@ def set_sources_in_cmd(descs):
                 ))
 
 
+def sweep_spec():
+    return {
+        'repeat': RUNS,
+        # for modes other than SFR only the first SFR parameters are used
+        'axes': [
+            {'name': 'mode', 'values': MODES},
+            {'name': 'win_size', 'values': SFR_INIT_WIN_SIZES,
+             'when': {'mode': 'sfr'}},
+            {'name': 'arq_timeout', 'values': SFR_ARQ_TIMEOUTS,
+             'when': {'mode': 'sfr'}},
+            {'name': 'ifg', 'values': SFR_INTER_FRAME_GAPS,
+             'when': {'mode': 'sfr'}},
+            {'name': 'data_len',
+             'range': [DATA_LENS.start, DATA_LENS.stop, DATA_LENS.step]},
+        ],
+        'run': {
+            'env': {'MODE': '$mode'},
+            'args': {
+                'delay_ms': DELAY_MS,
+                'data_len': '$data_len',
+            },
+        },
+        'variants': [{
+            'when': {'mode': 'sfr'},
+            'run': {
+                'name': SFR_NAME,
+                'env': {
+                    'SFR_DATAGRAM_RETRIES': 0,
+                    'SFR_INIT_WIN_SIZE': '$win_size',
+                    'SFR_ARQ_TIMEOUT': '$arq_timeout',
+                    'SFR_INTER_FRAME_GAP': '$ifg',
+                },
+            },
+        }],
+    }
+
+
 def main():                 # pylint: disable=missing-function-docstring
     parser = argparse.ArgumentParser()
     parser.add_argument('-r', '--rebuild-first', action='store_true',
@@ -121,50 +160,33 @@ def main():                 # pylint: disable=missing-function-docstring
                              "firmware or environment")
     parser.add_argument('-i', '--exp-id', type=int, default=None,
                         help="Experiment ID of an already running experiment")
+    parser.add_argument('-e', '--expand', action='store_true',
+                        help="Write all runs instead of the sweep they are "
+                             "generated from")
     args = parser.parse_args()
 
+    spec = sweep_spec()
     descs = {'unscheduled': [{'runs': []}], 'globals': GLOBALS}
     descs['globals']['run_wait'] = (UDP_COUNT * DELAY_MS * 1.6) / 1000
     set_sources_in_cmd(descs)
-    duration = 0
-    for _ in range(RUNS):           # pylint: disable=too-many-nested-blocks
-        for mode in MODES:
-            for w, win_size in enumerate(SFR_INIT_WIN_SIZES):
-                if mode != 'sfr' and w > 0:
-                    break
-                for a, arq_timeout in enumerate(SFR_ARQ_TIMEOUTS):
-                    if mode != 'sfr' and a > 0:
-                        break
-                    for i, ifg in enumerate(SFR_INTER_FRAME_GAPS):
-                        if mode != 'sfr' and i > 0:
-                            break
-                        for data_len in DATA_LENS:
-                            run = {
-                                'env': {'MODE': mode},
-                                'args': {
-                                    'delay_ms': DELAY_MS,
-                                    'data_len': data_len,
-                                },
-                            }
-                            if mode == 'sfr':
-                                run['name'] = SFR_NAME
-                                run['env']['SFR_DATAGRAM_RETRIES'] = 0
-                                run['env']['SFR_INIT_WIN_SIZE'] = win_size
-                                run['env']['SFR_ARQ_TIMEOUT'] = arq_timeout
-                                run['env']['SFR_INTER_FRAME_GAP'] = ifg
-                            descs['unscheduled'][0]['runs'].append(run)
-                            duration += (descs['globals']['run_wait'] + 120)
+    duration = sweep.count(spec) * (descs['globals']['run_wait'] + 120)
     # add first run env to globals so we only build firmware once on start
     # (rebuild is handled with `--rebuild-first` if desired)
-    descs['globals']['env'].update(descs['unscheduled'][0]['runs'][0]['env'])
+    descs['globals']['env'].update(next(sweep.runs(spec))[1]['env'])
     descs['globals']['duration'] = int((duration / 60) + 20)
     if args.rebuild_first or args.exp_id is not None:
-        descs['unscheduled'][0]['runs'][0]['rebuild'] = True
+        spec['rebuild_first'] = True
+    if args.expand:
+        descs['unscheduled'][0]['runs'] = sweep.expanded(spec)
+    else:
+        descs['unscheduled'][0]['sweep'] = spec
     if args.exp_id is not None:
         descs[args.exp_id] = descs['unscheduled'][0]
         del descs['unscheduled']
-    with open(os.path.join(SCRIPT_PATH, 'descs.yaml'), 'w') as output:
+    descs_filename = os.path.join(SCRIPT_PATH, 'descs.yaml')
+    with open(descs_filename, 'w') as output:
         output.write(yaml.dump(descs))
+    sweep.discard_checkpoint(descs_filename)
 
 
 if __name__ == "__main__":
@@ -10,11 +10,18 @@
 # pylint: disable=missing-class-docstring
 
 import argparse
+import collections
+import concurrent.futures
+import copy
 import csv
+import itertools
+import json
 import logging
 import os
+import re
 import subprocess
 import sys
+import threading
 import time
 
 import coloredlogs
@@ -23,6 +30,10 @@ import riotctrl.ctrl
 
 from iotlab_controller.constants import IOTLAB_DOMAIN
 from iotlab_controller.experiment.descs import tmux_runner
+from iotlab_controller.experiment.descs.file_handler import \
+    EXP_RUN_KEYS, NestedDescriptionBase
+
+import sweep
 
 
 __author__ = "Martine S. Lenders"
@@ -34,6 +45,28 @@ SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
 SINK_PORT = 61616
 PREFIX = '2001:db8:1::'
 NODES_CSV_NAME = 'nodes.csv'
+NODE_CACHE_NAME = 'node_metadata.json'
+# nodes queried for their metadata in parallel
+DISCOVERY_JOBS = 8
+# runs of a sweep added to an experiment at a time
+SWEEP_BATCH = 32
+# seconds after the start of a run by which all sources must have started
+# sending and the sink must have received a packet
+HEALTH_GRACE = 60
+# how often a run is re-queued after it was aborted as unhealthy
+MAX_REQUEUES = 2
+# command line and default level of each codec captures can be compressed
+# with, the compressed file replaces the capture
+CAPTURE_CODECS = {
+    'gzip': (['gzip', '-{level}'], 9),
+    'xz': (['xz', '-T0', '-{level}'], 6),
+    'zstd': (['zstd', '-q', '--rm', '-T0', '-{level}'], 19),
+}
+CAPTURE_CODEC = 'gzip'
+# captures compressed in parallel in the background
+COMPRESSION_JOBS = 2
+# seconds to wait for all nodes to echo a round of provisioning commands
+ECHO_TIMEOUT = 10
 
 sys.path.append(os.path.join(
     SCRIPT_PATH, '..', '..', 'RIOT', 'dist', 'pythonlibs')
@@ -45,16 +78,331 @@ import riotctrl_shell.netif     # noqa: E402
 logger = logging.getLogger(__name__)
 
 
+def cmd_nodes(cmd, nodes):
+    """
+    Returns the nodes the serial aggregator command `cmd` is sent to, given
+    in the node selection syntax of the serial aggregator, or all of `nodes`
+    if it does not select any.
+
+    >>> sorted(cmd_nodes('m3,3+5-7;udp send [::1]:1 8 500', []))
+    ['m3-3', 'm3-5', 'm3-6', 'm3-7']
+    >>> sorted(cmd_nodes('m3-57;ifconfig', []))
+    ['m3-57']
+    >>> sorted(cmd_nodes('udp send [::1]:1 8 500', ['m3-1', 'm3-2']))
+    ['m3-1', 'm3-2']
+    """
+    selection, sep, _ = cmd.partition(';')
+    if not sep or ' ' in selection:
+        return set(nodes)
+    if ',' not in selection:
+        return {selection}
+    archi, ids = selection.split(',', 1)
+    res = set()
+    for id_range in ids.split('+'):
+        first, _, last = id_range.partition('-')
+        res.update(f'{archi}-{i}'
+                   for i in range(int(first), int(last or first) + 1))
+    return res
+
+
+def node_selections(nodes):
+    """
+    Yields the selections of `nodes` in the node selection syntax of the
+    serial aggregator, one per architecture, so a command can be sent to all
+    of them at once (see `cmd_nodes()`).
+
+    >>> list(node_selections(['m3-7', 'm3-3', 'm3-5', 'm3-6']))
+    ['m3,3+5-7']
+    >>> list(node_selections(['m3-57']))
+    ['m3-57']
+    """
+    ids = collections.defaultdict(list)
+    for node in nodes:
+        archi, node_id = node.rsplit('-', 1)
+        ids[archi].append(int(node_id))
+    for archi, archi_ids in sorted(ids.items()):
+        if len(archi_ids) == 1:
+            yield f'{archi}-{archi_ids[0]}'
+            continue
+        ranges = []
+        for node_id in sorted(archi_ids):
+            if ranges and ranges[-1][1] == node_id - 1:
+                ranges[-1][1] = node_id
+            else:
+                ranges.append([node_id, node_id])
+        yield f'{archi},' + '+'.join(
+            str(first) if first == last else f'{first}-{last}'
+            for first, last in ranges
+        )
+
+
+class LogTail:
+    """
+    Reads the lines appended to the log `logname` after the tail was
+    created.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, logname):
+        self.logname = logname
+        self._partial = b''
+        try:
+            self._offset = os.path.getsize(logname)
+        except FileNotFoundError:
+            self._offset = 0
+
+    def lines(self):
+        """
+        Returns the complete lines appended since the last call.
+        """
+        try:
+            with open(self.logname, 'rb') as logfile:
+                logfile.seek(self._offset)
+                data = logfile.read()
+        except FileNotFoundError:
+            return []
+        self._offset += len(data)
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines[-1]
+        return [line.decode(errors='ignore') for line in lines[:-1]]
+
+
+class RunWatchdog(threading.Thread):
+    """
+    Watches the lines appended to the log `logname` of a run for the
+    `Sending N packets` line of every node in `sources` and a `recv` line of
+    `sink`. If any of them is still missing `grace` seconds after the
+    watchdog was started, the run is unhealthy, see `wait_unhealthy()`.
+    """
+    _SENDING_C = re.compile(r'^[^;]*;(?P<node>[^;]+);(> )?Sending \d+ packets')
+
+    def __init__(self, logname, sink, sources, grace, poll_interval=1):
+        # pylint: disable=too-many-arguments
+        super().__init__(daemon=True)
+        self.logname = logname
+        self.missing_sources = set(sources)
+        self.sink_received = False
+        self.grace = grace
+        self.failure = None
+        self._recv_c = re.compile(f'^[^;]*;{re.escape(sink)};(> )?recv;')
+        self._poll_interval = poll_interval
+        self._unhealthy = threading.Event()
+        self._finished = threading.Event()
+        # lines written before the run started, e.g. while constructing the
+        # routes, are not considered
+        self._tail = LogTail(logname)
+
+    @property
+    def healthy(self):
+        return not self.missing_sources and self.sink_received
+
+    def finish(self):
+        self._finished.set()
+        self.join()
+
+    def wait_unhealthy(self, timeout):
+        """
+        Waits at most `timeout` seconds for the run to be found unhealthy and
+        returns the reason, or `None` if it was not.
+        """
+        self._unhealthy.wait(timeout)
+        return self.failure
+
+    def _check_line(self, line):
+        match = self._SENDING_C.match(line)
+        if match is not None:
+            self.missing_sources.discard(match['node'])
+        elif self._recv_c.match(line) is not None:
+            self.sink_received = True
+
+    def _reason(self):
+        reasons = []
+        if self.missing_sources:
+            reasons.append(f'{", ".join(sorted(self.missing_sources))} did '
+                           'not start sending')
+        if not self.sink_received:
+            reasons.append('sink did not receive')
+        return f'{" and ".join(reasons)} within {self.grace}s'
+
+    def run(self):
+        deadline = time.monotonic() + self.grace
+        while True:
+            for line in self._tail.lines():
+                self._check_line(line)
+            if self.healthy:
+                logger.info('Run in %s is healthy', self.logname)
+                return
+            if time.monotonic() >= deadline:
+                self.failure = self._reason()
+                self._unhealthy.set()
+                return
+            if self._finished.wait(self._poll_interval):
+                return
+
+
+class CaptureCompressor:
+    """
+    Compresses the captures of finished runs with `codec` at `level` (default
+    level of the codec if `None`) in `jobs` background threads, so the next
+    run does not wait for the compression of the capture of the last one.
+    """
+    def __init__(self, codec=CAPTURE_CODEC, level=None,
+                 jobs=COMPRESSION_JOBS):
+        cmd, default_level = CAPTURE_CODECS[codec]
+        level = default_level if level is None else level
+        self.cmd = [arg.format(level=level) for arg in cmd]
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=jobs, thread_name_prefix='compress'
+        )
+        self._pending = {}
+        self.compressed = 0
+        self.failed = []
+
+    def _compress(self, filename):
+        start = time.monotonic()
+        subprocess.run(self.cmd + [filename], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        return time.monotonic() - start
+
+    def submit(self, filename):
+        self._pending[self._executor.submit(self._compress, filename)] = \
+            filename
+
+    def report(self, wait=False):
+        """
+        Logs the compressions that finished since the last report, after
+        waiting for all pending ones if `wait` is set.
+        """
+        if wait:
+            concurrent.futures.wait(self._pending)
+        for future in [f for f in self._pending if f.done()]:
+            filename = self._pending.pop(future)
+            exc = future.exception()
+            if exc is None:
+                self.compressed += 1
+                logger.info('Compressed %s in %.1fs', filename,
+                            future.result())
+                continue
+            if isinstance(exc, subprocess.CalledProcessError) and exc.stderr:
+                exc = exc.stderr.decode(errors='replace').strip()
+            logger.error('Failed to compress %s: %s', filename, exc)
+            self.failed.append(filename)
+        logger.info('%d captures compressed, %d failed, %d pending',
+                    self.compressed, len(self.failed), len(self._pending))
+
+    def shutdown(self):
+        self.report(wait=True)
+        self._executor.shutdown()
+
+
+class NodeMetadataCache:
+    """
+    Persistent cache of the metadata of nodes in the JSON file `filename`,
+    keyed by the URI of a node and the firmware it runs, so a node flashed
+    with the same firmware in another experiment does not need to be queried
+    again.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            with open(filename) as cache_file:
+                self._entries = json.load(cache_file)
+        except FileNotFoundError:
+            self._entries = {}
+
+    @staticmethod
+    def firmware_key(firmware):
+        return f'{firmware.board}/{firmware.application_name}'
+
+    def get(self, uri, firmware):
+        return self._entries.get(uri, {}).get(self.firmware_key(firmware))
+
+    def set(self, uri, firmware, metadata):
+        self._entries.setdefault(uri, {})[self.firmware_key(firmware)] = \
+            dict(metadata)
+
+    def save(self):
+        tmpname = f'{self.filename}.tmp'
+        with open(tmpname, 'w') as cache_file:
+            json.dump(self._entries, cache_file, indent=1, sort_keys=True)
+        os.replace(tmpname, self.filename)
+
+
 class Dispatcher(tmux_runner.TmuxExperimentDispatcher):
     # pylint: disable=unused-argument,no-self-use
+    def __init__(self, filename, api=None, health_grace=HEALTH_GRACE,
+                 max_requeues=MAX_REQUEUES, compressor=None,
+                 discovery_jobs=DISCOVERY_JOBS, sweep_batch=SWEEP_BATCH):
+        # pylint: disable=too-many-arguments
+        super().__init__(filename, api=api)
+        self.health_grace = health_grace
+        self.max_requeues = max_requeues
+        self.discovery_jobs = discovery_jobs
+        if compressor is None:
+            compressor = CaptureCompressor()
+        self.compressor = compressor
+        self._watchdog = None
+        self._last_env = None
+        self.sweep_batch = sweep_batch
+        self._checkpoint = sweep.Checkpoint(sweep.checkpoint_name(filename))
+
+    def target(self, exp, runner, ctx, *args, **kwargs):
+        # runs aborted as unhealthy are re-queued to the end of runner.runs,
+        # and the runs of a sweep are added in batches by post_experiment(),
+        # so they are conducted while the experiment is still running
+        self._last_env = None
+        if not runner.runs:
+            self._add_sweep_runs(runner)
+        while True:
+            # the firmware is only rebuilt on environment changes within one
+            # pass of super().target()
+            if runner.runs and self._last_env is not None and \
+               runner.runs[0].env != self._last_env:
+                runner.runs[0]['rebuild'] = True
+            super().target(exp, runner, ctx, *args, **kwargs)
+            if not runner.runs:
+                break
+
+    def _add_sweep_runs(self, runner):
+        """
+        Adds the next `sweep_batch` runs of the sweep of the experiment of
+        `runner`, if it has one, to its runs. The runs are stored in the
+        experiment descriptions before the checkpoint of the sweep advances,
+        so runs may be repeated but are never lost if the dispatcher stops in
+        between.
+        """
+        spec = runner.desc.get('sweep')
+        if spec is None:
+            return
+        start = self._checkpoint.position(spec)
+        added = 0
+        for _, run in itertools.islice(sweep.runs(spec, start),
+                                       self.sweep_batch):
+            runner.runs.append(NestedDescriptionBase(
+                run, enclosure=runner.desc, enclosure_keys=EXP_RUN_KEYS
+            ))
+            added += 1
+        if added:
+            logger.info('Added runs %d to %d of sweep', start + 1,
+                        start + added)
+            self.dump_experiment_descriptions()
+            self._checkpoint.advance(spec, start + added)
+
     def pre_experiment(self, runner, ctx, *args, **kwargs):
+        if 'route_rounds' in ctx:
+            # set up by an earlier pass of target() over the same experiment
+            return {}
         runner.nodes.save_edgelist(os.path.join(runner.results_dir,
                                                 f'{runner.nodes}.edgelist.gz'))
         nodes_filename = os.path.join(runner.results_dir, NODES_CSV_NAME)
         nodes = self.load_nodes_metadata(nodes_filename)
-        for i, node in enumerate(runner.nodes.network.nodes()):
+        discovered = self.discover_nodes_metadata(
+            runner, nodes,
+            NodeMetadataCache(os.path.join(runner.results_dir,
+                                           NODE_CACHE_NAME))
+        )
+        for node in runner.nodes.network.nodes():
             if node not in nodes:
-                nodes[node] = self.parse_node_metadata(runner, i, node)
+                nodes[node] = discovered[node]
             if node == runner.nodes.sink:
                 nodes['sink'] = {
                     'iface': nodes[node]['iface'],
@@ -62,13 +410,21 @@ class Dispatcher(tmux_runner.TmuxExperimentDispatcher):
                     'l2pdu': nodes[node]['l2pdu'],
                 }
         self.store_nodes_metadata(nodes_filename, nodes)
-        return {'nodes': nodes}
+        return {'nodes': nodes,
+                'route_rounds': self.route_rounds(runner, nodes)}
 
     def post_experiment(self, runner, ctx, *args, **kwargs):
+        if not runner.runs:
+            self._add_sweep_runs(runner)
         if not runner.runs:     # no more runs for the experiment
             runner.experiment.stop()
+            # the testbed is released, so nothing waits on the compression
+            self.compressor.report(wait=True)
+        else:
+            self.compressor.report()
 
     def pre_run(self, runner, run, ctx, *args, **kwargs):
+        self._last_env = run.env
         exp = runner.experiment
         self.set_ssh_agent_env(exp.tmux_session)
         run_log = os.path.join(
@@ -82,32 +438,121 @@ class Dispatcher(tmux_runner.TmuxExperimentDispatcher):
         logname = ctx['logname']
         exp.cmd(f'cd {SCRIPT_PATH}', wait_after=.2)
         with exp.serial_aggregator(exp.nodes.site, logname=logname):
-            self.construct_routes(runner, run, ctx['nodes'])
+            self.construct_routes(runner, run, ctx)
             exp.cmd('nib route', wait_after=.2)
             exp.cmd('ifconfig', wait_after=.2)
             exp.cmd(f'{exp.nodes.sink};udp server start {SINK_PORT}',
                     wait_after=.2)
+        self._start_watchdog(runner, run, logname)
         return {'sink_port': SINK_PORT, 'sniffer': sniffer, 'logname': logname,
-                'pcap_file_name': pcap_file_name}
+                'pcap_file_name': pcap_file_name, 'unhealthy': None}
+
+    def _start_watchdog(self, runner, run, logname):
+        self._watchdog = None
+        if not self.health_grace:
+            return
+        sink = runner.nodes.sink
+        sources = set()
+        for cmd in runner.get_tmux_cmds(run):
+            if 'udp send' in cmd:
+                sources.update(cmd_nodes(cmd, runner.nodes.network.nodes()))
+        sources.discard(sink)
+        self._watchdog = RunWatchdog(logname, sink, sources,
+                                     self.health_grace)
+        self._watchdog.start()
+
+    def _wait_for_run(self, runner, run, ctx, wait):
+        """
+        Waits `wait` seconds for the run to finish, or until the watchdog
+        found it unhealthy.
+        """
+        if self._watchdog is None:
+            time.sleep(wait)
+            return
+        reason = self._watchdog.wait_unhealthy(wait)
+        if reason is not None:
+            logger.warning('Aborting run %s: %s', runner.run_name(run),
+                           reason)
+            ctx['unhealthy'] = reason
+
+    def run(self, runner, run, ctx, *args, **kwargs):
+        try:
+            if run.get('wait') is None or not runner.get_tmux_cmds(run):
+                # tmux_runner reports the missing wait or runs without
+                # commands
+                super().run(runner, run, ctx, *args, **kwargs)
+                return
+            # as tmux_runner.TmuxExperimentDispatcher.run(), but the wait for
+            # the run is cut short by the watchdog
+            exp = runner.experiment
+            run_name = runner.run_name(run)
+            logname = ctx['logname']
+            exp.cmd(f'echo "Starting run {run_name}" >> {logname}')
+            with exp.serial_aggregator(exp.nodes.site, logname=logname):
+                for cmd in runner.get_tmux_cmds(run):
+                    exp.cmd(cmd.format(runner=runner, run=run, ctx=ctx,
+                                       run_args=run.get('args'), **kwargs),
+                            wait_after=.1)
+                until = time.asctime(time.localtime(time.time() +
+                                                    run['wait']))
+                logger.info('Waiting for %ss for run %s (until %s) to '
+                            'finish', run['wait'], run_name, until)
+                self._wait_for_run(runner, run, ctx, run['wait'])
+        finally:
+            if self._watchdog is not None:
+                self._watchdog.finish()
+
+    @staticmethod
+    def _mark_aborted(filename):
+        """
+        Renames the file `filename` of an aborted run, so it is not taken for
+        the results of a run, e.g. `foo.log` to `foo.aborted.log`, and returns
+        the new name.
+        """
+        dirname, basename = os.path.split(filename)
+        name, sep, ext = basename.partition('.')
+        aborted = os.path.join(dirname, f'{name}.aborted{sep}{ext}')
+        if os.path.exists(filename):
+            os.replace(filename, aborted)
+        return aborted
+
+    def _requeue(self, runner, run, reason):
+        requeues = run.get('requeues', 0)
+        if requeues >= self.max_requeues:
+            logger.error('Not re-queuing run %s after %d re-queues: %s',
+                         runner.run_name(run), requeues, reason)
+            return
+        requeued = copy.copy(run)
+        # idx and name of the re-queued run are set when it is conducted
+        requeued.pop('idx', None)
+        requeued.pop('__timestamp__', None)
+        requeued['requeues'] = requeues + 1
+        runner.runs.append(requeued)
+        logger.info('Re-queued run %s', runner.run_name(run))
 
     def post_run(self, runner, run, ctx, *args, **kwargs):
         exp = runner.experiment
         logname = ctx['logname']
-        with exp.serial_aggregator(exp.nodes.site, logname=logname):
-            exp.cmd('ifconfig', wait_after=3)
-            if run.env['MODE'] == 'e2e':
-                exp.cmd('ip6_frag', wait_after=60)
-            else:
-                exp.cmd('6lo_frag', wait_after=60)
-            exp.cmd('pktbuf', wait_after=3)
+        if not ctx.get('unhealthy'):
+            with exp.serial_aggregator(exp.nodes.site, logname=logname):
+                exp.cmd('ifconfig', wait_after=3)
+                if run.env['MODE'] == 'e2e':
+                    exp.cmd('ip6_frag', wait_after=60)
+                else:
+                    exp.cmd('6lo_frag', wait_after=60)
+                exp.cmd('pktbuf', wait_after=3)
         for _ in range(3):
             ctx['sniffer'].send_keys('C-c', suppress_history=False)
         ctx['sniffer'].send_keys(
             f'ssh lenders@{runner.nodes.site}.{IOTLAB_DOMAIN} '
             f'pkill -f sniffer_aggregator', enter=True, suppress_history=False
         )
-        subprocess.run(['gzip', '-v', '-9', ctx['pcap_file_name']],
-                       check=False)
+        pcap_file_name = ctx['pcap_file_name']
+        if ctx.get('unhealthy'):
+            self._mark_aborted(logname)
+            pcap_file_name = self._mark_aborted(pcap_file_name)
+            self._requeue(runner, run, ctx['unhealthy'])
+        self.compressor.submit(pcap_file_name)
         # set TMUX session to 0 to reinitialize it in case `run` window closes
         exp.tmux_session = None
 
@@ -139,6 +584,47 @@ class Dispatcher(tmux_runner.TmuxExperimentDispatcher):
                 row['name'] = node
                 nodes_csv.writerow(row)
 
+    def discover_nodes_metadata(self, runner, nodes, cache):
+        """
+        Returns the metadata of the nodes of the network missing in `nodes`.
+        It is taken from `cache` if known for the firmware of a node, the
+        other nodes are queried in parallel by `discovery_jobs` threads and
+        added to `cache`.
+        """
+        res = {}
+        missing = {}
+        for i, node in enumerate(runner.nodes.network.nodes()):
+            if node in nodes:
+                continue
+            firmware = runner.experiment.firmwares[i]
+            uri = runner.nodes[node].uri
+            metadata = cache.get(uri, firmware)
+            if metadata is None:
+                missing[node] = (i, uri, firmware)
+            else:
+                res[node] = metadata
+        if not missing:
+            return res
+        logger.info('Querying metadata of %d nodes (%d cached)',
+                    len(missing), len(res))
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.discovery_jobs
+            ) as pool:
+                futures = {
+                    pool.submit(self.parse_node_metadata, runner, i, node):
+                    node for node, (i, _, _) in missing.items()
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    node = futures[future]
+                    res[node] = future.result()
+                    logger.info('Metadata of %s: %s', node, res[node])
+                    _, uri, firmware = missing[node]
+                    cache.set(uri, firmware, res[node])
+        finally:
+            cache.save()
+        return res
+
     @staticmethod
     def parse_node_metadata(runner, i, node):
         firmware = runner.experiment.firmwares[i]
@@ -151,7 +637,6 @@ class Dispatcher(tmux_runner.TmuxExperimentDispatcher):
         ctrl.TERM_STARTED_DELAY = .1
         shell = riotctrl_shell.netif.Ifconfig(ctrl)
         with ctrl.run_term(reset=False):
-            ctrl.term.logfile = sys.stdout
             netifs = riotctrl_shell.netif.IfconfigListParser().parse(
                 shell.ifconfig_list()
             )
@@ -196,30 +681,36 @@ class Dispatcher(tmux_runner.TmuxExperimentDispatcher):
         return sniffer, pcap_file_name
 
     @staticmethod
-    def _set_e2e_mtu(exp, run, node, iface, l2pdu):
-        if run.env['MODE'] == 'e2e':
-            mtu = l2pdu
-            # UDP header compression: length field (2 byte) elided but 1 byte
-            # for NHC dispatch => 1 bytes less than normal UDP header
-            comp = 1
-            # No compression advantage for fragmentation header
-            # IPv6 header compression: version, traffic class, flowlabel elided
-            # (4 bytes); next header elided due to NHC (1 byte); no CID as
-            # context is 0; 64-bit prefix elided by stateful compression
-            # (16 byte) >= 21 bytes less than normal IPv6 header
-            comp += 21
-            mtu += comp
-            exp.cmd(f'{node};ifconfig {iface} set mtu {mtu}',
-                    wait_after=.1)
-
-    def construct_routes(self, runner, run, nodes_metadata):
+    def _e2e_mtu(run, l2pdu):
+        if run.env['MODE'] != 'e2e':
+            return None
+        mtu = l2pdu
+        # UDP header compression: length field (2 byte) elided but 1 byte
+        # for NHC dispatch => 1 bytes less than normal UDP header
+        comp = 1
+        # No compression advantage for fragmentation header
+        # IPv6 header compression: version, traffic class, flowlabel elided
+        # (4 bytes); next header elided due to NHC (1 byte); no CID as
+        # context is 0; 64-bit prefix elided by stateful compression
+        # (16 byte) >= 21 bytes less than normal IPv6 header
+        comp += 21
+        return mtu + comp
+
+    @staticmethod
+    def route_rounds(runner, nodes_metadata):
         """
-        Constructs network using depth-first search
+        Returns the commands that configure the global addresses,
+        compression contexts and default routes of the network, constructed
+        using depth-first search from the sink, in rounds. Each round maps a
+        command to the nodes it is sent to, and sends at most one command to
+        each node.
         """
         stack = []
         stack.append(runner.nodes.sink)
         visited = set()
-        exp = runner.experiment
+        addrs = {}
+        # default routes of each node in the order they are added
+        routes = collections.defaultdict(list)
         while stack:
             node = stack.pop()
             if node not in visited:
@@ -227,23 +718,78 @@ class Dispatcher(tmux_runner.TmuxExperimentDispatcher):
                 ll_addr = nodes_metadata[node]['addr']
                 glb_addr = ll_addr.replace('fe80::', PREFIX)
                 # add global unicast address to interface
-                exp.cmd(f'{node};ifconfig {iface} add {glb_addr}',
-                        wait_after=.1)
-                self._set_e2e_mtu(exp, run, node, iface,
-                                  nodes_metadata[node]['l2pdu'])
-                # set compression context for global unicast address prefix
-                ltime = 0xffff
-                exp.cmd(f'{node};6ctx add 0 {PREFIX}/64 {ltime}',
-                        wait_after=.1)
-                for neigh in exp.nodes.neighbors(node):
+                addrs[f'ifconfig {iface} add {glb_addr}'] = [node]
+                for neigh in runner.nodes.neighbors(node):
                     # setting default route from neighbors to node
                     if neigh not in visited:
                         neigh_iface = nodes_metadata[neigh]['iface']
-                        exp.cmd(f'{neigh};nib route add {neigh_iface} '
-                                f'default {ll_addr}', wait_after=.3)
+                        routes[neigh].append(
+                            f'nib route add {neigh_iface} default {ll_addr}'
+                        )
                     stack.append(neigh)
                 visited.add(node)
+        # set compression context for global unicast address prefix
+        ltime = 0xffff
+        rounds = [addrs, {f'6ctx add 0 {PREFIX}/64 {ltime}': sorted(visited)}]
+        for i in range(max((len(cmds) for cmds in routes.values()),
+                           default=0)):
+            route_round = collections.defaultdict(list)
+            for node, cmds in sorted(routes.items()):
+                if i < len(cmds):
+                    route_round[cmds[i]].append(node)
+            rounds.append(dict(route_round))
+        return rounds
+
+    def _mtu_round(self, run, nodes, nodes_metadata):
+        mtu_round = collections.defaultdict(list)
+        for node in nodes:
+            mtu = self._e2e_mtu(run, nodes_metadata[node]['l2pdu'])
+            if mtu is not None:
+                iface = nodes_metadata[node]['iface']
+                mtu_round[f'ifconfig {iface} set mtu {mtu}'].append(node)
+        return dict(mtu_round)
+
+    @staticmethod
+    def _send_round(exp, cmds, tail, timeout=ECHO_TIMEOUT):
+        """
+        Sends each command in `cmds` to its nodes at once and waits until all
+        of them echoed it to the log followed by `tail`.
+        """
+        pending = set()
+        for cmd, nodes in cmds.items():
+            for selection in node_selections(nodes):
+                exp.cmd(f'{selection};{cmd}')
+            pending.update((node, cmd) for node in nodes)
+        deadline = time.monotonic() + timeout
+        while pending:
+            for line in tail.lines():
+                fields = line.rstrip().split(';', 2)
+                if len(fields) == 3:
+                    pending.discard((fields[1], fields[2].lstrip('> ')))
+            if not pending:
+                break
+            if time.monotonic() >= deadline:
+                logger.warning('%s did not echo within %ss: %s',
+                               ', '.join(sorted({n for n, _ in pending})),
+                               timeout,
+                               '; '.join(sorted({c for _, c in pending})))
+                break
+            time.sleep(.05)
 
+    def construct_routes(self, runner, run, ctx):
+        """
+        Constructs network from the precomputed `route_rounds()`, sending
+        each round as batched multi-node commands
+        """
+        exp = runner.experiment
+        tail = LogTail(ctx['logname'])
+        rounds = list(ctx['route_rounds'])
+        mtu_round = self._mtu_round(run, runner.nodes.network.nodes(),
+                                    ctx['nodes'])
+        if mtu_round:
+            rounds.insert(1, mtu_round)
+        for cmds in rounds:
+            self._send_round(exp, cmds, tail)
 
 def main():
     parser = argparse.ArgumentParser()
@@ -252,12 +798,52 @@ def main():
                         help="Experiment descriptions file")
     parser.add_argument('-v', '--verbosity', default='INFO',
                         help='Verbosity as log level')
+    parser.add_argument('-g', '--health-grace', type=float,
+                        default=HEALTH_GRACE,
+                        help='Seconds after which a run is aborted and '
+                             're-queued if a source did not start sending '
+                             'or the sink did not receive anything, 0 to '
+                             f'disable (default: {HEALTH_GRACE})')
+    parser.add_argument('-r', '--max-requeues', type=int,
+                        default=MAX_REQUEUES,
+                        help='Maximum number of times an aborted run is '
+                             f're-queued (default: {MAX_REQUEUES})')
+    parser.add_argument('-c', '--capture-codec', default=CAPTURE_CODEC,
+                        choices=sorted(CAPTURE_CODECS),
+                        help='Codec to compress the captures of the runs '
+                             f'with (default: {CAPTURE_CODEC})')
+    parser.add_argument('-l', '--capture-level', type=int, default=None,
+                        help='Compression level of the captures (default: '
+                             + ', '.join(f'{level} for {codec}' for codec,
+                                         (_, level) in CAPTURE_CODECS.items())
+                             + ')')
+    parser.add_argument('-J', '--compression-jobs', type=int,
+                        default=COMPRESSION_JOBS,
+                        help='Number of captures compressed in parallel in '
+                             f'the background (default: {COMPRESSION_JOBS})')
+    parser.add_argument('-d', '--discovery-jobs', type=int,
+                        default=DISCOVERY_JOBS,
+                        help='Number of nodes queried for their metadata in '
+                             f'parallel (default: {DISCOVERY_JOBS})')
+    parser.add_argument('-b', '--sweep-batch', type=int, default=SWEEP_BATCH,
+                        help='Number of runs of a sweep added to an '
+                             'experiment at a time (default: '
+                             f'{SWEEP_BATCH})')
     args = parser.parse_args()
     coloredlogs.install(level=getattr(logging, args.verbosity),
                         milliseconds=True)
     logger.debug('Running %s', args.descs)
-    dispatcher = Dispatcher(args.descs)
-    dispatcher.load_experiment_descriptions()
+    compressor = CaptureCompressor(args.capture_codec, args.capture_level,
+                                   args.compression_jobs)
+    dispatcher = Dispatcher(args.descs, health_grace=args.health_grace,
+                            max_requeues=args.max_requeues,
+                            compressor=compressor,
+                            discovery_jobs=args.discovery_jobs,
+                            sweep_batch=args.sweep_batch)
+    try:
+        dispatcher.load_experiment_descriptions()
+    finally:
+        compressor.shutdown()
 
 
 if __name__ == '__main__':
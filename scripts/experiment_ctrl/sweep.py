@@ -0,0 +1,219 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+
+import hashlib
+import itertools
+import json
+import os
+import re
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+
+_PLACEHOLDER_C = re.compile(r'^\$(?P<axis>\w+)(\[(?P<idx>\d+)\])?$')
+
+
+def _matches(cond, point):
+    for axis, values in cond.items():
+        if not isinstance(values, list):
+            values = [values]
+        if point[axis] not in values:
+            return False
+    return True
+
+
+def _applies(obj, point):
+    """
+    Returns whether the `when` condition of `obj` holds for `point` and its
+    `unless` condition does not. Each condition maps axes to a value or a
+    list of values.
+
+    >>> _applies({'when': {'mode': ['sfr', 'ff']}}, {'mode': 'sfr'})
+    True
+    >>> _applies({'unless': {'mode': 'hwr'}}, {'mode': 'hwr'})
+    False
+    """
+    if 'when' in obj and not _matches(obj['when'], point):
+        return False
+    if 'unless' in obj and _matches(obj['unless'], point):
+        return False
+    return True
+
+
+def _values(axis):
+    if 'range' in axis:
+        return range(*axis['range'])
+    return axis['values']
+
+
+def points(spec):
+    """
+    Yields the points of the sweep `spec` as dictionaries of axis values.
+    The first of the `axes` varies slowest, and the whole sweep is repeated
+    `repeat` times. An axis with a `when` or `unless` condition (see
+    `_applies()`) on the preceding axes only takes its first value where it
+    does not apply.
+
+    >>> spec = {'axes': [{'name': 'mode', 'values': ['ff', 'sfr']},
+    ...                  {'name': 'win', 'values': [1, 5],
+    ...                   'when': {'mode': 'sfr'}},
+    ...                  {'name': 'len', 'range': [16, 33, 16]}]}
+    >>> [(p['mode'], p['win'], p['len']) for p in points(spec)]
+    ... # doctest: +NORMALIZE_WHITESPACE
+    [('ff', 1, 16), ('ff', 1, 32), ('sfr', 1, 16), ('sfr', 1, 32),
+     ('sfr', 5, 16), ('sfr', 5, 32)]
+    """
+    axes = spec['axes']
+
+    def expand(point, i):
+        if i == len(axes):
+            yield dict(point)
+            return
+        values = _values(axes[i])
+        if not _applies(axes[i], point):
+            values = values[:1]
+        for value in values:
+            point[axes[i]['name']] = value
+            yield from expand(point, i + 1)
+
+    for _ in range(spec.get('repeat', 1)):
+        yield from expand({}, 0)
+
+
+def count(spec):
+    """
+    Returns the number of runs of the sweep `spec`.
+    """
+    return sum(1 for _ in points(spec))
+
+
+def _render(template, point):
+    if isinstance(template, dict):
+        return {key: _render(value, point) for key, value in template.items()}
+    if isinstance(template, list):
+        return [_render(value, point) for value in template]
+    if isinstance(template, str):
+        match = _PLACEHOLDER_C.match(template)
+        if match is not None and match['axis'] in point:
+            value = point[match['axis']]
+            if match['idx'] is not None:
+                value = value[int(match['idx'])]
+            return value
+    return template
+
+
+def _merge(base, update):
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+
+
+def make_run(spec, point):
+    """
+    Returns the run description for `point` of the sweep `spec`: its `run`
+    template, updated by the `run` of each of its `variants` that applies to
+    the point (see `_applies()`). The strings `$<axis>` and `$<axis>[<i>]` in
+    the templates are replaced by the value (or its i-th element) of the axis
+    at the point.
+
+    >>> spec = {'run': {'env': {'MODE': '$mode'}, 'args': {'len': '$len'}},
+    ...         'variants': [{'when': {'mode': 'sfr'},
+    ...                       'run': {'env': {'WIN': '$win[0]'}}}]}
+    >>> make_run(spec, {'mode': 'sfr', 'win': [5, 1], 'len': 16})
+    {'env': {'MODE': 'sfr', 'WIN': 5}, 'args': {'len': 16}}
+    """
+    run = _render(spec.get('run', {}), point)
+    for variant in spec.get('variants', []):
+        if _applies(variant, point):
+            _merge(run, _render(variant['run'], point))
+    return run
+
+
+def runs(spec, start=0):
+    """
+    Yields the index and the run description of each point of the sweep
+    `spec`, starting with the point at index `start`, as they are needed. The
+    first run is marked to rebuild the firmware if the spec sets
+    `rebuild_first`.
+    """
+    for idx, point in enumerate(itertools.islice(points(spec), start, None),
+                                start):
+        run = make_run(spec, point)
+        if idx == 0 and spec.get('rebuild_first'):
+            run['rebuild'] = True
+        yield idx, run
+
+
+def digest(spec):
+    """
+    Returns a short hash identifying the sweep `spec`, so a changed spec
+    starts over.
+    """
+    return hashlib.sha256(
+        json.dumps(spec, sort_keys=True, default=str).encode()
+    ).hexdigest()[:16]
+
+
+def checkpoint_name(descs_filename):
+    """
+    >>> checkpoint_name('descs.yaml')
+    'descs.checkpoint.json'
+    """
+    return f'{os.path.splitext(descs_filename)[0]}{CHECKPOINT_SUFFIX}'
+
+
+def discard_checkpoint(descs_filename):
+    """
+    Removes the checkpoint of the descs in `descs_filename`, as new descs
+    start all of their sweeps over, even sweeps with the same specification.
+    """
+    try:
+        os.remove(checkpoint_name(descs_filename))
+    except FileNotFoundError:
+        pass
+
+
+class Checkpoint:
+    """
+    Keeps the index of the first point of each sweep that was not handed out
+    as a run yet in the JSON file `filename`, so a partially completed sweep
+    resumes from where it stopped. A sweep is identified by the digest of its
+    specification only, so the checkpoint needs to be discarded with
+    `discard_checkpoint()` when the descs are written anew.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            with open(filename) as checkpoint_file:
+                self._positions = json.load(checkpoint_file)
+        except FileNotFoundError:
+            self._positions = {}
+
+    def position(self, spec):
+        return self._positions.get(digest(spec), 0)
+
+    def advance(self, spec, position):
+        self._positions[digest(spec)] = position
+        tmpname = f'{self.filename}.tmp'
+        with open(tmpname, 'w') as checkpoint_file:
+            json.dump(self._positions, checkpoint_file, indent=1,
+                      sort_keys=True)
+        os.replace(tmpname, self.filename)
+
+
+def expanded(spec):
+    """
+    Returns the runs of the sweep `spec` as a list.
+    """
+    return [run for _, run in runs(spec)]
@@ -0,0 +1,177 @@
+#! /usr/bin/env python3
+
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+# pylint: disable=missing-function-docstring
+
+import argparse
+import contextlib
+import csv
+import functools
+import logging
+import os
+import re
+import sys
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
+DATA_PATH = os.environ.get('DATA_PATH',
+                           os.path.join(SCRIPT_PATH, '..', '..', 'results'))
+
+sys.path.append(os.path.join(SCRIPT_PATH, '..'))
+
+# pylint: disable=wrong-import-position
+from results_common import (  # noqa: E402
+    columnar, files, manifest, node_index, pcap, pool
+)
+
+# increment when the output of capture_to_csvs() changes, so existing
+# CSVs are converted again
+PARSER_VERSION = 2
+CAPTURE_NAME_C = re.compile(r'.*\.pcap(\.gz|\.xz|\.zst)?$')
+FRAMES_FIELDNAMES = ['time', 'sniffer', 'src', 'dst', 'seq', 'kind', 'tag',
+                     'size', 'offset', 'frame_len', 'retrans']
+
+
+class CaptureError(Exception):
+    pass
+
+
+def output_names(capture):
+    """
+    Returns the names of the frames, hops, and airtime CSVs of `capture`.
+
+    >>> output_names('test.pcap.gz')
+    ('test.frames.csv', 'test.hops.csv', 'test.airtime.csv')
+    """
+    prefix = re.sub(r'\.pcap$', '', files.uncompressed_name(capture))
+    return tuple(f'{prefix}.{table}.csv'
+                 for table in ('frames', 'hops', 'airtime'))
+
+
+def _node_names(data_path):
+    try:
+        index = node_index.load(data_path)
+    except FileNotFoundError:
+        return None
+
+    def name(addr):
+        # short addresses are the last two bytes of the IPv6 address
+        return index.get(int(addr[-4:], 16)) if addr else None
+    return name
+
+
+def _writer(stack, csvname, fieldnames, npz):
+    csvfile = stack.enter_context(files.atomic_open(csvname))
+    writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';',
+                            extrasaction='ignore')
+    writer.writeheader()
+    if npz:
+        writer = stack.enter_context(columnar.also_npz(
+            writer, csvfile, columnar.npz_name(csvname)
+        ))
+    return writer
+
+
+def capture_to_csvs(capture, data_path=DATA_PATH, npz=False,
+                    chunk_size=pcap.CHUNK_SIZE, read_hash=None):
+    """
+    Decodes the frames of `capture` chunk by chunk of `chunk_size` frames,
+    streams them to its frames CSV, and writes the frames, airtime, and
+    fragment forwarding delay per node to its hops CSV and the frames and
+    airtime per second to its airtime CSV. Returns the names of the written
+    files.
+    """
+    frames_csv, hops_csv, airtime_csv = output_names(capture)
+    outputs = [frames_csv, hops_csv, airtime_csv]
+    if npz:
+        outputs += [columnar.npz_name(output) for output in outputs]
+    stats = pcap.HopStats()
+    with contextlib.ExitStack() as stack:
+        frames = _writer(stack, frames_csv, FRAMES_FIELDNAMES, npz)
+        with files.open_log(capture, read_hash=read_hash) as capture_file:
+            for chunk in pcap.frame_chunks(capture_file, chunk_size):
+                for frame in chunk:
+                    frames.writerow(frame)
+                stats.update(chunk)
+        hops = _writer(stack, hops_csv, pcap.HopStats.NODE_FIELDNAMES, npz)
+        for row in stats.node_rows(_node_names(data_path)):
+            hops.writerow(row)
+        airtime = _writer(stack, airtime_csv,
+                          pcap.HopStats.AIRTIME_FIELDNAMES, npz)
+        for row in stats.airtime_rows():
+            airtime.writerow(row)
+    return outputs
+
+
+def captures_to_csvs(data_path=DATA_PATH, jobs=None, npz=False):
+    """
+    Converts all captures in `data_path` that changed since they were last
+    converted.
+    """
+    conversions = manifest.Manifest(data_path, 'captures', PARSER_VERSION)
+    tasks = []
+    for capture in os.listdir(data_path):
+        # captures of aborted runs are no results
+        if not CAPTURE_NAME_C.match(capture) or '.aborted.' in capture:
+            continue
+        capture = os.path.join(data_path, capture)
+        required = []
+        if npz:
+            required = [columnar.npz_name(output)
+                        for output in output_names(capture)]
+        if conversions.is_current(capture, required=required):
+            continue
+        tasks.append((capture, {'data_path': data_path, 'npz': npz}))
+    try:
+        errors = pool.run(
+            functools.partial(manifest.fingerprinted, capture_to_csvs),
+            tasks, jobs, on_success=conversions.record
+        )
+    finally:
+        conversions.save()
+    if errors:
+        raise CaptureError(f'{len(errors)} of {len(tasks)} captures failed '
+                           f'to convert: {", ".join(sorted(errors))}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--verbosity', default='INFO')
+    parser.add_argument('-j', '--jobs', type=int, default=pool.default_jobs(),
+                        help='Number of captures to convert in parallel '
+                             '(default: number of CPUs)')
+    parser.add_argument('-n', '--npz', action='store_true',
+                        help='Also write the CSVs as compressed NumPy .npz '
+                             'files with typed columns')
+    parser.add_argument('captures', nargs='*',
+                        help='Only convert these captures, regardless of '
+                             'whether they changed (default: all changed '
+                             'captures in DATA_PATH)')
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.verbosity))
+    if args.captures:
+        # node names are taken from the nodes.csv next to each capture
+        errors = pool.run(capture_to_csvs, [
+            (capture, {'data_path': os.path.dirname(os.path.abspath(capture)),
+                       'npz': args.npz})
+            for capture in args.captures
+        ], args.jobs)
+        if errors:
+            raise CaptureError(f'{len(errors)} of {len(args.captures)} '
+                               'captures failed to convert')
+    else:
+        captures_to_csvs(jobs=args.jobs, npz=args.npz)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,17 +11,15 @@
 # pylint: disable=missing-function-docstring
 
 import argparse
+import contextlib
 import csv
 import datetime
+import functools
 import ipaddress
 import logging
 import re
 import os
-import multiprocessing
-import random
-import threading
-
-import networkx as nx
+import sys
 
 __author__ = 'Martine S. Lenders'
 __copyright__ = 'Copyright 2021 Freie Universität Berlin'
@@ -32,6 +30,18 @@ SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
 DATA_PATH = os.environ.get('DATA_PATH',
                            os.path.join(SCRIPT_PATH, '..', '..', 'results'))
 
+sys.path.append(os.path.join(SCRIPT_PATH, '..'))
+
+# pylint: disable=wrong-import-position
+from results_common import (  # noqa: E402
+    columnar, files, follow, logreader, manifest, node_index, pool,
+    topology, transactions, window
+)
+
+# increment when the output of LogParser.log_to_csvs() changes, so existing
+# CSVs are converted again
+PARSER_VERSION = 3
+
 
 class LogError(Exception):
     pass
@@ -41,6 +51,9 @@ class LogParser:
     # pylint: disable=too-many-instance-attributes
     GLOBAL_PREFIX = ipaddress.IPv6Network('2001:db8:1::/64')
     LINK_LOCAL_PREFIX_STR = 'fe80::'
+    # packets kept while more than one candidate network is left, see
+    # _write_times_row()
+    MAX_UNRESOLVED_TIMES = 10000
     LOGNAME_PATTERN = r'sfr-cc-(?P<mode>sfr|hwr)-' \
                       r'((?P<dg_retries>\d+)-' \
                       r'(?P<congure_impl>congure_[^-]+)-' \
@@ -71,14 +84,64 @@ class LogParser:
     LOG_DGS_COMP_PATTERN = r'(?P<node>m3-\d+);dgs complete: ' \
                            r'(?P<dgs_comp>\d+)'
     _LOG_NAME_C = re.compile(f'{LOGNAME_PATTERN}.log')
+    _LOG_EXP_STARTED_C = re.compile(LOG_EXP_STARTED_PATTERN)
+    _LOG_DATA_C = re.compile(LOG_DATA_PATTERN)
+    _LOG_CONG_C = re.compile(LOG_CONG_PATTERN)
+    _LOG_PKTBUF_SIZE_C = re.compile(LOG_PKTBUF_SIZE_PATTERN)
+    _LOG_PKTBUF_USAGE_C = re.compile(LOG_PKTBUF_USAGE_PATTERN)
+    _LOG_RB_C = re.compile(LOG_RB_PATTERN)
+    _LOG_VRB_C = re.compile(LOG_VRB_PATTERN)
+    _LOG_FRAGS_COMP_C = re.compile(LOG_FRAGS_COMP_PATTERN)
+    _LOG_DGS_COMP_C = re.compile(LOG_DGS_COMP_PATTERN)
+    # bytes patterns for the memory-mapped logs, see _scan_mapped_log().
+    # _LOG_FIELDS_BC matches a whole line and finds its node field and the
+    # first word after it like _add_log_node() and _line_kind()
+    _LOG_FIELDS_BC = logreader.compile_lines(
+        rb'[^;\n]*;(?P<node>[^;\n]*)(;[> ]*(?P<word>[^ ;\n]*))?[^\n]*\n?'
+    )
+    _LOG_EXP_STARTED_BC = re.compile(LOG_EXP_STARTED_PATTERN.encode())
+    _LOG_DATA_BC = logreader.compile_lines(LOG_DATA_PATTERN)
+    _LOG_CONG_BC = logreader.compile_lines(LOG_CONG_PATTERN)
+    # parsing method for each line kind as returned by _line_kind()
+    _LINE_PARSERS = {
+        'send': '_parse_times_line',
+        'recv': '_parse_times_line',
+        'c': '_parse_cong_line',
+        'e': '_parse_cong_line',
+        'packet': '_parse_pktbuf_size',
+        'position': '_parse_pktbuf_usage',
+        'rbuf': '_parse_rb_full',
+        'VRB': '_parse_vrb_full',
+        'frags': '_parse_frags_comp',
+        'dgs': '_parse_dgs_comp',
+    }
 
     def __init__(self, logname, networks=None, mode=None, dg_retries=None,
                  congure_impl=None, ecn_frac=None, count=None, data_len=None,
-                 exp_id=None, timestamp=None, delay=None, data_path=DATA_PATH):
-        # pylint: disable=too-many-arguments
+                 exp_id=None, timestamp=None, delay=None, data_path=DATA_PATH,
+                 reorder_window=None, npz=False, mmap=False):
+        # pylint: disable=too-many-arguments,too-many-locals
         self.data_path = data_path
         self._logname = logname
-        self._init_network(networks)
+        self._networks = networks
+        # network and graph are only known after the log was parsed or, with
+        # a reorder_window, once only one candidate network is left, see
+        # _resolve_network() and _narrow_networks()
+        self.network = None
+        self._graph = None
+        self._sink_tree = None
+        self._candidates = None
+        self._log_nodes = set()
+        # with a reorder_window, packets and congestion events are written
+        # while parsing, otherwise after parsing
+        self.reorder_window = reorder_window
+        # also write the CSVs as .npz files, see results_common.columnar
+        self.npz = npz
+        # match the lines of the memory-mapped log as bytes, see
+        # _scan_mapped_log()
+        self.mmap = mmap
+        # follow the log while it grows, see enable_follow()
+        self._following = False
         self.mode = mode
         if congure_impl:
             self.congure_impl = congure_impl
@@ -99,60 +162,140 @@ class LogParser:
             self.timestamp = None
         self._experiment_started = False
         self._nodes_info = None
-        self._times = {}
-        if self._graph is None:
-            self._stats = {}
-            self._congs = {}
-            self._first_cong = {}
-        else:
-            self._stats = {n: {'node': n} for n in self._graph.nodes}
-            self._congs = {n: [] for n in self._graph.nodes}
-            self._first_cong = {n: None for n in self._graph.nodes}
-        self._c_started = re.compile(self.LOG_EXP_STARTED_PATTERN)
-        self._c_data = re.compile(self.LOG_DATA_PATTERN)
-        self._c_cong = re.compile(self.LOG_CONG_PATTERN)
-        self._c_pktbuf_size = re.compile(self.LOG_PKTBUF_SIZE_PATTERN)
-        self._c_pktbuf_usage = re.compile(self.LOG_PKTBUF_USAGE_PATTERN)
-        self._c_rb_full = re.compile(self.LOG_RB_PATTERN)
-        self._c_vrb_full = re.compile(self.LOG_VRB_PATTERN)
-        self._c_frags_comp = re.compile(self.LOG_FRAGS_COMP_PATTERN)
-        self._c_dgs_comp = re.compile(self.LOG_DGS_COMP_PATTERN)
-
-    def _get_nodes_from_log(self):
-        nodes = set()
-        with open(self.logname) as logfile:
-            csvfile = csv.reader(logfile, delimiter=';')
-            try:
-                for row in csvfile:
-                    if len(row) < 2:
-                        continue
-                    nodes.add(row[1])
-            except csv.Error as exc:
-                logging.error("Error parsing %s:%d: %s", self.logname,
-                              csvfile.line_num, exc)
-                raise
-        return nodes
-
-    def _init_network(self, networks):
-        self._graph = None
-        for network in networks:
-            nodes = self._get_nodes_from_log()
-            network_edgelist = os.path.join(
-                self.data_path,
-                "{}.edgelist.gz".format(network)
-            )
-            assert os.path.exists(network_edgelist)
-            graph = nx.read_edgelist(
-                network_edgelist,
-                data=[("weight", float)],
-            )
-            if all(node in graph.nodes() for node in nodes):
-                self.network = network
-                self._graph = graph
-                break
-        if self._graph is None:
-            logging.error("No network found for %s in %s", self._logname,
-                          networks)
+        self._times = window.ReorderWindow(self._write_times_row,
+                                           reorder_window, name=logname)
+        self._unresolved_times = []
+        self._stats = {}
+        self._congs = {}
+        self._first_cong = {}
+        self._outputs = None
+        self._times_writer = None
+        self._stats_writer = None
+        self._cong_writers = {}
+        self._line_parsers = {
+            kind: getattr(self, method)
+            for kind, method in self._LINE_PARSERS.items()
+        }
+
+    def _add_log_node(self, line):
+        fields = line.split(';', 2)
+        if len(fields) < 2:
+            return
+        self._add_node(fields[1].rstrip('\r\n'))
+
+    def _add_node(self, node):
+        if node not in self._log_nodes:
+            self._log_nodes.add(node)
+            if self.reorder_window is not None or self._following:
+                self._narrow_networks(node)
+
+    def _narrow_networks(self, node):
+        """
+        Drops the candidate networks that do not contain `node`. Once only
+        one is left, it is the network of the log, so packets can be written
+        before the whole log was parsed. It is still checked against the
+        nodes seen afterwards, as it must contain all nodes of the log.
+        """
+        if not self._networks:
+            raise LogError(f'No candidate networks given for {self}')
+        if self._candidates is None:
+            self._candidates = list(topology.network_index(
+                self.data_path, self._networks
+            ).items())
+        self._candidates = [(node_set, network)
+                            for node_set, network in self._candidates
+                            if node in node_set]
+        if not self._candidates:
+            raise LogError(f'No network found for {self} in '
+                           f'{self._networks}')
+        if len(self._candidates) == 1 and self.network is None:
+            self._set_network(self._candidates[0][1])
+
+    def _set_network(self, network):
+        self.network = network
+        edgelist = topology.edgelist_path(self.data_path, network)
+        self._graph = topology.load_graph(edgelist)
+        self._sink_tree = topology.sink_tree(edgelist, network.split('x')[0])
+        unresolved_times = self._unresolved_times
+        self._unresolved_times = []
+        for row in unresolved_times:
+            self._write_times_row(row)
+
+    def _find_network_from_log(self):
+        """
+        Finds the network of the log from the nodes of the whole log, once
+        more than `MAX_UNRESOLVED_TIMES` packets are kept as more than one
+        candidate network is left, e.g. if the nodes of one are a subset of
+        those of another. The log is read a second time for this, which is
+        not possible while it is followed.
+        """
+        if self._following:
+            raise LogError(f'{self} matches more than one of '
+                           f'{self._networks} after '
+                           f'{self.MAX_UNRESOLVED_TIMES} packets, only give '
+                           f'the network of the run')
+        logging.info('Reading nodes of %s to find its network',
+                     self._logname)
+        nodes = set(self._log_nodes)
+        with files.open_log(self.logname) as logfile:
+            for line in logfile:
+                fields = line.split(b';', 2)
+                if len(fields) >= 2:
+                    nodes.add(fields[1].rstrip(b'\r\n')
+                              .decode(errors='ignore'))
+        network = topology.find_network(self.data_path, self._networks, nodes)
+        if network is None:
+            raise LogError(f'No network found for {self} in '
+                           f'{self._networks}')
+        self._set_network(network)
+
+    def _known_hops_to_sink(self, node):
+        if self._sink_tree is None:
+            return None
+        return self._sink_tree.known_hops_to_sink(node)
+
+    def _known_sources(self):
+        if self._sink_tree is None:
+            return ()
+        return self._sink_tree.sources()
+
+    def enable_follow(self, status_file,
+                      status_interval=follow.STATUS_INTERVAL):
+        """
+        Makes `log_to_csvs()` follow the log while it grows and publish the
+        rolling PDR of its packets to `status_file` every `status_interval`
+        seconds, see `results_common.follow`. The hops to the sink and the
+        nodes expected to send are known once only one candidate network is
+        left.
+        """
+        self._following = True
+        self._times = follow.RollingPDR(self._times, status_file,
+                                        self._known_hops_to_sink,
+                                        self._known_sources,
+                                        interval=status_interval)
+
+    def _resolve_network(self):
+        """
+        Finds the network of the nodes seen in the log, if not known yet, and
+        orders the parsed statistics and congestion events by the nodes of
+        that network.
+        """
+        if self.network is None:
+            if not self._networks:
+                raise LogError(f'No candidate networks given for {self}')
+            network = topology.find_network(self.data_path, self._networks,
+                                            self._log_nodes)
+            if network is None:
+                raise LogError(f'No network found for {self} in '
+                               f'{self._networks}')
+            self._set_network(network)
+        stats = {n: {'node': n} for n in self._graph.nodes}
+        for node, row in self._stats.items():
+            stats.setdefault(node, {}).update(row)
+        self._stats = stats
+        congs = {n: [] for n in self._graph.nodes}
+        congs.update(self._congs)
+        self._congs = congs
 
     def __repr__(self):
         return "<{} '{}'>".format(
@@ -160,7 +303,8 @@ class LogParser:
         )
 
     @classmethod
-    def match(cls, filename, networks=None, data_path=None):
+    def match(cls, filename, networks=None, data_path=None,
+              reorder_window=None, npz=False, mmap=False):
         """
         >>> LogParser.match('sfr-cc-sfr-congure_sfr-7_8-200x968B500ms-'
         ...                 '253471-1615839862.log', data_path='./')
@@ -172,6 +316,7 @@ class LogParser:
         match = cls._LOG_NAME_C.match(filename)
         if match is not None:
             return cls(filename, networks=networks, data_path=data_path,
+                       reorder_window=reorder_window, npz=npz, mmap=mmap,
                        **match.groupdict())
         return None
 
@@ -182,22 +327,24 @@ class LogParser:
     @property
     def nodes_info(self):
         if self._nodes_info is None:
-            with open(self.nodes_csv) as nodes_file:
-                csvfile = csv.DictReader(nodes_file)
-                self._nodes_info = {}
-                for row in csvfile:
-                    addr = ipaddress.IPv6Address(row['addr'])
-                    key = (addr.packed[14] << 8) | addr.packed[15]
-                    self._nodes_info[key] = row['name']
+            self._nodes_info = node_index.load(self.data_path)
         return self._nodes_info
 
+    @property
+    def _name_prefix(self):
+        """
+        >>> LogParser('test.log.gz', data_path='./')._name_prefix
+        './test'
+        """
+        return files.uncompressed_name(self.logname)[:-4]
+
     @property
     def times_csv(self):
         """
         >>> LogParser('test.log', data_path='./').times_csv
         './test.times.csv'
         """
-        return f'{self.logname[:-4]}.times.csv'
+        return f'{self._name_prefix}.times.csv'
 
     @property
     def stats_csv(self):
@@ -205,7 +352,7 @@ class LogParser:
         >>> LogParser('test.log', data_path='./').stats_csv
         './test.stats.csv'
         """
-        return f'{self.logname[:-4]}.stats.csv'
+        return f'{self._name_prefix}.stats.csv'
 
     @property
     def cong_csvs(self):
@@ -217,7 +364,7 @@ class LogParser:
             # pylint: disable=too-few-public-methods
             def __getitem__(_, node):
                 # pylint: disable=no-self-argument
-                return f'{self.logname[:-4]}.{node}.cong.csv'
+                return f'{self._name_prefix}.{node}.cong.csv'
         return CongCSVDict()
 
     @property
@@ -238,7 +385,7 @@ class LogParser:
         return self.nodes_info[addr]
 
     @staticmethod
-    def _get_csv_writers(times_csvfile, stats_csvfile, cong_csvfiles):
+    def _get_csv_writers(times_csvfile, stats_csvfile):
         times_fieldnames = ['mode', 'data_len', 'src', 'dst',
                             'hops_to_sink', 'pkt_id', 'src_addr',
                             'send_time', 'recv_time', 'send_errno']
@@ -253,60 +400,120 @@ class LogParser:
                                    fieldnames=stats_fieldnames,
                                    delimiter=';')
         stats_csv.writeheader()
+        return times_csv, stats_csv
+
+    @staticmethod
+    def _get_cong_csv_writer(cong_csvfile):
         cong_fieldnames = ['time', 'type', 'tag', 'cwnd', 'ifg',
                            'resource_usage', 'fbuf_usage']
-        cong_csvs = {}
-        for node in cong_csvfiles:
-            cong_csv = csv.DictWriter(cong_csvfiles[node],
-                                      fieldnames=cong_fieldnames,
-                                      delimiter=';')
-            cong_csv.writeheader()
-            cong_csvs[node] = cong_csv
-        return times_csv, stats_csv, cong_csvs
+        cong_csv = csv.DictWriter(cong_csvfile,
+                                  fieldnames=cong_fieldnames,
+                                  delimiter=';')
+        cong_csv.writeheader()
+        return cong_csv
+
+    def _open_csvs(self, stack):
+        self._outputs = stack
+        stats_csvfile = stack.enter_context(
+            files.atomic_open(self.stats_csv)
+        )
+        times_csvfile = stack.enter_context(
+            files.atomic_open(self.times_csv)
+        )
+        self._times_writer, self._stats_writer = self._get_csv_writers(
+            times_csvfile,
+            stats_csvfile,
+        )
+        if self.npz:
+            self._times_writer = stack.enter_context(columnar.also_npz(
+                self._times_writer, times_csvfile,
+                columnar.npz_name(self.times_csv)
+            ))
+            self._stats_writer = stack.enter_context(columnar.also_npz(
+                self._stats_writer, stats_csvfile,
+                columnar.npz_name(self.stats_csv)
+            ))
+
+    def _cong_writer(self, node):
+        if node not in self._cong_writers:
+            cong_csvfile = self._outputs.enter_context(
+                files.atomic_open(self.cong_csvs[node])
+            )
+            cong_csv = self._get_cong_csv_writer(cong_csvfile)
+            if self.npz:
+                cong_csv = self._outputs.enter_context(columnar.also_npz(
+                    cong_csv, cong_csvfile,
+                    columnar.npz_name(self.cong_csvs[node])
+                ))
+                cong_csv = self._outputs.enter_context(columnar.also_npz(
+                    cong_csv, cong_csvfile,
+                    transactions.transactions_name(self.cong_csvs[node]),
+                    transactions.TransactionWriter,
+                ))
+            self._cong_writers[node] = cong_csv
+        return self._cong_writers[node]
+
+    def _outputs_written(self):
+        cong_csvs = [self.cong_csvs[node] for node in self._cong_writers]
+        outputs = [self.times_csv, self.stats_csv] + cong_csvs
+        if self.npz:
+            return outputs + [columnar.npz_name(output)
+                              for output in outputs] + \
+                [transactions.transactions_name(cong_csv)
+                 for cong_csv in cong_csvs]
+        return outputs
+
+    def _write_times_row(self, row):
+        if self._sink_tree is None:
+            # network is not known yet, see _narrow_networks()
+            self._unresolved_times.append(row)
+            if len(self._unresolved_times) > self.MAX_UNRESOLVED_TIMES:
+                self._find_network_from_log()
+            return
+        row["dst"] = self._sink_tree.sink
+        row["hops_to_sink"] = self._sink_tree.hops_to_sink(row["src"])
+        self._times_writer.writerow(row)
 
     def _write_csvs(self):
-        stats_csvfile = open(self.stats_csv, 'w')
-        times_csvfile = open(self.times_csv, 'w')
-        cong_csvfiles = {}
-        sink = self.network.split('x')[0]
-        for node in self._congs:
-            cong_csvfiles[node] = open(self.cong_csvs[node], 'w')
-        try:
-            times_csv, stats_csv, cong_csvs = self._get_csv_writers(
-                times_csvfile,
-                stats_csvfile,
-                cong_csvfiles,
-            )
-            for row in self._times.values():
-                row["dst"] = sink
-                # pylint: disable=unexpected-keyword-arg,no-value-for-parameter
-                shortest_path = nx.shortest_path(self._graph,
-                                                 source=row["src"],
-                                                 target=sink)
-                row["hops_to_sink"] = len(shortest_path) - 1
-                times_csv.writerow(row)
-            successors = nx.dfs_successors(self._graph, sink)
-            for row in self._stats.values():
-                if "l2_retrans" in row:
-                    row["l2_retrans"] = max(row["l2_retrans"])
-                # pylint: disable=unexpected-keyword-arg,no-value-for-parameter
-                shortest_path = nx.shortest_path(self._graph,
-                                                 source=row["node"],
-                                                 target=sink)
-                row["hops_to_sink"] = len(shortest_path) - 1
-                row["successors"] = len(successors.get(row["node"], []))
-                stats_csv.writerow(row)
-            for node in cong_csvs:
-                for row in self._congs[node]:
-                    cong_csvs[node].writerow(row)
-        finally:
-            stats_csvfile.close()
-            times_csvfile.close()
-            for node in cong_csvfiles:
-                cong_csvfiles[node].close()
+        self._times.flush()
+        for row in self._stats.values():
+            if "l2_retrans" in row:
+                row["l2_retrans"] = max(row["l2_retrans"])
+            row["hops_to_sink"] = self._sink_tree.hops_to_sink(row["node"])
+            row["successors"] = self._sink_tree.successors(row["node"])
+            self._stats_writer.writerow(row)
+        for node, congs in self._congs.items():
+            cong_csv = self._cong_writer(node)
+            for row in congs:
+                cong_csv.writerow(row)
+        return self._outputs_written()
+
+    @staticmethod
+    def _line_kind(line):
+        # pylint: disable=line-too-long
+        """
+        Returns the first word after the node field of a line, or the first
+        letter of a congestion event type.
+
+        >>> LogParser._line_kind('1615844416.475571;m3-281;send;1881;392;0037')
+        'send'
+        >>> LogParser._line_kind('1615844416.475571;m3-281;> ce;12;40;4213')
+        'c'
+        >>> LogParser._line_kind(
+        ...     '1615843845.639756;m3-3;  position of last byte used: 2872'
+        ... )
+        'position'
+        """     # noqa: E501
+        fields = line.split(';', 3)
+        if len(fields) < 3:
+            return None
+        word = fields[2].lstrip('> ').split(' ', 1)[0]
+        if len(word) == 2:
+            return word[0]
+        return word
 
     def _check_experiment_started(self, line):
-        match = self._c_started.search(line)
+        match = self._LOG_EXP_STARTED_C.search(line)
         if match:
             assert int(match['count']) == self.count
             self._experiment_started = True
@@ -329,16 +536,20 @@ class LogParser:
         ... )
         {'mode': 'sfr', 'data_len': 392, 'src': 'm3-281', 'dst': 'm3-273', 'pkt_id': 55, 'recv_time': 1615844417.729934}
         """     # noqa: E501
-        match = self._c_data.match(line)
+        return self._parse_times_match(self._LOG_DATA_C.match(line))
+
+    def _parse_times_match(self, match, decode=str):
+        # with a bytes match, only the groups that are strings in the CSV are
+        # decoded, int() and float() take bytes as well
         if match is None:
             return None
-        direction = match['dir']
+        direction = decode(match['dir'])
         addr = int(match['addr'], base=16)
         assert direction != 'send' or addr
         assert direction != 'recv' or addr
         assert self.data_len == int(match['data_len'])
         if direction == 'send':
-            node = match['node']
+            node = decode(match['node'])
             pkt_id = int(match['pkt_id'], base=16)
             res = {
                 'mode': self.mode,
@@ -351,20 +562,20 @@ class LogParser:
             node = self._addr_to_node(addr)
             pkt_id = int(match['pkt_id'], base=16)
             if (node, pkt_id) not in self._times:
-                line = line.strip()
-                logging.warning('%s: %s has no out from %s', self, line, node)
+                line = match.group()
+                if isinstance(line, bytes):
+                    line = line.decode(errors='ignore')
+                logging.warning('%s: %s has no out from %s', self,
+                                line.strip(), node)
             res = {
                 'mode': self.mode,
                 'data_len': self.data_len,
                 'src': node,
-                'dst': match['node'],
+                'dst': decode(match['node']),
                 'pkt_id': pkt_id,
                 'recv_time': float(match['time']),
             }
-        if (node, pkt_id) in self._times:
-            self._times[node, pkt_id].update(res)
-        else:
-            self._times[node, pkt_id] = res
+        self._times.update((node, pkt_id), res)
         return res
 
     def _parse_cong_line(self, line):
@@ -380,13 +591,15 @@ class LogParser:
         ... )
         ('m3-281', {'time': 452.0073239803314, 'type': 'ei', 'tag': 14, 'resource_usage': 0.75})
         """     # noqa: E501
-        match = self._c_cong.match(line)
+        return self._parse_cong_match(self._LOG_CONG_C.match(line))
+
+    def _parse_cong_match(self, match, decode=str):
         if match is None:
             return None
-        node = match['node']
+        node = decode(match['node'])
         if self._first_cong.get(node) is None:
             self._first_cong[node] = float(match['time'])
-        typ = match['type']
+        typ = decode(match['type'])
         cong = {
             'time': float(match['time']) - self._first_cong[node],
             'type': typ,
@@ -400,9 +613,12 @@ class LogParser:
                                      int(match['param2'])
         else:
             raise LogError(f"Unknown congestion event '{typ}'")
-        if node not in self._congs:
-            self._congs[node] = []
-        self._congs[node].append(cong)
+        if self.reorder_window is not None:
+            self._cong_writer(node).writerow(cong)
+        else:
+            if node not in self._congs:
+                self._congs[node] = []
+            self._congs[node].append(cong)
         return node, cong
 
     def _update_int_stats(self, key, match, group=None):
@@ -425,7 +641,7 @@ class LogParser:
         ... )
         ('m3-289', {'pktbuf_size': 6144})
         """     # noqa: E501
-        match = self._c_pktbuf_size.search(line)
+        match = self._LOG_PKTBUF_SIZE_C.search(line)
         if match is None:
             return None
         return self._update_int_stats('pktbuf_size', match)
@@ -438,7 +654,7 @@ class LogParser:
         ... )
         ('m3-3', {'pktbuf_usage': 2872})
         """
-        match = self._c_pktbuf_usage.search(line)
+        match = self._LOG_PKTBUF_USAGE_C.search(line)
         if match is None:
             return None
         return self._update_int_stats('pktbuf_usage', match)
@@ -451,7 +667,7 @@ class LogParser:
         ... )
         ('m3-72', {'rb_full': 1232})
         """
-        match = self._c_rb_full.search(line)
+        match = self._LOG_RB_C.search(line)
         if match is None:
             return None
         return self._update_int_stats('rb_full', match)
@@ -464,7 +680,7 @@ class LogParser:
         ... )
         ('m3-273', {'vrb_full': 0})
         """
-        match = self._c_vrb_full.search(line)
+        match = self._LOG_VRB_C.search(line)
         if match is None:
             return None
         return self._update_int_stats('vrb_full', match)
@@ -477,7 +693,7 @@ class LogParser:
         ... )
         ('m3-72', {'frags_comp': 10})
         """
-        match = self._c_frags_comp.search(line)
+        match = self._LOG_FRAGS_COMP_C.search(line)
         if match is None:
             return None
         return self._update_int_stats('frags_comp', match)
@@ -490,85 +706,211 @@ class LogParser:
         ... )
         ('m3-72', {'dgs_comp': 5})
         """
-        match = self._c_dgs_comp.search(line)
+        match = self._LOG_DGS_COMP_C.search(line)
         if match is None:
             return None
         return self._update_int_stats('dgs_comp', match)
 
-    def log_to_csvs(self):
+    def _scan_log(self, logfile):
+        line_parsers = self._line_parsers
+        for line in logfile:
+            line = line.decode(errors='ignore')
+            self._add_log_node(line)
+            if not self._experiment_started:
+                self._check_experiment_started(line)
+                continue
+            parse = line_parsers.get(self._line_kind(line))
+            if parse is not None:
+                parse(line)
+
+    def _scan_mapped_log(self, logfile):
+        """
+        Like `_scan_log()`, but matches the lines of the memory-mapped log as
+        bytes. The start of the experiment is found with a single search.
+        Data and congestion lines are parsed from bytes, decoding only the
+        matched groups that are needed, all other lines are decoded and
+        parsed as before.
+        """
+        decode = logreader.decoder()
+        seen = set()
+
+        def add_node(node):
+            seen.add(node)
+            self._add_node(decode(node.rstrip(b'\r\n')))
+
+        match_parsers = {
+            b'send': (self._LOG_DATA_BC.match, self._parse_times_match),
+            b'recv': (self._LOG_DATA_BC.match, self._parse_times_match),
+            b'c': (self._LOG_CONG_BC.match, self._parse_cong_match),
+            b'e': (self._LOG_CONG_BC.match, self._parse_cong_match),
+        }
+        line_parsers = {kind.encode(): parse
+                        for kind, parse in self._line_parsers.items()}
+        with logreader.mapped(logfile) as buf:
+            started, start = logreader.find_start(buf,
+                                                  self._LOG_EXP_STARTED_BC)
+            for fields in logreader.line_matches(buf, self._LOG_FIELDS_BC,
+                                                 end=start):
+                if fields['node'] not in seen:
+                    add_node(fields['node'])
+            if started is None:
+                return
+            assert int(started['count']) == self.count
+            self._experiment_started = True
+            for fields in logreader.line_matches(buf, self._LOG_FIELDS_BC,
+                                                 start):
+                node, kind = fields.group('node', 'word')
+                if node not in seen:
+                    add_node(node)
+                if kind is None:
+                    continue
+                if len(kind) == 2:
+                    kind = kind[:1]
+                if kind in match_parsers:
+                    match, parse = match_parsers[kind]
+                    parse(match(buf, *fields.span()), decode)
+                elif kind in line_parsers:
+                    line = buf[fields.start():fields.end()]
+                    line_parsers[kind](line.decode(errors='ignore'))
+
+    def log_to_csvs(self, read_hash=None):
         logging.info('Converting %s to CSVs', self._logname)
 
         try:
-            parsing_functions = [f for f in dir(self)
-                                 if f.startswith('_parse')]
-            with open(self.logname, "rb") as logfile:
-                for line in logfile:
-                    line = line.decode(errors='ignore')
-                    if not self._experiment_started:
-                        self._check_experiment_started(line)
-                        continue
-                    for function in parsing_functions:
-                        if getattr(self, function)(line):
-                            break
-            self._write_csvs()
+            with contextlib.ExitStack() as stack:
+                self._open_csvs(stack)
+                with files.open_log(self.logname,
+                                    read_hash=read_hash) as logfile:
+                    if self._following:
+                        self._scan_log(follow.tail(
+                            logfile, self._times.maybe_publish
+                        ))
+                        self._times.publish(done=True)
+                    # compressed logs can only be read line by line
+                    elif self.mmap and \
+                            files.compression(self.logname) is None:
+                        self._scan_mapped_log(logfile)
+                    else:
+                        self._scan_log(logfile)
+                self._resolve_network()
+                return self._write_csvs()
         except (AssertionError, KeyboardInterrupt, LogError) as exc:
-            if os.path.exists(self.times_csv):
-                os.remove(self.times_csv)
-            if os.path.exists(self.stats_csv):
-                os.remove(self.stats_csv)
-            for node in self._congs:
-                if os.path.exists(self.cong_csvs[node]):
-                    os.remove(self.cong_csvs[node])
+            cong_csvs = [
+                self.cong_csvs[node]
+                for node in set(self._congs).union(self._cong_writers)
+            ]
+            outputs = [self.times_csv, self.stats_csv] + cong_csvs
+            outputs += [columnar.npz_name(output) for output in outputs]
+            outputs += [transactions.transactions_name(cong_csv)
+                        for cong_csv in cong_csvs]
+            for output in outputs:
+                if os.path.exists(output):
+                    os.remove(output)
             raise exc
 
 
-class ThreadableParser(threading.Thread):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.exc = None
-
-    @staticmethod
-    def the_target(logname, networks, data_path=DATA_PATH):
-        parser = LogParser.match(logname, networks=networks,
-                                 data_path=data_path)
-        if parser:
-            parser.log_to_csvs()
-
-    def run(self):
-        try:
-            super().run()
-        except BaseException as exc:    # pylint: disable=broad-except
-            self.exc = exc
-
-    def join(self, *args, **kwargs):    # pylint: disable=signature-differs
-        super().join(*args, **kwargs)
-        if self.exc:
-            raise self.exc
-
-
-def logs_to_csvs(networks, data_path=DATA_PATH):
-    threads = []
+def _convert(logname, networks, data_path=DATA_PATH, reorder_window=None,
+             npz=False, mmap=False, read_hash=None):
+    # pylint: disable=too-many-arguments
+    parser = LogParser.match(os.path.basename(logname), networks=networks,
+                             data_path=data_path,
+                             reorder_window=reorder_window, npz=npz,
+                             mmap=mmap)
+    if parser:
+        return parser.log_to_csvs(read_hash)
+    return None
+
+
+def follow_log(logname, networks, reorder_window=None, npz=False,
+               status_interval=follow.STATUS_INTERVAL):
+    """
+    Converts the log `logname` of a run in progress while it grows and
+    publishes the rolling PDR of its packets to its status file (see
+    `results_common.follow.status_name()`) every `status_interval` seconds.
+    The `nodes.csv` and edge lists are expected next to the log.
+    """
+    parser = LogParser.match(
+        os.path.basename(logname), networks=networks,
+        data_path=os.path.dirname(os.path.abspath(logname)),
+        reorder_window=reorder_window, npz=npz
+    )
+    if parser is None:
+        raise LogError(f'{logname} is not the name of a log')
+    parser.enable_follow(follow.status_name(logname), status_interval)
+    return parser.log_to_csvs()
+
+
+def logs_to_csvs(networks, data_path=DATA_PATH, jobs=None,
+                 reorder_window=None, npz=False, mmap=False):
+    # pylint: disable=protected-access
+    conversions = manifest.Manifest(data_path, 'cc', PARSER_VERSION)
+    tasks = []
     for logname in os.listdir(data_path):
-        kwargs = {
-            'logname': logname,
-            'networks': networks,
-            'data_path': data_path,
-        }
-        thread = ThreadableParser(target=ThreadableParser.the_target,
-                                  kwargs=kwargs)
-        threads.append(thread)
-        thread.start()
-        if len(threads) > (multiprocessing.cpu_count() * 2):
-            threads[random.randint(0, len(threads) - 1)].join()
+        if not LogParser._LOG_NAME_C.match(logname):
+            continue
+        if files.uncompressed_name(logname) != logname and \
+           os.path.exists(os.path.join(data_path,
+                                       files.uncompressed_name(logname))):
+            # converted from the uncompressed log
+            continue
+        required = []
+        if npz:
+            required.append(columnar.npz_name(
+                LogParser(logname, data_path=data_path).times_csv
+            ))
+        logname = os.path.join(data_path, logname)
+        if conversions.is_current(logname, required=required):
+            continue
+        tasks.append((logname, {'networks': networks, 'data_path': data_path,
+                                'reorder_window': reorder_window,
+                                'npz': npz, 'mmap': mmap}))
+    try:
+        errors = pool.run(functools.partial(manifest.fingerprinted, _convert),
+                          tasks, jobs, on_success=conversions.record)
+    finally:
+        conversions.save()
+    if errors:
+        raise LogError(f'{len(errors)} of {len(tasks)} logs failed to '
+                       f'convert: {", ".join(sorted(errors))}')
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-v', '--verbosity', default='INFO')
+    parser.add_argument('-j', '--jobs', type=int, default=pool.default_jobs(),
+                        help='Number of logs to convert in parallel '
+                             '(default: number of CPUs)')
+    parser.add_argument('-w', '--reorder-window', type=int, default=None,
+                        help='Write packets and congestion events to the CSVs '
+                             'while parsing, keeping at most REORDER_WINDOW '
+                             'unmatched packets in memory (default: keep '
+                             'everything until the log was parsed)')
+    parser.add_argument('-n', '--npz', action='store_true',
+                        help='Also write the CSVs as compressed NumPy .npz '
+                             'files with typed columns')
+    parser.add_argument('-m', '--mmap', action='store_true',
+                        help='Memory-map the logs and match their lines as '
+                             'bytes instead of decoding every line')
+    parser.add_argument('-f', '--follow', metavar='LOG',
+                        help='Only convert LOG of a run in progress, '
+                             'following it while it grows and publishing the '
+                             'rolling PDR to its .status.json file')
+    parser.add_argument('-s', '--status-interval', type=float,
+                        default=follow.STATUS_INTERVAL,
+                        help='Seconds between updates of the status file '
+                             f'with --follow (default: '
+                             f'{follow.STATUS_INTERVAL})')
     parser.add_argument('networks', nargs='+')
     args = parser.parse_args()
     logging.basicConfig(level=getattr(logging, args.verbosity))
-    logs_to_csvs(args.networks)
+    if args.follow:
+        follow_log(args.follow, args.networks,
+                   reorder_window=args.reorder_window, npz=args.npz,
+                   status_interval=args.status_interval)
+    else:
+        logs_to_csvs(args.networks, jobs=args.jobs,
+                     reorder_window=args.reorder_window, npz=args.npz,
+                     mmap=args.mmap)
 
 
 if __name__ == '__main__':
@@ -16,12 +16,17 @@ import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 
-from parse_results import DATA_PATH
+from parse_results import DATA_PATH, LogParser
+
+# parse_results adds the scripts directory to the module search path
+from results_common import catalog, cube
 
 CSVNAME_PATTERN = r'sfr-cc-{mode}-({dg_retries}-)?({congure_impl}-)' \
                   r'?({ecn_frac}-)?(?P<count>\d+)x{data_len:d}B{delay}ms-' \
                   r'(?P<exp_id>\d+)-(?P<timestamp>\d+)' \
                   r'(\.(?P<node>m3-\d+))?\.(stats|times|cong)\.csv'
+CATALOG_PATTERN = LogParser.LOGNAME_PATTERN + \
+    r'(\.(?P<node>m3-\d+))?\.(?P<kind>stats|times|cong)\.csv'
 DELAY = 500
 RUNS = 10
 
@@ -102,18 +107,50 @@ def set_style():
     ])
 
 
+_CATALOG = None
+
+
+def results_catalog():
+    global _CATALOG     # pylint: disable=global-statement
+    if _CATALOG is None:
+        _CATALOG = catalog.Catalog(
+            DATA_PATH, 'cc', CATALOG_PATTERN,
+            index=('mode', 'data_len', 'delay', 'congure_impl', 'ecn_frac')
+        )
+    return _CATALOG
+
+
+_CUBE = None
+
+
+def pdr_cube():
+    global _CUBE        # pylint: disable=global-statement
+    if _CUBE is None:
+        _CUBE = cube.PDRCube(DATA_PATH, 'cc')
+        _CUBE.update(results_catalog().find(kind='times'))
+        _CUBE.save()
+    return _CUBE
+
+
 def get_files(mode, dg_retries, congure_impl, ecn_frac, data_len):
     # pylint: disable=too-many-arguments
     exp_dict = {'delay': DELAY, 'mode': mode, 'dg_retries': dg_retries,
                 'data_len': data_len, 'congure_impl': congure_impl or '',
                 'ecn_frac': ecn_frac or ''}
-    pattern = CSVNAME_PATTERN.format(**exp_dict)
+    pattern = re.compile(CSVNAME_PATTERN.format(**exp_dict))
+    # CSVNAME_PATTERN also matches results without SFR parameters, so the
+    # catalog is asked for those as well. It already sorts by timestamp.
+    candidates = results_catalog().find(
+        mode=mode, data_len=data_len, delay=DELAY,
+        dg_retries=(dg_retries, None),
+        congure_impl=(congure_impl or None, None),
+        ecn_frac=(ecn_frac or None, None),
+    )
     filenames = filter(lambda x: x[0] is not None,
-                       map(lambda f: (re.match(pattern, f),
-                                      os.path.join(DATA_PATH, f)),
-                           os.listdir(DATA_PATH)))
-    filenames = sorted(filenames,
-                       key=lambda x: int(x[0].group("timestamp")))
+                       map(lambda f: (pattern.match(f),
+                                       os.path.join(DATA_PATH, f)),
+                           candidates))
+    filenames = list(filenames)
     res = {
         'stats': [f for f in filenames if f[1].endswith('stats.csv')],
         'times': [f for f in filenames if f[1].endswith('times.csv')],
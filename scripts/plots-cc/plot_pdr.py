@@ -11,7 +11,6 @@
 # pylint: disable=missing-function-docstring
 
 import argparse
-import csv
 import logging
 import os
 
@@ -28,18 +27,13 @@ from parse_results import DATA_PATH
 def process_data(mode, dg_retries, congure_impl, ecn_frac, data_len):
     files = pc.get_files(mode, dg_retries, congure_impl, ecn_frac, data_len)
     res = []
+    cube = pc.pdr_cube()
     for i, (match, filename) in enumerate(files['stats'][-pc.RUNS:]):
         filename = os.path.join(DATA_PATH, filename)
-        sends = 0
-        receives = 0
-        with open(files['times'][i][1]) as timesfile:
-            reader = csv.DictReader(timesfile, delimiter=";")
-            for row in reader:
-                sends += 1
-                if row["recv_time"]:
-                    receives += 1
-                if (sends > 0):
-                    res.append(100 * receives / sends)
+        # PDR so far after each packet sent
+        received = cube.received(files['times'][i][1])
+        res.extend(100 * np.cumsum(received) /
+                   np.arange(1, len(received) + 1))
     return pc.FRAGS[data_len], pc.reject_outliers(res)
 
 
@@ -13,11 +13,16 @@ import matplotlib.pyplot as plt
 import networkx as nx
 import os
 import re
+import sys
 
 from matplotlib.colors import hsv_to_rgb
 
 
 SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(SCRIPT_PATH, ".."))
+
+from results_common import files  # noqa: E402
+
 DATA_PATH = os.environ.get("DATA_PATH",
                            os.path.join(SCRIPT_PATH, "..", "..", "results"))
 NETWORK_PATTERN = "n(?P<network_id>m3-\d+x[a-f\d]+)"
@@ -27,7 +32,7 @@ SOURCE_COLOR = "#b5a3da"
 
 def in_addr(logfile):
     res = {}
-    with open(logfile, "rb") as log:
+    with files.open_log(logfile) as log:
         c = re.compile(";in;")
         for line in log:
             line = line.decode(errors="ignore")
@@ -124,7 +129,7 @@ def main(prefix, log, monochrome=False):
     sink = re.sub("(m3-\d+)x[a-f\d]+", r"\1", network_id)
     addrs = in_addr(log)
     nodes = nodes_dict(link_local_csv)
-    svgfile_prefix = log.replace(".log", "")
+    svgfile_prefix = files.uncompressed_name(log).replace(".log", "")
     mark_in_nodes(svgfile_prefix, edgelist, sink, prefix, addrs, nodes,
                   monochrome)
 
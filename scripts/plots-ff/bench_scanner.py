@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+import argparse
+import re
+import time
+
+import parse_results
+
+__author__ = "Martine S. Lenders"
+__copyright__ = "Copyright 2021 Freie Universität Berlin"
+__license__ = "LGPL v2.1"
+__email__ = "m.lenders@fu-berlin.de"
+
+# (kind, pattern, use re.match) in the order the previous implementation of
+# parse_results.log_to_csvs tried them
+SEQUENTIAL_PATTERNS = [
+    ("pkt_id", parse_results.LOG_DATA_PATTERN, True),
+    ("l2_retrans", parse_results.LOG_RETRANS_PATTERN, False),
+    ("pktbuf_size", parse_results.LOG_PKTBUF_SIZE_PATTERN, False),
+    ("pktbuf_usage", parse_results.LOG_PKTBUF_USAGE_PATTERN, False),
+    ("rbuf_full", parse_results.LOG_RBUF_PATTERN, False),
+    ("vrb_full", parse_results.LOG_VRB_PATTERN, False),
+    ("frag_comp", parse_results.LOG_FRAG_COMP_PATTERN, False),
+    ("dg_comp", parse_results.LOG_DG_COMP_PATTERN, False),
+]
+
+
+def read_lines(logname):
+    with open(logname, "rb") as logfile:
+        return [line.decode(errors="ignore") for line in logfile]
+
+
+def scan_sequential(lines):
+    compiled = [(kind, re.compile(pattern).match if match
+                 else re.compile(pattern).search)
+                for kind, pattern, match in SEQUENTIAL_PATTERNS]
+    kinds = []
+    for line in lines:
+        for kind, func in compiled:
+            if func(line) is not None:
+                kinds.append(kind)
+                break
+        else:
+            kinds.append(None)
+    return kinds
+
+
+def scan_combined(lines):
+    c_line = re.compile(parse_results.LOG_LINE_PATTERN)
+    kinds = []
+    for line in lines:
+        match = c_line.match(line)
+        kinds.append(match.lastgroup if match is not None else None)
+    return kinds
+
+
+def bench(func, lines, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func(lines)
+        best = min(best, time.perf_counter() - start)
+    return res, len(lines) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares the line throughput of the combined line "
+                    "scanner of parse_results.py with sequentially trying "
+                    "each line pattern"
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="Repetitions per log, the best one is reported "
+                             "(default: 3)")
+    parser.add_argument("logs", nargs="+", help="Logs to scan")
+    args = parser.parse_args()
+    for logname in args.logs:
+        lines = read_lines(logname)
+        seq_kinds, seq_rate = bench(scan_sequential, lines, args.repeat)
+        comb_kinds, comb_rate = bench(scan_combined, lines, args.repeat)
+        mismatches = sum(a != b for a, b in zip(seq_kinds, comb_kinds))
+        print("{}: {} lines".format(logname, len(lines)))
+        print("  sequential: {:12.0f} lines/s".format(seq_rate))
+        print("  combined:   {:12.0f} lines/s ({:.2f}x)"
+              .format(comb_rate, comb_rate / seq_rate))
+        if mismatches:
+            print("  WARNING: {} lines classified differently"
+                  .format(mismatches))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+__author__ = "Martine S. Lenders"
+__copyright__ = "Copyright 2021 Freie Universität Berlin"
+__license__ = "LGPL v2.1"
+__email__ = "m.lenders@fu-berlin.de"
+
+SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
+MODULES = [
+    "parse_results",
+    "plot_results",
+    "plot-lat",
+    "plot-pdr",
+    "plot-pdr2",
+]
+HEAVY_MODULES = ["matplotlib", "numpy", "networkx", "pandas"]
+# imports the module in a fresh interpreter and prints which of the heavy
+# modules it pulled in; importlib is needed for the names with dashes
+IMPORT_CODE = """
+import importlib, sys
+importlib.import_module({module!r})
+print(" ".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def run(code):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (SCRIPT_PATH, env.get("PYTHONPATH")) if p
+    )
+    start = time.perf_counter()
+    res = subprocess.run([sys.executable, "-c", code], cwd=SCRIPT_PATH,
+                         env=env, check=True, stdout=subprocess.PIPE,
+                         universal_newlines=True)
+    return time.perf_counter() - start, res.stdout.strip()
+
+
+def bench(code, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        duration, output = run(code)
+        best = min(best, duration)
+    return best, output
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measures how long importing each plotting module takes "
+                    "in a fresh interpreter, compared to starting the bare "
+                    "interpreter, and which heavy modules the import loads"
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="Repetitions per module, the best one is "
+                             "reported (default: 5)")
+    parser.add_argument("modules", nargs="*", default=MODULES,
+                        help="Modules to import (default: {})"
+                             .format(" ".join(MODULES)))
+    args = parser.parse_args()
+    baseline, _ = bench("pass", args.repeat)
+    print("interpreter: {:8.1f} ms".format(baseline * 1000))
+    for module in args.modules:
+        duration, heavy = bench(
+            IMPORT_CODE.format(module=module, heavy=HEAVY_MODULES),
+            args.repeat
+        )
+        print("{:<13} {:8.1f} ms (+{:.1f} ms), loads: {}".format(
+            module + ":", duration * 1000, (duration - baseline) * 1000,
+            heavy or "-"
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -18,10 +18,16 @@ import matplotlib.ticker as plticker
 import numpy as np
 import pandas
 import re
+import sys
 
 from matplotlib.lines import Line2D
 from matplotlib.patches import Circle
 
+SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(SCRIPT_PATH, ".."))
+
+from results_common import files  # noqa: E402
+
 
 def _parse_log(sink, logfile, csvfile):
     writer = csv.writer(csvfile, delimiter=";", quotechar="\"")
@@ -101,11 +107,12 @@ TRANSLATE_MODE = {
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("sink", type=int)
-    parser.add_argument("logfile", type=argparse.FileType("rb"))
+    parser.add_argument("logfile", type=_existing_file)
     args = parser.parse_args()
     csvfile = io.StringIO()
     csvfile.write("data_len;mode;fragments;lat_mean;lat_std\n")
-    _parse_log(args.sink, args.logfile, csvfile)
+    with files.open_log(args.logfile) as logfile:
+        _parse_log(args.sink, logfile, csvfile)
     csvfile.seek(0)
     df = pandas.read_csv(csvfile, sep=";")
     cols = [col for col in COLS if col in list(df["mode"])]
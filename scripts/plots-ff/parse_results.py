@@ -6,15 +6,14 @@
 # General Public License v2.1. See the file LICENSE in the top level
 # directory for more details.
 
+import argparse
+import contextlib
 import csv
-import ipaddress
+import functools
 import logging
-import networkx as nx
 import re
-import multiprocessing
 import os
-import queue
-import threading
+import sys
 
 __author__ = "Martine S. Lenders"
 __copyright__ = "Copyright 2019 Freie Universität Berlin"
@@ -27,6 +26,13 @@ DATA_PATH = os.environ.get("DATA_PATH",
                            os.path.join(SCRIPT_PATH, "..", "..", "results"))
 GLOBAL_PREFIX = os.environ.get("GLOBAL_PREFIX", "2001:db8:0:1:")
 
+sys.path.append(os.path.join(SCRIPT_PATH, ".."))
+
+from results_common import (  # noqa: E402
+    columnar, files, follow, logreader, manifest, node_index, pool, topology,
+    window
+)
+
 NAME_PATTERN = r"6lo_comp_" \
                r"n(?P<network>m3-\d+x[0-9a-f]+)_c\d+__" \
                r"m{mode}_r{data_len}Bx(?P<count>\d+)x{delay}ms_(?P<timestamp>\d+)"
@@ -52,9 +58,35 @@ LOG_RBUF_PATTERN = r"(?P<node>m3-\d+);rbuf full: (?P<rbuf_full>\d+)"
 LOG_VRB_PATTERN = r"(?P<node>m3-\d+);VRB full: (?P<vrb_full>\d+)"
 LOG_FRAG_COMP_PATTERN = r"(?P<node>m3-\d+);frags complete: (?P<frag_comp>\d+)"
 LOG_DG_COMP_PATTERN = r"(?P<node>m3-\d+);dgs complete: (?P<dg_comp>\d+)"
+# All of the above in one alternation so each line is classified with a single
+# match. The kind of a line is given by `match.lastgroup`: `pkt_id` for data
+# lines, the name of the stats column for all other lines.
+LOG_LINE_PATTERN = r"(?P<time>\d+.\d+);(?P<node>m3-\d+);(?:" \
+                   r"(> ?)?(?P<dir>(recv|send|error));" \
+                   r"(?P<addr>[0-9a-f]+);" \
+                   r"(?P<errno>\d+);(?P<pkt_id>[0-9a-f]+)|" \
+                   r"\s+TX succeeded \d+ errors \d+ " \
+                   r"retransmissions (?P<l2_retrans>\d+)|" \
+                   r"packet buffer: " \
+                   r"first byte: 0x[0-9a-f]+, last byte: 0x[0-9a-f]+ " \
+                   r"\(size: (?P<pktbuf_size>\d+)\)|" \
+                   r"  position of last byte used: (?P<pktbuf_usage>\d+)|" \
+                   r"rbuf full: (?P<rbuf_full>\d+)|" \
+                   r"VRB full: (?P<vrb_full>\d+)|" \
+                   r"frags complete: (?P<frag_comp>\d+)|" \
+                   r"dgs complete: (?P<dg_comp>\d+))"
+# the same patterns for the memory-mapped logs, see _scan_mapped_log(). As
+# the line pattern is matched against the whole log, its whitespace must not
+# match the end of the line
+LOG_EXP_STARTED_BYTES_PATTERN = LOG_EXP_STARTED_PATTERN.encode()
+LOG_LINE_BYTES_PATTERN = LOG_LINE_PATTERN.replace(r"\s", r"[^\S\n]").encode()
 
 LINK_LOCAL_PREFIX = "fe80::"
 
+# increment when the output of log_to_csvs changes, so existing CSVs are
+# converted again
+PARSER_VERSION = 2
+
 
 class LogError(Exception):
     pass
@@ -65,7 +97,7 @@ def times_csvname(logname):
     >>> time_csvname("test.log")
     'test.csv'
     """
-    csvname = "{}times.csv".format(logname[:-3])
+    csvname = "{}times.csv".format(files.uncompressed_name(logname)[:-3])
     return csvname
 
 
@@ -74,27 +106,21 @@ def stats_csvname(logname):
     >>> time_csvname("test.log")
     'test.csv'
     """
-    csvname = "{}stats.csv".format(logname[:-3])
+    csvname = "{}stats.csv".format(files.uncompressed_name(logname)[:-3])
     return csvname
 
 
-def _src_addr_to_src(addr, network, data_path=DATA_PATH):
-    with open(os.path.join(data_path, "nodes.csv".format(network))) \
-         as lla_file:
-        csvfile = csv.DictReader(lla_file)
-        for row in csvfile:
-            lla = ipaddress.IPv6Address(row["addr"])
-            if (lla.packed[14] << 8) | lla.packed[15] == int(addr, base=16):
-                return row["name"]
-    return None
+def _src_addr_to_src(addr, nodes):
+    return nodes.get(int(addr, base=16))
 
 
-def _parse_times_line(network, mode, data_len, line, match, times,
-                      data_path=DATA_PATH):
-    direction = match.group("dir")
-    addr = match.group("addr")
+def _parse_times_line(mode, data_len, line, match, times, nodes, decode=str):
+    # with a bytes match, only the groups that are strings in the CSV are
+    # decoded, int() and float() take bytes as well
+    direction = decode(match.group("dir"))
+    addr = decode(match.group("addr"))
     if direction in ["send", "error"]:
-        node = match.group("node")
+        node = decode(match.group("node"))
         pkt_id = int(match.group("pkt_id"), base=16)
         return {
             "mode": mode,
@@ -106,9 +132,9 @@ def _parse_times_line(network, mode, data_len, line, match, times,
                               0)
         }
     else:
-        node = _src_addr_to_src(addr, network, data_path)
+        node = _src_addr_to_src(addr, nodes)
         pkt_id = int(match.group("pkt_id"), base=16)
-        dst = match.group("node")
+        dst = decode(match.group("node"))
         assert node is not None
         return {
             "mode": mode,
@@ -139,147 +165,156 @@ def _get_csv_writers(times_csvfile, stats_csvfile):
     return times_csv, stats_csv
 
 
-def _write_csvs(times, times_csvfile, stats, stats_csvfile, graph, sink):
-    times_csv, stats_csv = _get_csv_writers(times_csvfile, stats_csvfile)
-    for row in times.values():
-        row["dst"] = sink
-        shortest_path = nx.shortest_path(graph, row["src"], sink)
-        row["hops_to_sink"] = len(shortest_path) - 1
-        times_csv.writerow(row)
-    successors = nx.dfs_successors(graph, sink)
+def _write_times_row(times_csv, sink_tree, row):
+    row["dst"] = sink_tree.sink
+    row["hops_to_sink"] = sink_tree.hops_to_sink(row["src"])
+    times_csv.writerow(row)
+
+
+def _write_stats(stats, stats_csv, sink_tree):
     for row in stats.values():
         if "l2_retrans" in row:
             row["l2_retrans"] = max(row["l2_retrans"])
-        shortest_path = nx.shortest_path(graph, row["node"], sink)
-        row["hops_to_sink"] = len(shortest_path) - 1
-        row["successors"] = len(successors.get(row["node"], []))
+        row["hops_to_sink"] = sink_tree.hops_to_sink(row["node"])
+        row["successors"] = sink_tree.successors(row["node"])
         stats_csv.writerow(row)
 
 
+def _parse_line(mode, data_len, line, match, stats, times, nodes,
+                decode=str):
+    kind = match.lastgroup
+    if kind == "pkt_id":
+        res = _parse_times_line(mode, data_len, line, match, times,
+                                nodes, decode)
+        times.update((res["src"], res["pkt_id"]), res)
+    elif kind == "l2_retrans":
+        node = decode(match.group("node"))
+        l2_retrans = int(match.group(kind))
+        if "l2_retrans" in stats[node]:
+            stats[node]["l2_retrans"].append(l2_retrans)
+        else:
+            stats[node].update({"l2_retrans": [l2_retrans]})
+    else:
+        node = decode(match.group("node"))
+        stats[node].update({kind: int(match.group(kind))})
+
+
+def _scan_log(logfile, mode, data_len, stats, times, data_path=DATA_PATH):
+    c_started = re.compile(LOG_EXP_STARTED_PATTERN)
+    c_line = re.compile(LOG_LINE_PATTERN)
+    nodes = node_index.load(data_path)
+    experiment_started = False
+    for line in logfile:
+        line = line.decode(errors="ignore")
+        if not experiment_started:
+            if c_started.search(line) is not None:
+                experiment_started = True
+            continue
+
+        match = c_line.match(line)
+        if match is None:
+            continue
+        _parse_line(mode, data_len, line, match, stats, times, nodes)
+
+
+def _scan_mapped_log(logfile, mode, data_len, stats, times,
+                     data_path=DATA_PATH):
+    """
+    Like `_scan_log()`, but matches the lines of the memory-mapped log as
+    bytes and only decodes the matched groups that are needed. The start of
+    the experiment is found with a single search.
+    """
+    c_started = re.compile(LOG_EXP_STARTED_BYTES_PATTERN)
+    c_line = logreader.compile_lines(LOG_LINE_BYTES_PATTERN)
+    nodes = node_index.load(data_path)
+    decode = logreader.decoder()
+    with logreader.mapped(logfile) as buf:
+        _, start = logreader.find_start(buf, c_started)
+        for match in logreader.line_matches(buf, c_line, start):
+            _parse_line(mode, data_len, None, match, stats, times, nodes,
+                        decode)
+
+
+def _output_names(logname, npz=False):
+    csvnames = [times_csvname(logname), stats_csvname(logname)]
+    if npz:
+        return csvnames + [columnar.npz_name(csvname) for csvname in csvnames]
+    return csvnames
+
+
+def _remove_csvs(logname):
+    for csvname in _output_names(logname, npz=True):
+        if os.path.exists(csvname):
+            os.remove(csvname)
+
+
 def log_to_csvs(logname, network, mode, data_len, data_path=DATA_PATH,
-                count=50):
+                count=50, reorder_window=None, npz=False, mmap=False,
+                follow_status=None, status_interval=follow.STATUS_INTERVAL,
+                read_hash=None):
     logging.info("Converting {} to CSVs".format(logname))
-    logging.info(" - {}".format(stats_csvname(logname)))
-    logging.info(" - {}".format(times_csvname(logname)))
+    for output in _output_names(logname, npz):
+        logging.info(" - {}".format(output))
 
     try:
-        network_edgelist = os.path.join(data_path,
-                                        "{}.edgelist.gz".format(network))
+        network_edgelist = topology.edgelist_path(data_path, network)
         assert os.path.exists(network_edgelist)
-        with open(logname, "rb") as logfile, \
-                open(times_csvname(logname), "w") as times_csvfile, \
-                open(stats_csvname(logname), "w") as stats_csvfile:
-            c_started = re.compile(LOG_EXP_STARTED_PATTERN)
-
-            c_data = re.compile(LOG_DATA_PATTERN)
-
-            c_retrans = re.compile(LOG_RETRANS_PATTERN)
-            c_pktbuf_size = re.compile(LOG_PKTBUF_SIZE_PATTERN)
-            c_pktbuf_usage = re.compile(LOG_PKTBUF_USAGE_PATTERN)
-            c_rbuf = re.compile(LOG_RBUF_PATTERN)
-            c_vrb = re.compile(LOG_VRB_PATTERN)
-            c_frag_comp = re.compile(LOG_FRAG_COMP_PATTERN)
-            c_dg_comp = re.compile(LOG_DG_COMP_PATTERN)
-            experiment_started = False
-            times = {}
-            stats = {}
-            graph = nx.read_edgelist(network_edgelist,
-                                     data=[("weight", float)])
+        with contextlib.ExitStack() as stack:
+            logfile = stack.enter_context(files.open_log(
+                logname, read_hash=read_hash
+            ))
+            times_csvfile = stack.enter_context(
+                files.atomic_open(times_csvname(logname))
+            )
+            stats_csvfile = stack.enter_context(
+                files.atomic_open(stats_csvname(logname))
+            )
+            graph = topology.load_graph(network_edgelist)
             stats = {n: {"node": n} for n in graph.nodes}
-            sink = network.split("x")[0]
-            for line in logfile:
-                line = line.decode(errors="ignore")
-                if not experiment_started:
-                    if c_started.search(line) is not None:
-                        experiment_started = True
-                    continue
-
-                match = c_data.match(line)
-                if match is not None:
-                    res = _parse_times_line(network, mode, data_len,
-                                            line, match, times, data_path)
-                    if (res["src"], res["pkt_id"]) in times:
-                        times[res["src"], res["pkt_id"]].update(res)
-                    else:
-                        times[res["src"], res["pkt_id"]] = res
-                    continue
-
-                match = c_retrans.search(line)
-                if match is not None:
-                    node = match.group("node")
-                    l2_retrans = int(match.group("retrans"))
-                    if "l2_retrans" in stats[node]:
-                        stats[node]["l2_retrans"].append(l2_retrans)
-                    else:
-                        stats[node].update({"l2_retrans": [l2_retrans]})
-                    continue
-
-                match = c_pktbuf_size.search(line)
-                if match is not None:
-                    node = match.group("node")
-                    pktbuf_size = int(match.group("pktbuf_size"))
-                    stats[node].update({"pktbuf_size": pktbuf_size})
-                    continue
-
-                match = c_pktbuf_usage.search(line)
-                if match is not None:
-                    node = match.group("node")
-                    pktbuf_usage = int(match.group("pktbuf_usage"))
-                    stats[node].update({"pktbuf_usage": pktbuf_usage})
-                    continue
-
-                match = c_rbuf.search(line)
-                if match is not None:
-                    node = match.group("node")
-                    rbuf_full = int(match.group("rbuf_full"))
-                    stats[node].update({"rbuf_full": rbuf_full})
-                    continue
-
-                match = c_vrb.search(line)
-                if match is not None:
-                    node = match.group("node")
-                    vrb_full = int(match.group("vrb_full"))
-                    stats[node].update({"vrb_full": vrb_full})
-                    continue
-
-                match = c_frag_comp.search(line)
-                if match is not None:
-                    node = match.group("node")
-                    frag_comp = int(match.group("frag_comp"))
-                    stats[node].update({"frag_comp": frag_comp})
-                    continue
-
-                match = c_dg_comp.search(line)
-                if match is not None:
-                    node = match.group("node")
-                    dg_comp = int(match.group("dg_comp"))
-                    stats[node].update({"dg_comp": dg_comp})
-                    continue
-            _write_csvs(times, times_csvfile, stats, stats_csvfile,
-                        graph, sink)
+            sink_tree = topology.sink_tree(network_edgelist,
+                                           network.split("x")[0])
+            times_csv, stats_csv = _get_csv_writers(times_csvfile,
+                                                    stats_csvfile)
+            if npz:
+                times_csv = stack.enter_context(columnar.also_npz(
+                    times_csv, times_csvfile,
+                    columnar.npz_name(times_csvname(logname))
+                ))
+                stats_csv = stack.enter_context(columnar.also_npz(
+                    stats_csv, stats_csvfile,
+                    columnar.npz_name(stats_csvname(logname))
+                ))
+            # with a reorder_window, matched packets are written while
+            # parsing, otherwise all of them are written after parsing
+            times = window.ReorderWindow(
+                functools.partial(_write_times_row, times_csv, sink_tree),
+                reorder_window, name=logname
+            )
+            if follow_status is not None:
+                # follow the log while it grows and publish the rolling PDR
+                times = follow.RollingPDR(times, follow_status,
+                                          sink_tree.known_hops_to_sink,
+                                          sink_tree.sources,
+                                          interval=status_interval)
+                _scan_log(follow.tail(logfile, times.maybe_publish), mode,
+                          data_len, stats, times, data_path)
+                times.publish(done=True)
+            # compressed logs can only be read line by line
+            elif mmap and files.compression(logname) is None:
+                _scan_mapped_log(logfile, mode, data_len, stats, times,
+                                 data_path)
+            else:
+                _scan_log(logfile, mode, data_len, stats, times, data_path)
+            times.flush()
+            _write_stats(stats, stats_csv, sink_tree)
     except KeyboardInterrupt as exc:
-        os.remove(times_csvname(logname))
-        os.remove(stats_csvname(logname))
+        _remove_csvs(logname)
         raise exc
-    except LogError as exc:
-        os.remove(times_csvname(logname))
-        os.remove(stats_csvname(logname))
-        logging.error(exc)
-
-
-class ConverterThread(threading.Thread):
-    def __init__(self, data_path, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.queue = queue.Queue()
-        self.data_path = data_path
-
-    def run(self, *args, **kwargs):
-        while True:
-            item = self.queue.get()
-            if item["logname"] is None:
-                return
-            log_to_csvs(item["logname"], data_path=self.data_path,
-                        **item["params"])
+    except LogError:
+        _remove_csvs(logname)
+        # re-raised, so the pool counts the log as failed
+        raise
+    return _output_names(logname, npz)
 
 
 def match_to_dict(match):
@@ -289,29 +324,94 @@ def match_to_dict(match):
     return res
 
 
-def logs_to_csvs(data_path=DATA_PATH):
+def follow_log(logname, reorder_window=None, npz=False,
+               status_interval=follow.STATUS_INTERVAL):
+    """
+    Converts the log `logname` of a run in progress while it grows and
+    publishes the rolling PDR of its packets to its status file (see
+    `results_common.follow.status_name()`) every `status_interval` seconds.
+    The `nodes.csv` and edge lists are expected next to the log.
+    """
+    match = re.compile(LOG_NAME_PATTERN).match(os.path.basename(logname))
+    if match is None:
+        raise LogError("{} is not the name of a log".format(logname))
+    return log_to_csvs(logname,
+                       data_path=os.path.dirname(os.path.abspath(logname)),
+                       reorder_window=reorder_window, npz=npz,
+                       follow_status=follow.status_name(logname),
+                       status_interval=status_interval,
+                       **match_to_dict(match))
+
+
+def logs_to_csvs(data_path=DATA_PATH, jobs=None, reorder_window=None,
+                 npz=False, mmap=False):
     comp = re.compile(LOG_NAME_PATTERN)
-    threads = [ConverterThread(data_path)
-               for _ in range(multiprocessing.cpu_count())]
-    next_thread = 0
-    for thread in threads:
-        thread.start()
+    conversions = manifest.Manifest(data_path, "ff", PARSER_VERSION)
+    tasks = []
     for logname in os.listdir(data_path):
         match = comp.match(logname)
         if match is not None:
             logname = os.path.join(data_path, logname)
-            threads[next_thread].queue.put(
-                {"logname": logname, "params": match_to_dict(match)}
-            )
-            next_thread += 1
-            next_thread %= len(threads)
-    for thread in threads:
-        thread.queue.put({"logname": None})
-    for thread in threads:
-        thread.join()
+            if files.uncompressed_name(logname) != logname and \
+               os.path.exists(files.uncompressed_name(logname)):
+                # converted from the uncompressed log
+                continue
+            if conversions.is_current(logname,
+                                      required=_output_names(logname, npz)):
+                continue
+            kwargs = match_to_dict(match)
+            kwargs["data_path"] = data_path
+            kwargs["reorder_window"] = reorder_window
+            kwargs["npz"] = npz
+            kwargs["mmap"] = mmap
+            tasks.append((logname, kwargs))
+    try:
+        errors = pool.run(functools.partial(manifest.fingerprinted,
+                                            log_to_csvs),
+                          tasks, jobs, on_success=conversions.record)
+    finally:
+        conversions.save()
+    if errors:
+        raise LogError("{} of {} logs failed to convert: {}".format(
+            len(errors), len(tasks), ", ".join(sorted(errors))
+        ))
+
+
+def main():
+    logging.basicConfig(format='%(levelname)s: %(message)s',
+                        level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-j", "--jobs", type=int, default=pool.default_jobs(),
+                        help="Number of logs to convert in parallel "
+                             "(default: number of CPUs)")
+    parser.add_argument("-w", "--reorder-window", type=int, default=None,
+                        help="Write packets to the CSV while parsing, keeping "
+                             "at most REORDER_WINDOW unmatched packets in "
+                             "memory (default: keep all packets until the "
+                             "log was parsed)")
+    parser.add_argument("-n", "--npz", action="store_true",
+                        help="Also write the CSVs as compressed NumPy .npz "
+                             "files with typed columns")
+    parser.add_argument("-m", "--mmap", action="store_true",
+                        help="Memory-map the logs and match their lines as "
+                             "bytes instead of decoding every line")
+    parser.add_argument("-f", "--follow", metavar="LOG",
+                        help="Only convert LOG of a run in progress, "
+                             "following it while it grows and publishing the "
+                             "rolling PDR to its .status.json file")
+    parser.add_argument("-s", "--status-interval", type=float,
+                        default=follow.STATUS_INTERVAL,
+                        help="Seconds between updates of the status file "
+                             "with --follow (default: {})"
+                             .format(follow.STATUS_INTERVAL))
+    args = parser.parse_args()
+    if args.follow:
+        follow_log(args.follow, reorder_window=args.reorder_window,
+                   npz=args.npz, status_interval=args.status_interval)
+    else:
+        logs_to_csvs(jobs=args.jobs, reorder_window=args.reorder_window,
+                     npz=args.npz, mmap=args.mmap)
 
 
 if __name__ == "__main__":
-    logging.basicConfig(format='%(levelname)s: %(message)s',
-                        level=logging.INFO)
-    logs_to_csvs()
+    main()
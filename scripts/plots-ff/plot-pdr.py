@@ -6,20 +6,12 @@
 #
 # Distributed under terms of the MIT license.
 
-import csv
 import re
 import os
-import numpy as np
-import matplotlib
-matplotlib.use("pgf")
-from matplotlib.ticker import MultipleLocator
-import matplotlib.pyplot as plt
 
-import parse_results
-from plot_results import DATA_PATH, DELAY, NAME_PATTERN, \
-                         TIMES_CSV_NAME_PATTERN_FMT, \
-                         STATS_CSV_NAME_PATTERN_FMT, \
-                         _check_logs, _get_files, _reject_outliers
+# matplotlib and numpy are only imported once needed, so importing this
+# module stays cheap
+from plot_results import DATA_PATH, _check_logs, _mean_pdrs
 
 
 DATA_LENS = tuple(range(16, 1025, 16))
@@ -49,6 +41,7 @@ MODES_READABLE = {
     "sfr-win5ifg500arq2400r4dg0": "SFR (W:5,G:0.5ms,A:2.4s)",
     "e2e": "E2E",
 }
+SFR_PATTERN = r"sfr-win(\d+)ifg(\d+)arq(\d+)r(\d+)dg(\d+)"
 
 
 def heatmap(data, row_labels, col_labels, ax=None,
@@ -74,6 +67,9 @@ def heatmap(data, row_labels, col_labels, ax=None,
     **kwargs
         All other arguments are forwarded to `imshow`.
     """
+    import numpy as np
+    from matplotlib import pyplot as plt
+    from matplotlib.ticker import MultipleLocator
 
     if not ax:
         ax = plt.gca()
@@ -150,6 +146,8 @@ def annotate_heatmap(im, data=None, valfmt="{x:.2f}",
         All other arguments are forwarded to each call to `text` used to create
         the text labels.
     """
+    import numpy as np
+    import matplotlib.ticker
 
     if not isinstance(data, (list, np.ndarray)):
         data = im.get_array()
@@ -182,74 +180,86 @@ def annotate_heatmap(im, data=None, valfmt="{x:.2f}",
     return texts
 
 
-matplotlib.rcParams["axes.labelsize"] = 6
-matplotlib.rcParams["text.usetex"] = True
-matplotlib.rcParams["pgf.rcfonts"] = False
-matplotlib.rcParams["font.family"] = "serif"
-matplotlib.rcParams["pgf.preamble"] = "\n".join([
-     "\\usepackage{units}",          # load additional packages
-     "\\usepackage{metalogo}",
- ])
-runs = 3
-_check_logs()
-plt.clf()
-networks = set()
-matrix = []
-last = 100
-for o, mode in enumerate(MODES):
-    pdrs = {s: [] for s in DATA_LENS}
-    for data_len in DATA_LENS:
-        filenames = _get_files(DELAY, mode, data_len, runs,
-                               TIMES_CSV_NAME_PATTERN_FMT)
-        comp = re.compile(NAME_PATTERN)
-        for _, filename in filenames[-runs:]:
-            filename = os.path.join(DATA_PATH, filename)
-            m = comp.search(filename)
-            assert(m is not None)
-            networks.add(m.group("network"))
-            sends = 0
-            receives = 0
-            with open(filename) as csvfile:
-                reader = csv.DictReader(csvfile, delimiter=";")
-                for row in reader:
-                    sends += 1
-                    if row["recv_time"]:
-                        receives += 1
-                if (sends > 0):
-                    pdrs[data_len].append(100 * receives / sends)
-        pdrs[data_len] = _reject_outliers(pdrs[data_len])
-    means = np.array([np.mean(pdrs[s]) for s in DATA_LENS]) \
-        .astype(np.double)
-    matrix.append(means)
-SFR_PATTERN = "sfr-win(\d+)ifg(\d+)arq(\d+)r(\d+)dg(\d+)"
-c = re.compile(SFR_PATTERN)
-modes_tuple = []
-for i, mode in enumerate(MODES):
-    m = c.match(mode)
-    if m:
-        modes_tuple.append(
-            ((int(m.group(1)),int(m.group(3)),int(m.group(2)),not int(m.group(5))), i)
-        )
-    elif mode == "hwr":
-        modes_tuple.append((tuple(4 * [0]), i))
-    else:
-        modes_tuple.append((tuple(4 * [float("inf")]), i))
-idx = [i for _, i in sorted(modes_tuple)]
-matrix = np.array(matrix) #.transpose()
-fig, ax = plt.subplots()
-
-modes = np.array(MODES)[idx]
-im, cbar = heatmap(matrix[idx, :], [MODES_READABLE[m]
-                   for i, m in enumerate(modes)], DATA_LENS, ax=ax,
-                   cmap="pink", cbarlabel="Mean packet delivery rate [%]",
-                   aspect=1.6,
-                   interpolation=None,
-                   cbar_kw={"ticks": [0, 25, 50, 75, 100],
-                            "pad": 0.1})
-plt.xlabel("UDP payload length [bytes]")
-ax.xaxis.set_label_position('top')
-plt.ylabel("Mode")
-
-fig.tight_layout()
-plt.savefig(os.path.join(DATA_PATH, "{}.pdr_hm.pdf".format(",".join(networks))), bbox_inches="tight")
-plt.savefig(os.path.join(DATA_PATH, "{}.pdr_hm.pgf".format(",".join(networks))), bbox_inches="tight")
+def setup_style():
+    import matplotlib
+
+    matplotlib.use("pgf")
+    matplotlib.rcParams["axes.labelsize"] = 6
+    matplotlib.rcParams["text.usetex"] = True
+    matplotlib.rcParams["pgf.rcfonts"] = False
+    matplotlib.rcParams["font.family"] = "serif"
+    matplotlib.rcParams["pgf.preamble"] = "\n".join([
+         "\\usepackage{units}",          # load additional packages
+         "\\usepackage{metalogo}",
+     ])
+
+
+def pdr_matrix(runs):
+    """
+    Returns the mean packet delivery ratios of each of `MODES` for each of
+    `DATA_LENS` as rows of a matrix and the networks of the runs.
+    """
+    import numpy as np
+
+    networks = set()
+    matrix = []
+    for mode in MODES:
+        means, mode_networks = _mean_pdrs(mode, runs)
+        networks.update(mode_networks)
+        matrix.append(means)
+    return np.array(matrix), networks
+
+
+def modes_order():
+    """
+    Returns the indices of `MODES` sorted by SFR window size, ARQ timeout,
+    and inter-frame gap, with HWR first and non-SFR modes last.
+    """
+    c = re.compile(SFR_PATTERN)
+    modes_tuple = []
+    for i, mode in enumerate(MODES):
+        m = c.match(mode)
+        if m:
+            modes_tuple.append(
+                ((int(m.group(1)),int(m.group(3)),int(m.group(2)),not int(m.group(5))), i)
+            )
+        elif mode == "hwr":
+            modes_tuple.append((tuple(4 * [0]), i))
+        else:
+            modes_tuple.append((tuple(4 * [float("inf")]), i))
+    return [i for _, i in sorted(modes_tuple)]
+
+
+def plot_pdr_heatmap(matrix, networks):
+    import numpy as np
+    import matplotlib.pyplot as plt
+
+    idx = modes_order()
+    fig, ax = plt.subplots()
+
+    modes = np.array(MODES)[idx]
+    im, cbar = heatmap(matrix[idx, :], [MODES_READABLE[m]
+                       for i, m in enumerate(modes)], DATA_LENS, ax=ax,
+                       cmap="pink", cbarlabel="Mean packet delivery rate [%]",
+                       aspect=1.6,
+                       interpolation=None,
+                       cbar_kw={"ticks": [0, 25, 50, 75, 100],
+                                "pad": 0.1})
+    plt.xlabel("UDP payload length [bytes]")
+    ax.xaxis.set_label_position('top')
+    plt.ylabel("Mode")
+
+    fig.tight_layout()
+    plt.savefig(os.path.join(DATA_PATH, "{}.pdr_hm.pdf".format(",".join(networks))), bbox_inches="tight")
+    plt.savefig(os.path.join(DATA_PATH, "{}.pdr_hm.pgf".format(",".join(networks))), bbox_inches="tight")
+
+
+def main(runs=3):
+    setup_style()
+    _check_logs()
+    matrix, networks = pdr_matrix(runs)
+    plot_pdr_heatmap(matrix, networks)
+
+
+if __name__ == "__main__":
+    main()
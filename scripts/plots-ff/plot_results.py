@@ -7,20 +7,15 @@
 # directory for more details.
 
 import argparse
-import copy
-import csv
 import logging
-import matplotlib
-import numpy as np
 import os
 import re
 
-from matplotlib import pyplot as plt
-from matplotlib.colors import ListedColormap, rgb_to_hsv, hsv_to_rgb, to_rgba
-from matplotlib.patches import Patch
-
 import parse_results
 
+# parse_results adds the scripts directory to the module search path
+from results_common import catalog, pool, render
+
 __author__ = "Martine S. Lenders"
 __copyright__ = "Copyright 2019 Freie Universität Berlin"
 __license__ = "LGPL v2.1"
@@ -124,6 +119,13 @@ NAME_PATTERN = parse_results.NAME_PATTERN.format(
 )
 TIMES_CSV_NAME_PATTERN_FMT = "{}.times.csv".format(parse_results.NAME_PATTERN)
 STATS_CSV_NAME_PATTERN_FMT = "{}.stats.csv".format(parse_results.NAME_PATTERN)
+CATALOG_PATTERN = r"{}\.(?P<kind>times|stats)\.csv".format(
+    parse_results.NAME_PATTERN.format(
+        mode=r"(?P<mode>(hwr|ff|e2e|sfr-\w+))",
+        data_len=r"(?P<data_len>\d+)",
+        delay=r"(?P<delay>\d+)"
+    )
+)
 
 RUNS = 3
 MODES = [
@@ -136,9 +138,14 @@ DATA_LENS = [x for x in range(16, 1025, 16)]
 DELAY = 10000
 MAX_HOPS = 7
 BAR_WIDTH = (1 / len(MODES)) - .05
+STATS_COLUMNS = ("node", "l2_retrans", "pktbuf_usage", "pktbuf_size",
+                 "rbuf_full", "vrb_full")
 
 
 def plot_l2_retrans(runs=RUNS):
+    import numpy as np
+    from matplotlib import pyplot as plt
+
     plt.clf()
     offset = {
             "hwr": -0.30,
@@ -149,25 +156,10 @@ def plot_l2_retrans(runs=RUNS):
     networks = set()
     mode_marker = {"ff": "x", "hwr": "+", "e2e": ".", "sfr-win1ifg100arq1200r4dg0": "*"}
     for mode in MODES:
-        l2_retrans = []
-        means = [[] for _ in DATA_LENS]
-        for i, data_len in enumerate(DATA_LENS, 1):
-            filenames = _get_files(DELAY, mode, data_len, runs,
-                                   STATS_CSV_NAME_PATTERN_FMT)
-            c = re.compile(NAME_PATTERN)
-            for _, filename in filenames[-runs:]:
-                filename = os.path.join(DATA_PATH, filename)
-                m = c.search(filename)
-                assert(m is not None)
-                networks.add(m.group("network"))
-                with open(filename) as csvfile:
-                    reader = csv.DictReader(csvfile, delimiter=";")
-                    for row in reader:
-                        l2_retrans.append((data_len, int(row["l2_retrans"] or 0)))
-            means[i - 1] = np.mean(
-                    [l[1] for l in l2_retrans if l[0] == data_len]
-                )
-        means = np.array(means)
+        stats, mode_networks = _load_stats(mode, runs)
+        networks.update(mode_networks)
+        l2_retrans = np.nan_to_num(stats["l2_retrans"], nan=0)
+        means, _ = _group_stats(stats["data_len"], l2_retrans)
         means_mask = np.isfinite(means)
         index = np.array(DATA_LENS)
         if plt.rcParams["text.usetex"]:
@@ -178,8 +170,7 @@ def plot_l2_retrans(runs=RUNS):
                  marker=mode_marker[mode],
                  label=MODES_READABLE[mode],
                  **markeropts)
-        plt.scatter([l[0] + offset[mode] for l in l2_retrans],
-                    [l[1] for l in l2_retrans],
+        plt.scatter(stats["data_len"] + offset[mode], l2_retrans,
                     marker=mode_marker[mode], alpha=0.2)
     ax = plt.gca()
     ax.set_yscale("symlog")
@@ -194,40 +185,18 @@ def plot_l2_retrans(runs=RUNS):
 
 
 def plot_pktbuf(runs=RUNS):
+    import numpy as np
+    from matplotlib import pyplot as plt
+
     plt.clf()
     networks = set()
     for o, mode in enumerate(MODES):
-        pktbuf = {s: [] for s in DATA_LENS}
-        for size in DATA_LENS:
-            filenames = _get_files(DELAY, mode, size, runs,
-                                   STATS_CSV_NAME_PATTERN_FMT)
-            c = re.compile(NAME_PATTERN)
-            for _, filename in filenames[-runs:]:
-                filename = os.path.join(DATA_PATH, filename)
-                m = c.search(filename)
-                assert(m is not None)
-                network = m.group("network")
-                networks.add(network)
-                sink = network.split("x")[0]
-                with open(filename) as csvfile:
-                    reader = csv.DictReader(csvfile, delimiter=";")
-                    for row in reader:
-                        if row["node"] != sink and \
-                           row["pktbuf_size"] != "" and \
-                           row["pktbuf_usage"] != "":
-                            pktbuf[size].append(
-                                    int(row["pktbuf_usage"]) /
-                                    int(row["pktbuf_size"]) * 100
-                                )
-                        elif row["pktbuf_size"] == "" or \
-                                row["pktbuf_usage"] == "":
-                            logging.warn("{}: Incomplete data set, packet "
-                                         "buffer data missing for {}"
-                                         .format(filename, row["node"]))
-        means = np.array([np.mean(pktbuf[s]) for s in DATA_LENS]) \
-            .astype(np.double)
+        stats, mode_networks = _load_stats(mode, runs)
+        networks.update(mode_networks)
+        pktbuf = stats["pktbuf_usage"] / stats["pktbuf_size"] * 100
+        valid = ~stats["sink"] & np.isfinite(pktbuf)
+        means, errs = _group_stats(stats["data_len"][valid], pktbuf[valid])
         means_mask = np.isfinite(means)
-        errs = np.array([np.std(pktbuf[s]) for s in DATA_LENS])
         index = np.array(DATA_LENS)
         style = {}
         style["color"] = COLORS[mode]
@@ -249,6 +218,9 @@ def plot_pktbuf(runs=RUNS):
 
 
 def plot_rbuf_full(runs=RUNS):
+    import numpy as np
+    from matplotlib import pyplot as plt
+
     plt.clf()
     offset = {
             "hwr": -0.3,
@@ -262,52 +234,14 @@ def plot_rbuf_full(runs=RUNS):
     mode_marker = {"ff": "x", "hwr": "+", "e2e": ".", "sfr-win1ifg100arq1200r4dg0": "*",
                    "ff_vrb": "v", "sfr-win1ifg100arq1200r4dg0_vrb": "^"}
     for mode in MODES:
-        rbuf_full = []
-        vrb_full = []
-        rbuf_full_m = [[] for _ in DATA_LENS]
-        vrb_full_m = [[] for _ in DATA_LENS]
-        for i, size in enumerate(DATA_LENS, 1):
-            filenames = _get_files(DELAY, mode, size, runs,
-                                   STATS_CSV_NAME_PATTERN_FMT)
-            c = re.compile(NAME_PATTERN)
-            for _, filename in filenames[-runs:]:
-                filename = os.path.join(DATA_PATH, filename)
-                m = c.search(filename)
-                assert(m is not None)
-                network = m.group("network")
-                networks.add(network)
-                sink = network.split("x")[0]
-                with open(filename) as csvfile:
-                    reader = csv.DictReader(csvfile, delimiter=";")
-                    for row in reader:
-                        if row["node"] != sink:
-                            if row["rbuf_full"] != "":
-                                rbuf_full.append(
-                                        (size, int(row["rbuf_full"]))
-                                    )
-                            else:
-                                logging.warn("{}: Incomplete data set, "
-                                             "reassembly buffer data "
-                                             "missing for {}"
-                                             .format(filename,
-                                                     row["node"]))
-                            if mode not in ["hwr", "e2e"] and \
-                               row["vrb_full"] != "":
-                                vrb_full.append(
-                                        (size, int(row["vrb_full"]))
-                                    )
-                            elif mode not in ["hwr", "e2e"] and \
-                                 row["vrb_full"] == "":
-                                logging.warn("{}: Incomplete data set, "
-                                             "VRB data missing for {}"
-                                             .format(filename,
-                                                     row["node"]))
-            rbuf_full_m[i - 1] = np.mean(
-                    [e[1] for e in rbuf_full if e[0] == size]
-                )
-            vrb_full_m[i - 1] = np.mean(
-                    [e[1] for e in vrb_full if e[0] == size]
-                )
+        stats, mode_networks = _load_stats(mode, runs)
+        networks.update(mode_networks)
+        valid = ~stats["sink"] & np.isfinite(stats["rbuf_full"])
+        rbuf_full = (stats["data_len"][valid], stats["rbuf_full"][valid])
+        rbuf_full_m, _ = _group_stats(*rbuf_full)
+        valid = ~stats["sink"] & np.isfinite(stats["vrb_full"])
+        vrb_full = (stats["data_len"][valid], stats["vrb_full"][valid])
+        vrb_full_m, _ = _group_stats(*vrb_full)
         means = np.array(rbuf_full_m)
         means_mask = np.isfinite(means)
         index = np.array(DATA_LENS)
@@ -318,8 +252,7 @@ def plot_rbuf_full(runs=RUNS):
         plt.plot(index[means_mask], means[means_mask],
                  marker=mode_marker[mode], label=MODES_READABLE[mode],
                  **markeropts)
-        plt.scatter([e[0] + offset[mode] for e in rbuf_full],
-                    [e[1] for e in rbuf_full],
+        plt.scatter(rbuf_full[0] + offset[mode], rbuf_full[1],
                     marker=mode_marker[mode], alpha=0.2)
         if mode not in ["hwr", "e2e"]:
             means = np.array(vrb_full_m)
@@ -329,8 +262,7 @@ def plot_rbuf_full(runs=RUNS):
                      marker=mode_marker[tmp],
                      label="{} (VRB)".format(MODES_READABLE[mode]),
                      **markeropts)
-            plt.scatter([e[0] + offset[tmp] for e in vrb_full],
-                        [e[1] for e in vrb_full],
+            plt.scatter(vrb_full[0] + offset[tmp], vrb_full[1],
                         marker=mode_marker[tmp], alpha=0.1)
     ax = plt.gca()
     ax.set_yscale("symlog")
@@ -345,35 +277,17 @@ def plot_rbuf_full(runs=RUNS):
 
 
 def plot_rbuf_full_vs_pktbuf(runs=RUNS):
+    import numpy as np
+    from matplotlib import pyplot as plt
+    from matplotlib.colors import ListedColormap, rgb_to_hsv, hsv_to_rgb, \
+                                  to_rgba
+
     plt.clf()
     mode = "ff"
-    networks = set()
-    rbuf_full = []
-    pktbuf = []
-    for i, data_len in enumerate(DATA_LENS, 1):
-        filenames = _get_files(DELAY, mode, data_len, runs,
-                               STATS_CSV_NAME_PATTERN_FMT)
-        c = re.compile(NAME_PATTERN)
-        for _, filename in filenames[-runs:]:
-            filename = os.path.join(DATA_PATH, filename)
-            m = c.search(filename)
-            assert(m is not None)
-            network = m.group("network")
-            networks.add(network)
-            sink = network.split("x")[0]
-            with open(filename) as csvfile:
-                reader = csv.DictReader(csvfile, delimiter=";")
-                for row in reader:
-                    if row["node"] != sink:
-                        rbuf_full.append(int(row["rbuf_full"] or 0))
-                        if all(row[col] != "" for col
-                                in ["pktbuf_usage", "pktbuf_size"]):
-                            pktbuf.append(100 * int(row["pktbuf_usage"]) /
-                                          int(row["pktbuf_size"]))
-                        else:
-                            pktbuf.append(np.nan)
-    rbuf_full = np.array(rbuf_full)
-    pktbuf = np.array(pktbuf)
+    stats, networks = _load_stats(mode, runs)
+    nodes = ~stats["sink"]
+    rbuf_full = np.nan_to_num(stats["rbuf_full"][nodes], nan=0)
+    pktbuf = 100 * stats["pktbuf_usage"][nodes] / stats["pktbuf_size"][nodes]
     base = rgb_to_hsv(to_rgba("#ff9800")[:3])
     colors = np.array(
             [hsv_to_rgb([base[0], base[1] * (i / 255), base[2]])
@@ -409,14 +323,39 @@ def _exp_dict(delay, mode, data_len):
     return locals()
 
 
+_catalog = None
+
+
+def _results_catalog():
+    global _catalog
+    if _catalog is None:
+        _catalog = catalog.Catalog(DATA_PATH, "ff", CATALOG_PATTERN,
+                                   index=("mode", "data_len", "delay"))
+    return _catalog
+
+
+_cube = None
+
+
+def _pdr_cube():
+    global _cube
+    if _cube is None:
+        from results_common import cube
+
+        _cube = cube.PDRCube(DATA_PATH, "ff")
+        _cube.update(_results_catalog().find(kind="times"))
+        _cube.save()
+    return _cube
+
+
 def _get_files(delay, mode, data_len, runs, pattern):
     exp_dict = _exp_dict(delay, mode, data_len)
-    pattern = pattern.format(**exp_dict)
+    c = re.compile(pattern.format(**exp_dict))
+    # the catalog already sorts by timestamp
     filenames = filter(lambda x: x[0] is not None,
-                       map(lambda f: (re.match(pattern, f), f),
-                           os.listdir(DATA_PATH)))
-    filenames = sorted(filenames,
-                       key=lambda x: int(x[0].group("timestamp")))
+                       map(lambda f: (c.match(f), f),
+                           _results_catalog().find(**exp_dict)))
+    filenames = list(filenames)
     if (len(filenames) < runs) and (len(filenames) > 0):
         logging.warning(
             "m{mode}__r{data_len}Bx{delay}ms only has {runs} of "
@@ -426,7 +365,89 @@ def _get_files(delay, mode, data_len, runs, pattern):
     return filenames
 
 
+_stats = {}
+
+
+def _warn_incomplete(filename, mode, stats, sink):
+    import numpy as np
+
+    for node in stats["node"][np.isnan(stats["pktbuf_size"]) |
+                              np.isnan(stats["pktbuf_usage"])]:
+        logging.warning("{}: Incomplete data set, packet buffer data missing "
+                        "for {}".format(filename, node))
+    for node in stats["node"][~sink & np.isnan(stats["rbuf_full"])]:
+        logging.warning("{}: Incomplete data set, reassembly buffer data "
+                        "missing for {}".format(filename, node))
+    if mode not in ["hwr", "e2e"]:
+        for node in stats["node"][~sink & np.isnan(stats["vrb_full"])]:
+            logging.warning("{}: Incomplete data set, VRB data missing for {}"
+                            .format(filename, node))
+
+
+def _load_stats(mode, runs=RUNS):
+    """
+    Returns the rows of the last `runs` stats CSVs of `mode` for each data
+    length as NumPy arrays, together with their networks. The arrays have a
+    "data_len" column with the data length of the run and a "sink" column
+    that tells if the row is of the sink of its network.
+
+    Each stats CSV is only read once, warning about incomplete rows.
+    """
+    import numpy as np
+    from results_common import columnar
+
+    if (mode, runs) not in _stats:
+        columns = {name: [] for name in STATS_COLUMNS + ("data_len", "sink")}
+        networks = set()
+        c = re.compile(NAME_PATTERN)
+        for data_len in DATA_LENS:
+            filenames = _get_files(DELAY, mode, data_len, runs,
+                                   STATS_CSV_NAME_PATTERN_FMT)
+            for _, filename in filenames[-runs:]:
+                filename = os.path.join(DATA_PATH, filename)
+                m = c.search(filename)
+                assert(m is not None)
+                network = m.group("network")
+                networks.add(network)
+                stats = columnar.read(filename)
+                sink = stats["node"] == network.split("x")[0]
+                _warn_incomplete(filename, mode, stats, sink)
+                for name in STATS_COLUMNS:
+                    columns[name].append(stats[name])
+                columns["data_len"].append(np.full(len(sink), data_len))
+                columns["sink"].append(sink)
+        _stats[mode, runs] = (
+            {name: np.concatenate(arrays) if arrays else
+             np.empty(0, dtype=bool if name == "sink" else float)
+             for name, arrays in columns.items()},
+            networks
+        )
+    return _stats[mode, runs]
+
+
+def _group_stats(data_lens, values):
+    """
+    Returns the mean and standard deviation of the `values` for each of
+    `DATA_LENS`, NaN for data lengths without values.
+
+    >>> import numpy as np
+    >>> _group_stats(np.array([16, 16, 48]), np.array([1., 3., 4.]))[0][:4]
+    array([ 2., nan,  4., nan])
+    """
+    import numpy as np
+
+    groups = np.searchsorted(DATA_LENS, data_lens)
+    counts = np.bincount(groups, minlength=len(DATA_LENS))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.bincount(groups, values, minlength=len(DATA_LENS)) / counts
+        stds = np.sqrt(np.bincount(groups, (values - means[groups]) ** 2,
+                                   minlength=len(DATA_LENS)) / counts)
+    return means, stds
+
+
 def _reject_outliers(data, m=2):
+    import numpy as np
+
     d = np.abs(data - np.median(data))
     mdev = np.median(d)
     s = d / mdev if mdev else 0.
@@ -434,8 +455,40 @@ def _reject_outliers(data, m=2):
     return data[s < m]
 
 
+def _mean_pdrs(mode, runs=RUNS):
+    """
+    Returns the mean packet delivery ratio in percent of the last `runs` runs
+    of `mode` for each of `DATA_LENS`, without outliers, together with the
+    networks of those runs.
+    """
+    import numpy as np
+
+    pdr_cube = _pdr_cube()
+    networks = set()
+    pdrs = {s: [] for s in DATA_LENS}
+    c = re.compile(NAME_PATTERN)
+    for data_len in DATA_LENS:
+        filenames = _get_files(DELAY, mode, data_len, runs,
+                               TIMES_CSV_NAME_PATTERN_FMT)
+        for _, filename in filenames[-runs:]:
+            filename = os.path.join(DATA_PATH, filename)
+            m = c.search(filename)
+            assert(m is not None)
+            networks.add(m.group("network"))
+            sends = pdr_cube.sends(filename)
+            if (sends > 0):
+                pdrs[data_len].append(
+                    100 * pdr_cube.receives(filename) / sends
+                )
+        pdrs[data_len] = _reject_outliers(pdrs[data_len])
+    means = np.array([np.mean(pdrs[s]) for s in DATA_LENS]).astype(np.double)
+    return means, networks
+
+
 def _plot_show_and_save(networks, plotname, title, ylabel, runs,
                         ylim=None, legends=None):
+    from matplotlib import pyplot as plt
+
     plt.xlim(16, DATA_LENS[-1])
     if ylim is not None:
         if issubclass(type(ylim), dict):
@@ -477,6 +530,8 @@ def _plot_show_and_save(networks, plotname, title, ylabel, runs,
 
 
 def _savefig(filename):
+    from matplotlib import pyplot as plt
+
     if "figsize" in SAVEFIG_OPTS:
         fig = plt.gcf()
         fig.set_size_inches(*SAVEFIG_OPTS["figsize"])
@@ -484,7 +539,31 @@ def _savefig(filename):
     plt.savefig(filename, **SAVEFIG_OPTS)
 
 
+def _preload_stats(runs=RUNS):
+    """
+    Returns the stats of all modes as cached by `_load_stats()`, to be
+    handed to the render workers by `_init_worker()`.
+    """
+    for mode in MODES:
+        _load_stats(mode, runs)
+    return dict(_stats)
+
+
+def _init_worker(stats, pgf=False, figsize=100):
+    # the stats were loaded by the parent process, so the workers read
+    # neither the stats files nor the catalog
+    _stats.update(stats)
+    _configure_plot(pgf, figsize)
+
+
 def _configure_plot(pgf=False, figsize=100):
+    import matplotlib
+
+    if pgf:
+        # select the backend before pyplot is imported
+        matplotlib.use("pgf")
+    from matplotlib import pyplot as plt
+
     plt.rc("errorbar", capsize=3)
     SAVEFIG_OPTS["figsize"] = (100, 80)
     if pgf:
@@ -492,7 +571,6 @@ def _configure_plot(pgf=False, figsize=100):
         scriptsize = 7 * (figsize / 100)
         SAVEFIG_OPTS["figsize"] = (3.27835 * (figsize / 100),
                                    1.84409 * (figsize / 100))
-        matplotlib.use("pgf")
         plt.subplots_adjust(0, 0)
         plt.rc("text", usetex=True)
         plt.rc("errorbar", capsize=2)
@@ -517,17 +595,12 @@ def _configure_plot(pgf=False, figsize=100):
 
 
 def _check_logs():
-    comp = re.compile(parse_results.LOG_NAME_PATTERN)
-    for logname in os.listdir(DATA_PATH):
-        match = comp.match(logname)
-        if match is not None:
-            logname = os.path.join(DATA_PATH, logname)
-            if os.path.exists(parse_results.times_csvname(logname)) and \
-               os.path.exists(parse_results.stats_csvname(logname)):
-                # don't redo existing logs
-                continue
-            parse_results.log_to_csvs(logname, data_path=DATA_PATH,
-                                      **parse_results.match_to_dict(match))
+    # only converts logs that changed or were not converted yet
+    try:
+        parse_results.logs_to_csvs(data_path=DATA_PATH)
+    except parse_results.LogError as exc:
+        # the failed logs are logged by logs_to_csvs(), plot the others
+        logging.error(exc)
 
 
 PLOT_FUNCTIONS = {
@@ -549,6 +622,9 @@ def main():
     parser.add_argument("-f", "--figsize", nargs="?", default=100, type=int,
                         help="With --pgf: size of the figure in percent, "
                              "ignored without --pgf (default: 100%%)")
+    parser.add_argument("-j", "--jobs", type=int, default=pool.default_jobs(),
+                        help="Number of plots to render in parallel "
+                             "(default: number of CPUs)")
     parser.add_argument("result", nargs="*", help="Results to plot "
                         "(default: {})".format(
                             ' '.join(sorted(PLOT_FUNCTIONS.keys()))
@@ -556,10 +632,19 @@ def main():
     args = parser.parse_args()
     if not args.result:
         args.result = sorted(PLOT_FUNCTIONS.keys())
-    _configure_plot(args.pgf, args.figsize)
     _check_logs()
-    for result in args.result:
-        PLOT_FUNCTIONS[result](runs=args.runs)
+    # each plot is rendered in its own worker process, set up by
+    # _init_worker() with the stats loaded once here
+    errors = render.run(
+        [(result, PLOT_FUNCTIONS[result], (args.runs,))
+         for result in args.result],
+        _init_worker, (_preload_stats(args.runs), args.pgf, args.figsize),
+        jobs=args.jobs
+    )
+    if errors:
+        raise RuntimeError("{} of {} plots failed to render: {}".format(
+            len(errors), len(args.result), ", ".join(sorted(errors))
+        ))
 
 
 if __name__ == "__main__":
@@ -14,6 +14,12 @@ import matplotlib.pyplot as plt
 import numpy as np
 import os
 import re
+import sys
+
+SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(SCRIPT_PATH, ".."))
+
+from results_common import files  # noqa: E402
 
 PATTERN = r"_m(?P<mode>[a-z0-9]+)(-win(?P<win>\d+)ifg(?P<ifg>\d+)" \
           r"arq(?P<arq>\d+)r(?P<frag_retries>\d+)" \
@@ -120,8 +126,13 @@ def build_csv():
                 if mode[1][4] not in DG_RETRIES:
                     printProgressBar(progress, listdir_len, prefix=prefix)
                     continue
+            if files.uncompressed_name(filename) != filename and \
+               files.uncompressed_name(filename) in listdir:
+                # counted with the uncompressed log
+                printProgressBar(progress, listdir_len, prefix=prefix)
+                continue
             log["sent"] = 0
-            with open(os.path.join(DATA_PATH, filename)) as f:
+            with files.open_log(os.path.join(DATA_PATH, filename), "rt") as f:
                 for line in f:
                     m = re.search(OUT_PATTERN, line)
                     if m is not None:
@@ -0,0 +1,9 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+"""
+Helpers shared by the result parsers in `plots-ff` and `plots-cc`
+"""
@@ -0,0 +1,173 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+
+import contextlib
+import hashlib
+import os
+import re
+import sqlite3
+import time
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+# the catalog is kept on local storage, as the results directory may be on a
+# network file system such as NFS, where SQLite's locking is unreliable
+CACHE_PATH = os.environ.get(
+    'CACHE_PATH',
+    os.path.join(os.environ.get('XDG_CACHE_HOME',
+                                os.path.join(os.path.expanduser('~'),
+                                             '.cache')),
+                 'ieee-access-6lowpan-2021')
+)
+CATALOG_NAME = 'results.sqlite'
+# a directory modified less than this ago may still be modified within the
+# same modification time, so its modification time is not remembered
+_RACY_NS = 2 * 10 ** 9
+
+
+def catalog_dir(data_path):
+    """
+    Returns the directory under `CACHE_PATH` for the catalog of the results
+    directory `data_path`, named after its absolute path, and creates it if
+    it does not exist yet.
+    """
+    data_path = os.path.realpath(data_path)
+    name = hashlib.sha256(data_path.encode()).hexdigest()[:16]
+    res = os.path.join(CACHE_PATH,
+                       f'{os.path.basename(data_path)}-{name}')
+    os.makedirs(res, exist_ok=True)
+    return res
+
+
+class Catalog:
+    """
+    Index of the files in `data_path` whose names match `pattern`, kept in
+    table `table` of an SQLite database in `catalog_dir(data_path)`. Each
+    named group of `pattern` is a column of the table, the `index` columns
+    are indexed.
+
+    The index is updated incrementally: only if the directory changed since
+    the last update, it is listed again, and only new names are matched
+    against `pattern`.
+    """
+    def __init__(self, data_path, table, pattern, index=()):
+        self.data_path = data_path
+        self.table = table
+        self._pattern = re.compile(pattern)
+        self._columns = list(self._pattern.groupindex)
+        self._index = index
+        self._db = sqlite3.connect(
+            os.path.join(catalog_dir(data_path), CATALOG_NAME), timeout=60
+        )
+        self._mtime_ns = None
+        self._setup()
+
+    def close(self):
+        self._db.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # takes the write lock before anything is read, so processes
+        # updating the catalog at the same time do not act on the same
+        # stale state
+        with self._db:
+            self._db.execute('BEGIN IMMEDIATE')
+            yield
+
+    def _meta(self, key, default=None):
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?',
+                               (f'{self.table}.{key}',)).fetchone()
+        return default if row is None else row[0]
+
+    def _set_meta(self, key, value):
+        self._db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                         (f'{self.table}.{key}', value))
+
+    def _setup(self):
+        columns = ', '.join(f'"{column}" TEXT' for column in self._columns)
+        with self._transaction():
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)'
+            )
+            if self._meta('pattern') != self._pattern.pattern:
+                # the columns may have changed, so start from scratch
+                self._db.execute(f'DROP TABLE IF EXISTS "{self.table}"')
+                self._set_meta('pattern', self._pattern.pattern)
+                self._set_meta('mtime_ns', None)
+            self._db.execute(
+                f'CREATE TABLE IF NOT EXISTS "{self.table}" '
+                f'(name TEXT PRIMARY KEY, {columns})'
+            )
+            if self._index:
+                index = ', '.join(f'"{column}"' for column in self._index)
+                self._db.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{self.table}_query" '
+                    f'ON "{self.table}" ({index})'
+                )
+
+    def refresh(self):
+        mtime_ns = os.stat(self.data_path).st_mtime_ns
+        if mtime_ns == self._mtime_ns:
+            return
+        if time.time_ns() - mtime_ns < _RACY_NS:
+            mtime_ns = None
+        with self._transaction():
+            if mtime_ns is None or self._meta('mtime_ns') != mtime_ns:
+                self._update(os.listdir(self.data_path))
+                self._set_meta('mtime_ns', mtime_ns)
+        self._mtime_ns = mtime_ns
+
+    def _update(self, listdir):
+        names = set(listdir)
+        known = {name for name, in self._db.execute(
+            f'SELECT name FROM "{self.table}"'
+        )}
+        self._db.executemany(f'DELETE FROM "{self.table}" WHERE name = ?',
+                             ((name,) for name in known - names))
+        rows = []
+        for name in names - known:
+            match = self._pattern.match(name)
+            if match is not None:
+                rows.append([name] + [match[c] for c in self._columns])
+        placeholders = ', '.join('?' * (len(self._columns) + 1))
+        self._db.executemany(
+            f'INSERT OR IGNORE INTO "{self.table}" VALUES ({placeholders})',
+            rows
+        )
+
+    def find(self, order_by='timestamp', **where):
+        """
+        Returns the names of all files with the given column values, sorted
+        numerically by the column `order_by`. A value of `None` selects
+        files without that column, a tuple of values files with any of them.
+
+        Values are compared as strings, as they were found in the names.
+        """
+        self.refresh()
+        conditions = []
+        params = []
+        for column, values in where.items():
+            if not isinstance(values, tuple):
+                values = (values,)
+            alternatives = []
+            for value in values:
+                if value is None:
+                    alternatives.append(f'"{column}" IS NULL')
+                else:
+                    alternatives.append(f'"{column}" = ?')
+                    params.append(str(value))
+            conditions.append(f'({" OR ".join(alternatives)})')
+        query = f'SELECT name FROM "{self.table}"'
+        if conditions:
+            query += f' WHERE {" AND ".join(conditions)}'
+        query += f' ORDER BY CAST("{order_by}" AS INTEGER), name'
+        with contextlib.closing(self._db.execute(query, params)) as cursor:
+            return [name for name, in cursor]
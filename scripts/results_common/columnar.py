@@ -0,0 +1,245 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+# pylint: disable=import-outside-toplevel
+
+import array
+import contextlib
+import csv
+import os
+
+from . import files
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+CATEGORY = 'category'
+INT = 'int'
+FLOAT = 'float'
+
+# type of each column of the times, stats, and cong CSVs of both parsers and
+# of the CSVs of the captures
+COLUMN_TYPES = {
+    # times
+    'mode': CATEGORY,
+    'data_len': INT,
+    'src': CATEGORY,
+    'dst': CATEGORY,
+    'hops_to_sink': INT,
+    'pkt_id': INT,
+    'src_addr': CATEGORY,
+    'send_time': FLOAT,
+    'recv_time': FLOAT,
+    'send_errno': FLOAT,
+    # stats
+    'node': CATEGORY,
+    'successors': INT,
+    'l2_retrans': FLOAT,
+    'pktbuf_usage': FLOAT,
+    'pktbuf_size': FLOAT,
+    'rbuf_full': FLOAT,
+    'rb_full': FLOAT,
+    'vrb_full': FLOAT,
+    'frag_comp': FLOAT,
+    'frags_comp': FLOAT,
+    'dg_comp': FLOAT,
+    'dgs_comp': FLOAT,
+    # cong
+    'time': FLOAT,
+    'type': CATEGORY,
+    'tag': INT,
+    'cwnd': FLOAT,
+    'ifg': FLOAT,
+    'resource_usage': FLOAT,
+    'fbuf_usage': FLOAT,
+    # captures
+    'sniffer': INT,
+    'seq': INT,
+    'kind': CATEGORY,
+    'size': INT,
+    'offset': INT,
+    'frame_len': INT,
+    'retrans': INT,
+    'frames': INT,
+    'airtime': FLOAT,
+    'forwarded': INT,
+    'fwd_delay_mean': FLOAT,
+    'fwd_delay_min': FLOAT,
+    'fwd_delay_max': FLOAT,
+}
+CATEGORIES_SUFFIX = '.categories'
+# modification time and size of the CSV an .npz file was written alongside
+SOURCE = '.source'
+
+# array typecode and value for missing fields of each column type
+_TYPECODES = {CATEGORY: 'i', INT: 'q', FLOAT: 'd'}
+_MISSING = {CATEGORY: -1, INT: -1, FLOAT: float('nan')}
+_DTYPES = {CATEGORY: 'str', INT: 'int64', FLOAT: 'float64'}
+
+
+def npz_name(csvname):
+    """
+    >>> npz_name('test.times.csv')
+    'test.times.npz'
+    """
+    return f'{csvname[:-len(".csv")]}.npz'
+
+
+def _version(stat):
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class NPZWriter:
+    """
+    Collects rows like `csv.DictWriter` with the given `fieldnames` column by
+    column, so they can be saved as a compressed NumPy `.npz` file.
+
+    Integer columns are stored as int64, all other numbers as float64, and
+    strings (see `COLUMN_TYPES`) dictionary-encoded as int32 codes into a
+    `<column>.categories` array. Missing fields are stored as -1 in integer
+    and string columns and as NaN in float columns.
+    """
+    def __init__(self, fieldnames):
+        self.fieldnames = fieldnames
+        self._columns = {
+            name: (COLUMN_TYPES[name],
+                   array.array(_TYPECODES[COLUMN_TYPES[name]]))
+            for name in fieldnames
+        }
+        self._categories = {name: {} for name in fieldnames
+                            if COLUMN_TYPES[name] == CATEGORY}
+
+    def writerow(self, row):
+        for name, (typ, column) in self._columns.items():
+            value = row.get(name)
+            if value is None or value == '':
+                column.append(_MISSING[typ])
+            elif typ == CATEGORY:
+                categories = self._categories[name]
+                column.append(categories.setdefault(str(value),
+                                                    len(categories)))
+            else:
+                column.append(value)
+
+    def arrays(self):
+        import numpy as np
+
+        arrays = {}
+        for name, (_, column) in self._columns.items():
+            arrays[name] = np.array(column)
+            if name in self._categories:
+                arrays[name + CATEGORIES_SUFFIX] = np.array(
+                    list(self._categories[name]), dtype=str
+                )
+        return arrays
+
+    def save(self, filename, source=None):
+        """
+        Saves the columns to `filename`, with the modification time and size
+        of the `os.stat_result` `source` if given.
+        """
+        import numpy as np
+
+        arrays = self.arrays()
+        if source is not None:
+            arrays[SOURCE] = np.array(_version(source), dtype=np.int64)
+        with files.atomic_open(filename, 'wb') as npzfile:
+            np.savez_compressed(npzfile, **arrays)
+
+
+class _Tee:
+    # pylint: disable=too-few-public-methods
+    def __init__(self, *writers):
+        self.writers = writers
+        self.fieldnames = writers[0].fieldnames
+
+    def writerow(self, row):
+        for writer in self.writers:
+            writer.writerow(row)
+
+
+@contextlib.contextmanager
+def also_npz(csv_writer, csvfile, filename, writer_cls=NPZWriter):
+    """
+    Returns a writer that writes each row to `csv_writer` and to the `.npz`
+    file `filename`, using a `writer_cls` like `NPZWriter`. The `.npz` file
+    is only written if the context is left without an exception. It records
+    the modification time and size of `csvfile`, the file `csv_writer` writes
+    to, so it is only used while the CSV is unchanged, see `is_current()`.
+    No more rows may be written to `csvfile` after the context is left.
+    """
+    npz_writer = writer_cls(csv_writer.fieldnames)
+    yield _Tee(csv_writer, npz_writer)
+    # the CSV is usually still a temporary file here and only moved into
+    # place afterwards, which keeps its modification time
+    csvfile.flush()
+    npz_writer.save(filename, os.fstat(csvfile.fileno()))
+
+
+def is_current(npzname, csvname):
+    """
+    Returns whether the `.npz` file `npzname` was written alongside the CSV
+    file `csvname` as it is now, see `also_npz()`.
+    """
+    import numpy as np
+
+    try:
+        version = _version(os.stat(csvname))
+        with np.load(npzname) as npz:
+            return SOURCE in npz.files and npz[SOURCE].tolist() == version
+    except FileNotFoundError:
+        return False
+
+
+def load(filename):
+    """
+    Returns the columns of an `.npz` file written by `NPZWriter` as a
+    dictionary of NumPy arrays. String columns are decoded, with missing
+    values as empty strings.
+    """
+    import numpy as np
+
+    columns = {}
+    with np.load(filename) as npz:
+        for name in npz.files:
+            if name.endswith(CATEGORIES_SUFFIX) or name == SOURCE:
+                continue
+            column = npz[name]
+            if name + CATEGORIES_SUFFIX in npz.files:
+                # code -1 (missing) selects the appended empty string
+                categories = np.append(npz[name + CATEGORIES_SUFFIX], '')
+                column = categories[column]
+            columns[name] = column
+    return columns
+
+
+def read(csvname):
+    """
+    Returns the columns of the CSV file `csvname` like `load()`. They are
+    loaded from the `.npz` file written alongside it if the CSV did not
+    change since, otherwise the CSV is parsed according to `COLUMN_TYPES`.
+    """
+    import numpy as np
+
+    npzname = npz_name(csvname)
+    if is_current(npzname, csvname):
+        return load(npzname)
+    with open(csvname) as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=';')
+        values = {name: [] for name in reader.fieldnames or ()}
+        for row in reader:
+            for name, column in values.items():
+                column.append(row[name])
+    columns = {}
+    for name, column in values.items():
+        typ = COLUMN_TYPES.get(name, CATEGORY)
+        if typ != CATEGORY:
+            column = [v if v else _MISSING[typ] for v in column]
+        columns[name] = np.array(column, dtype=_DTYPES[typ])
+    return columns
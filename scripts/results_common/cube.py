@@ -0,0 +1,149 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+
+import collections
+import os
+
+import numpy as np
+
+from . import catalog
+from . import columnar
+from . import files
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+CUBE_NAME_FMT = 'pdr_cube.{name}.npz'
+
+_Run = collections.namedtuple(
+    '_Run', ['size', 'mtime_ns', 'received', 'hops', 'latencies']
+)
+
+
+def _read_times(filename):
+    """
+    Returns for each row of the times CSV `filename`, in order, whether the
+    packet was received, its hops to the sink, and its latency in
+    milliseconds (NaN if it was not received).
+    """
+    columns = columnar.read(filename)
+    recv_times = columns['recv_time']
+    received = ~np.isnan(recv_times)
+    return (received, columns['hops_to_sink'].astype(np.int16),
+            1000 * (recv_times - columns['send_time']))
+
+
+class PDRCube:
+    """
+    Sent and received packets and latencies of the received packets by hops
+    to the sink of each times CSV (i.e. each run of an experiment) in
+    `data_path`, kept in `pdr_cube.<name>.npz` next to the catalog of
+    `data_path` (see `catalog.catalog_dir()`).
+
+    A times CSV is only read again if its size or modification time changed,
+    so the PDR and latency plots do not need to parse the times CSVs
+    themselves.
+    """
+    def __init__(self, data_path, name):
+        self.data_path = data_path
+        self.filename = os.path.join(catalog.catalog_dir(data_path),
+                                     CUBE_NAME_FMT.format(name=name))
+        self._runs = {}
+        self._changed = False
+        try:
+            with np.load(self.filename) as npz:
+                self._load(npz)
+        except FileNotFoundError:
+            pass
+
+    def _load(self, npz):
+        arrays = {name: npz[name] for name in npz.files}
+        offsets = arrays['offsets']
+        for i, name in enumerate(arrays['names']):
+            rows = slice(offsets[i], offsets[i + 1])
+            self._runs[str(name)] = _Run(
+                int(arrays['sizes'][i]), int(arrays['mtimes_ns'][i]),
+                arrays['received'][rows], arrays['hops'][rows],
+                arrays['latencies'][rows],
+            )
+
+    def _run(self, timesname):
+        name = os.path.basename(timesname)
+        filename = os.path.join(self.data_path, name)
+        stat = os.stat(filename)
+        run = self._runs.get(name)
+        if run is None or run.size != stat.st_size or \
+           run.mtime_ns != stat.st_mtime_ns:
+            run = self._runs[name] = _Run(stat.st_size, stat.st_mtime_ns,
+                                          *_read_times(filename))
+            self._changed = True
+        return run
+
+    def update(self, timesnames):
+        """
+        Adds the times CSVs `timesnames` that are new or changed to the cube
+        and removes those of times CSVs that no longer exist.
+        """
+        for name in timesnames:
+            self._run(name)
+        for name in list(self._runs):
+            if not os.path.exists(os.path.join(self.data_path, name)):
+                del self._runs[name]
+                self._changed = True
+
+    def save(self):
+        if not self._changed:
+            return
+        names = sorted(self._runs)
+        runs = [self._runs[name] for name in names]
+        offsets = np.cumsum([0] + [len(run.received) for run in runs])
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+
+        def column(field, dtype):
+            return np.concatenate(
+                [np.asarray(getattr(run, field), dtype=dtype) for run in runs]
+                or [np.empty(0, dtype=dtype)]
+            )
+
+        with files.atomic_open(self.filename, 'wb') as npzfile:
+            np.savez_compressed(
+                npzfile, names=np.array(names, dtype=str), offsets=offsets,
+                sizes=np.array([run.size for run in runs], dtype=np.int64),
+                mtimes_ns=np.array([run.mtime_ns for run in runs],
+                                   dtype=np.int64),
+                received=column('received', bool),
+                hops=column('hops', np.int16),
+                latencies=column('latencies', np.float64),
+            )
+        self._changed = False
+
+    def sends(self, timesname):
+        return len(self._run(timesname).received)
+
+    def receives(self, timesname):
+        return int(np.count_nonzero(self._run(timesname).received))
+
+    def received(self, timesname):
+        """
+        Returns whether each packet of the times CSV `timesname` was received,
+        in the order of its rows.
+        """
+        return self._run(timesname).received
+
+    def latencies(self, timesname):
+        """
+        Returns the latencies in milliseconds of the received packets of the
+        times CSV `timesname` by their hops to the sink, each in the order of
+        the rows.
+        """
+        run = self._run(timesname)
+        hops = run.hops[run.received]
+        latencies = run.latencies[run.received]
+        return {int(h): latencies[hops == h] for h in np.unique(hops)}
@@ -0,0 +1,198 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+
+import contextlib
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import tempfile
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+
+def _umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# read once, as reading the umask requires setting it
+_UMASK = _umask()
+
+
+@contextlib.contextmanager
+def atomic_open(filename, mode='w'):
+    """
+    Opens a temporary file next to `filename` for writing and moves it to
+    `filename` when the context is left without an exception. Otherwise the
+    temporary file is removed, so `filename` is never left half-written.
+    The file gets the permissions `open()` would create it with.
+    """
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(prefix=f'.{basename}.', suffix='.tmp',
+                                   dir=dirname)
+    try:
+        # mkstemp() creates the file only readable by the user
+        os.fchmod(fd, 0o666 & ~_UMASK)
+        with os.fdopen(fd, mode) as file:
+            yield file
+        os.replace(tmpname, filename)
+    except BaseException:
+        os.remove(tmpname)
+        raise
+
+
+# magic bytes at the start of a compressed file and the suffix of its name
+COMPRESSIONS = {
+    'gzip': (b'\x1f\x8b', '.gz'),
+    'xz': (b'\xfd7zXZ\x00', '.xz'),
+    'zstd': (b'\x28\xb5\x2f\xfd', '.zst'),
+}
+
+
+def compression(filename):
+    """
+    Returns the name of the compression of the file `filename`, as found in
+    `COMPRESSIONS`, detected from its first bytes, or `None` if it is not
+    compressed.
+    """
+    with open(filename, 'rb') as file:
+        head = file.read(max(len(magic) for magic, _ in COMPRESSIONS.values()))
+    for name, (magic, _) in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def uncompressed_name(filename):
+    """
+    Returns `filename` without the suffix of a compressed file.
+
+    >>> uncompressed_name('test.log.gz')
+    'test.log'
+    >>> uncompressed_name('test.log')
+    'test.log'
+    """
+    for _, suffix in COMPRESSIONS.values():
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+
+class ReadHash:
+    """
+    SHA-256 hash of the bytes of a file as they are read through
+    `open_log()`, so a file that is read anyway does not need to be read
+    again to be hashed. `size` is the number of bytes hashed so far.
+    """
+    def __init__(self):
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def update(self, data):
+        self._sha256.update(data)
+        self.size += len(data)
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+
+class _HashingReader(io.RawIOBase):
+    def __init__(self, file, read_hash):
+        super().__init__()
+        self._file = file
+        self.read_hash = read_hash
+
+    def readable(self):
+        return True
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def readinto(self, buffer):
+        size = self._file.readinto(buffer)
+        if size:
+            self.read_hash.update(memoryview(buffer)[:size])
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+def hash_mapped(logfile, buf):
+    """
+    Feeds the bytes of the memory-mapped `buf` of `logfile` that were not
+    read through it into the `ReadHash` `logfile` was opened with, if any.
+    """
+    raw = getattr(logfile, 'raw', None)
+    if isinstance(raw, _HashingReader):
+        raw.read_hash.update(buf[raw.read_hash.size:])
+
+
+def _close_with(file, fileobj):
+    # gzip and lzma files do not close a file object they were given
+    close = file.close
+
+    def _close():
+        try:
+            close()
+        finally:
+            fileobj.close()
+    file.close = _close
+    return file
+
+
+def _open_zstd(fileobj, filename):
+    try:
+        # pylint: disable=import-outside-toplevel
+        import zstandard
+    except ImportError as exc:
+        fileobj.close()
+        raise ImportError(f'zstandard is required to read {filename}, '
+                          f'install it with `pip3 install zstandard`') \
+            from exc
+    reader = zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=True)
+    return io.BufferedReader(reader)
+
+
+def open_log(filename, mode='rb', encoding=None, errors=None,
+             read_hash=None):
+    """
+    Opens the file `filename` for reading, decompressing it while it is read
+    if it is compressed with gzip, xz, or zstd. The compression is detected
+    from the first bytes of the file, not its name, so the file is never
+    decompressed to disk. With `mode` `'rt'` the lines are decoded with
+    `encoding` and `errors`. The bytes of the file as they are read, before
+    decompression, are fed into the `ReadHash` `read_hash` if given.
+    """
+    if mode not in ('rb', 'rt'):
+        raise ValueError(f'invalid mode {mode!r}')
+    codec = compression(filename)
+    # pylint: disable=consider-using-with
+    fileobj = open(filename, 'rb')
+    if read_hash is not None:
+        fileobj = io.BufferedReader(_HashingReader(fileobj, read_hash))
+    if codec == 'gzip':
+        file = _close_with(gzip.GzipFile(fileobj=fileobj, mode='rb'),
+                           fileobj)
+    elif codec == 'xz':
+        file = _close_with(lzma.LZMAFile(fileobj, 'rb'), fileobj)
+    elif codec == 'zstd':
+        file = _open_zstd(fileobj, filename)
+    else:
+        file = fileobj
+    if mode == 'rb':
+        return file
+    return io.TextIOWrapper(file, encoding=encoding, errors=errors)
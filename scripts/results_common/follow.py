@@ -0,0 +1,240 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+
+import collections
+import json
+import os
+import time
+
+from . import files
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+# seconds to wait for a log to grow before reading it again
+POLL_INTERVAL = .5
+# seconds a log may not grow before it is considered finished
+IDLE_TIMEOUT = 120
+# seconds between two updates of the status file
+STATUS_INTERVAL = 5
+# seconds of log time the rolling PDR is computed over
+PDR_WINDOW = 60
+# seconds of log time a packet may be in flight before it is counted
+PDR_GRACE = 5
+
+
+def status_name(logname):
+    """
+    Returns the name of the status file for the log `logname`.
+
+    >>> status_name('test.log')
+    'test.status.json'
+    """
+    return f'{os.path.splitext(files.uncompressed_name(logname))[0]}' \
+           '.status.json'
+
+
+def tail(logfile, on_poll=None, poll_interval=POLL_INTERVAL,
+         idle_timeout=IDLE_TIMEOUT):
+    """
+    Yields the lines of the binary file `logfile` like iterating over it
+    does, but at the end of the file waits for more lines to be appended,
+    e.g. by the serial aggregator of a run in progress. A line is only
+    yielded once it is complete. `on_poll` is called whenever the end of the
+    file is reached, and at least every `poll_interval` seconds while lines
+    are read, e.g. while catching up with a long log. Stops once the file
+    did not grow for `idle_timeout` seconds.
+    """
+    partial = b''
+    last_growth = last_poll = time.monotonic()
+    while True:
+        line = logfile.readline()
+        if line:
+            last_growth = time.monotonic()
+            if on_poll is not None and \
+               last_growth - last_poll >= poll_interval:
+                on_poll()
+                last_poll = last_growth
+            if not line.endswith(b'\n'):
+                partial += line
+                continue
+            if partial:
+                line = partial + line
+                partial = b''
+            yield line
+            continue
+        if on_poll is not None:
+            on_poll()
+            last_poll = time.monotonic()
+        if time.monotonic() - last_growth >= idle_timeout:
+            break
+        time.sleep(poll_interval)
+    if partial:
+        yield partial
+
+
+class RollingPDR:
+    """
+    Wraps the `window.ReorderWindow` `times` of a parser following a log and
+    counts the sent and received packets passed to it by source node. The
+    packet delivery ratio over the packets sent within the last `window`
+    seconds of log time, and the totals so far, are published per source and
+    per hop count to `sink` as JSON at most every `interval` seconds by
+    `maybe_publish()`. Packets sent in the last `grace` seconds of log time
+    are not counted yet as they might still be in flight. `hops_to_sink`
+    returns the hop count of a source or `None` if it is not known yet.
+    `sources` returns the nodes expected to send, so they are published
+    before their first packet, or nothing if they are not known yet.
+
+    >>> class Times(dict):
+    ...     def update(self, key, record):
+    ...         self.setdefault(key, {}).update(record)
+    >>> pdr = RollingPDR(Times(), 'test.status.json', lambda src: 1,
+    ...                  lambda: ['m3-1', 'm3-2', 'm3-3'], window=10, grace=1)
+    >>> pdr.update(('m3-1', 0), {'src': 'm3-1', 'send_time': 100.0})
+    >>> pdr.update(('m3-1', 1), {'src': 'm3-1', 'send_time': 101.0})
+    >>> pdr.update(('m3-1', 0), {'src': 'm3-1', 'recv_time': 100.5})
+    >>> pdr.update(('m3-2', 0), {'src': 'm3-2', 'send_time': 102.0})
+    >>> status = pdr.status()
+    >>> status['sources']['m3-1']['pdr'], status['hops']['1']['sent']
+    (0.5, 2)
+    >>> status['sources']['m3-2']['pdr'] is None
+    True
+    >>> status['sources']['m3-3']['total_sent']
+    0
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, times, sink, hops_to_sink=None, sources=None,
+                 window=PDR_WINDOW, grace=PDR_GRACE, interval=STATUS_INTERVAL):
+        # pylint: disable=too-many-arguments
+        self._times = times
+        self.sink = sink
+        self._hops_to_sink = hops_to_sink
+        self._sources = sources
+        self.window = window
+        self.grace = grace
+        self.interval = interval
+        self.log_time = None
+        self.last_recv = None
+        # packets in the window as [send_time, src, key, received] in the
+        # order they were sent
+        self._sent = collections.deque()
+        self._in_window = {}
+        self._totals = collections.defaultdict(lambda: [0, 0, None])
+        self._last_publish = None
+
+    def __contains__(self, key):
+        return key in self._times
+
+    def __len__(self):
+        return len(self._times)
+
+    def update(self, key, record):
+        self._times.update(key, record)
+        if 'send_time' in record:
+            self._sent_packet(key, record['src'], record['send_time'])
+        if 'recv_time' in record:
+            self._received_packet(key, record['src'], record['recv_time'])
+
+    def flush(self):
+        self._times.flush()
+
+    def _advance(self, log_time):
+        if self.log_time is None or log_time > self.log_time:
+            self.log_time = log_time
+        oldest = self.log_time - self.grace - self.window
+        while self._sent and self._sent[0][0] < oldest:
+            packet = self._sent.popleft()
+            if self._in_window.get(packet[2]) is packet:
+                del self._in_window[packet[2]]
+
+    def _sent_packet(self, key, src, send_time):
+        packet = [send_time, src, key, False]
+        self._sent.append(packet)
+        self._in_window[key] = packet
+        totals = self._totals[src]
+        totals[0] += 1
+        totals[2] = send_time
+        self._advance(send_time)
+
+    def _received_packet(self, key, src, recv_time):
+        packet = self._in_window.get(key)
+        if packet is not None:
+            packet[3] = True
+        self._totals[src][1] += 1
+        self.last_recv = recv_time
+        self._advance(recv_time)
+
+    @staticmethod
+    def _counts(sent, received):
+        return {'sent': sent, 'received': received,
+                'pdr': received / sent if sent else None}
+
+    def status(self, done=False):
+        """
+        Returns the current status as a dictionary that can be dumped as
+        JSON. If the log is `done`, no packets are in flight anymore.
+        """
+        window = collections.defaultdict(lambda: [0, 0])
+        if self.log_time is not None:
+            newest = self.log_time - (0 if done else self.grace)
+            for send_time, src, _, received in self._sent:
+                if send_time > newest:
+                    break
+                window[src][0] += 1
+                window[src][1] += received
+        srcs = set(self._totals)
+        if self._sources is not None:
+            srcs.update(self._sources())
+        sources = {}
+        hops = collections.defaultdict(lambda: [0, 0])
+        for src in sorted(srcs, key=str):
+            sent, received, last_send = self._totals.get(src, (0, 0, None))
+            src_hops = self._hops_to_sink(src) if self._hops_to_sink else None
+            sources[src] = self._counts(*window[src])
+            sources[src].update({
+                'hops_to_sink': src_hops, 'total_sent': sent,
+                'total_received': received, 'last_send': last_send,
+            })
+            if src_hops is not None:
+                hops[str(src_hops)][0] += window[src][0]
+                hops[str(src_hops)][1] += window[src][1]
+        res = self._counts(sum(s for s, _ in window.values()),
+                           sum(r for _, r in window.values()))
+        res.update({
+            'updated': time.time(),
+            'log_time': self.log_time,
+            'last_recv': self.last_recv,
+            'window': self.window,
+            'done': done,
+            'sources': sources,
+            'hops': {h: self._counts(*hops[h])
+                     for h in sorted(hops, key=int)},
+        })
+        return res
+
+    def publish(self, done=False):
+        """
+        Writes the current status to the status file. `done` marks that the
+        log is not followed anymore.
+        """
+        status = self.status(done)
+        with files.atomic_open(self.sink) as status_file:
+            json.dump(status, status_file, indent=1)
+        self._last_publish = time.monotonic()
+
+    def maybe_publish(self):
+        """
+        Publishes the current status if the last time was at least
+        `interval` seconds ago.
+        """
+        if self._last_publish is None or \
+           (time.monotonic() - self._last_publish) >= self.interval:
+            self.publish()
@@ -0,0 +1,124 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+
+import contextlib
+import mmap
+import re
+
+from . import files
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+
+@contextlib.contextmanager
+def mapped(logfile):
+    """
+    Memory-maps the log opened as binary file `logfile` read-only, so it can
+    be searched with bytes regular expressions without reading it line by
+    line. If `logfile` was opened with a `files.ReadHash`, the mapped log is
+    hashed once it was searched, while its pages are still cached.
+    """
+    try:
+        buf = mmap.mmap(logfile.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # empty files can not be mapped
+        yield b''
+        return
+    try:
+        yield buf
+        files.hash_mapped(logfile, buf)
+    finally:
+        buf.close()
+
+
+def line_end(buf, pos):
+    """
+    Returns the offset after the line in `buf` that contains `pos`.
+
+    >>> line_end(b'abc\\ndef', 1)
+    4
+    >>> line_end(b'abc\\ndef', 5)
+    7
+    """
+    end = buf.find(b'\n', pos)
+    if end < 0:
+        return len(buf)
+    return end + 1
+
+
+def find_start(buf, pattern):
+    """
+    Searches `buf` once for the compiled bytes `pattern` marking the start of
+    an experiment. Returns the match and the offset of the line after it, or
+    `None` and the length of `buf` if the experiment never started.
+
+    >>> import re
+    >>> match, pos = find_start(b'boot\\nSending 5 packets\\ndata\\n',
+    ...                         re.compile(rb'Sending \\d+ packets'))
+    >>> match.group(), pos
+    (b'Sending 5 packets', 23)
+    """
+    match = pattern.search(buf)
+    if match is None:
+        return None, len(buf)
+    return match, line_end(buf, match.end())
+
+
+def compile_lines(pattern):
+    """
+    Compiles the bytes or string `pattern` to a bytes pattern that only
+    matches at the start of a line of a memory-mapped log, see
+    `line_matches()`.
+
+    As the pattern is matched against the whole log, it must not match
+    beyond the newline at the end of a line, e.g. with `\\s` or a negated
+    character class that does not exclude `\\n`.
+
+    >>> compile_lines(r'(?P<node>m3-\\d+);').pattern
+    b'(?m)^(?:(?P<node>m3-\\\\d+);)'
+    """
+    if isinstance(pattern, str):
+        pattern = pattern.encode()
+    return re.compile(b'(?m)^(?:' + pattern + b')')
+
+
+def line_matches(buf, pattern, pos=0, end=None):
+    """
+    Matches `pattern`, compiled with `compile_lines()`, against the start of
+    each line of `buf` from offset `pos` up to offset `end`, like
+    `pattern.match(line)` for each `line` of the file. The lines are neither
+    copied out of `buf` nor decoded, and lines that do not match are skipped
+    without returning to Python. Yields only the successful matches.
+
+    >>> pattern = compile_lines(rb'a;(\\d)')
+    >>> [m.group(1) for m in line_matches(b'a;1\\nb;a;3\\na;2', pattern)]
+    [b'1', b'2']
+    """
+    return pattern.finditer(buf, pos, len(buf) if end is None else end)
+
+
+class _Decoded(dict):
+    def __missing__(self, value):
+        res = self[value] = value.decode(errors='ignore')
+        return res
+
+
+def decoder():
+    """
+    Returns a function that decodes the bytes of matched groups with only few
+    distinct values, such as node names, to strings. Each value is only
+    decoded once.
+
+    >>> decode = decoder()
+    >>> decode(b'm3-42')
+    'm3-42'
+    """
+    return _Decoded().__getitem__
@@ -0,0 +1,115 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+
+import hashlib
+import json
+import os
+
+from . import files
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+MANIFEST_NAME_FMT = 'conversion_manifest.{parser}.json'
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def content_hash(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprinted(func, logname, **kwargs):
+    """
+    Calls `func(logname, read_hash=read_hash, **kwargs)`, which returns the
+    output files it wrote (or `None` if it wrote none), and returns them
+    together with the fingerprint of the log, ready for `Manifest.record()`.
+
+    `func` passes the `files.ReadHash` `read_hash` to `files.open_log()`, so
+    the log is hashed as it is converted. Only if it did not read the whole
+    log, e.g. as it changed meanwhile, the log is read again to be hashed.
+    """
+    stat = os.stat(logname)
+    read_hash = files.ReadHash()
+    outputs = func(logname, read_hash=read_hash, **kwargs)
+    if read_hash.size == stat.st_size:
+        sha256 = read_hash.hexdigest()
+    else:
+        sha256 = content_hash(logname)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha256,
+    }, outputs
+
+
+class Manifest:
+    """
+    Records for each converted log of `parser` in `data_path` its size,
+    modification time and content hash, the version of the parser, and the
+    output files, so only logs that changed, were never converted, or were
+    converted by another parser version need to be converted again.
+    """
+    def __init__(self, data_path, parser, version):
+        self.data_path = data_path
+        self.version = version
+        self.filename = os.path.join(
+            data_path, MANIFEST_NAME_FMT.format(parser=parser)
+        )
+        try:
+            with open(self.filename) as manifest_file:
+                self._entries = json.load(manifest_file)
+        except FileNotFoundError:
+            self._entries = {}
+
+    def _path(self, basename):
+        return os.path.join(self.data_path, basename)
+
+    def is_current(self, logname, required=()):
+        """
+        Returns whether `logname` does not need to be converted again. If
+        output files are `required` that were not written by the recorded
+        conversion (e.g. because they are optional), it needs to be.
+        """
+        entry = self._entries.get(os.path.basename(logname))
+        if entry is None or entry['version'] != self.version:
+            return False
+        if not {os.path.basename(output)
+                for output in required}.issubset(entry['outputs']):
+            return False
+        if not all(os.path.exists(self._path(output))
+                   for output in entry['outputs']):
+            return False
+        stat = os.stat(logname)
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns != entry['mtime_ns']:
+            # only touched (e.g. by copying)?
+            if content_hash(logname) != entry['sha256']:
+                return False
+            entry['mtime_ns'] = stat.st_mtime_ns
+        return True
+
+    def record(self, logname, result):
+        fprint, outputs = result
+        if outputs is None:
+            return
+        entry = dict(fprint)
+        entry['version'] = self.version
+        entry['outputs'] = sorted(os.path.basename(output)
+                                  for output in outputs)
+        self._entries[os.path.basename(logname)] = entry
+
+    def save(self):
+        with files.atomic_open(self.filename) as manifest_file:
+            json.dump(self._entries, manifest_file, indent=1, sort_keys=True)
@@ -0,0 +1,66 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+
+import csv
+import ipaddress
+import os
+import threading
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+NODES_CSV_NAME = 'nodes.csv'
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def addr_key(addr):
+    """
+    Returns the key a node is identified by in the logs, i.e. the last two
+    bytes of its IPv6 address.
+
+    >>> hex(addr_key('fe80::ec66:70a7:ac0d:1881'))
+    '0x1881'
+    """
+    packed = ipaddress.IPv6Address(addr).packed
+    return (packed[14] << 8) | packed[15]
+
+
+def _build(nodes_csv):
+    index = {}
+    with open(nodes_csv) as nodes_file:
+        for row in csv.DictReader(nodes_file):
+            # first row wins, so the `sink` row (which shares its key with
+            # the sink's own row) never shadows the actual node name
+            index.setdefault(addr_key(row['addr']), row['name'])
+    return index
+
+
+def load(data_path):
+    """
+    Returns the mapping of address keys (see `addr_key()`) to node names for
+    the `nodes.csv` in `data_path`.
+
+    The mapping is built once per process and only rebuilt when `nodes.csv`
+    changes, so it is shared by all parsers and must not be modified.
+    """
+    nodes_csv = os.path.realpath(os.path.join(data_path, NODES_CSV_NAME))
+    stat = os.stat(nodes_csv)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _indexes.get(nodes_csv)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _indexes_lock:
+        cached = _indexes.get(nodes_csv)
+        if cached is None or cached[0] != version:
+            cached = (version, _build(nodes_csv))
+            _indexes[nodes_csv] = cached
+    return cached[1]
@@ -0,0 +1,407 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+
+import collections
+import struct
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+# byte order and timestamp resolution by magic number of a pcap file
+_PCAP_MAGICS = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+LINKTYPE_ETHERNET = 1
+LINKTYPE_IEEE802_15_4 = 195         # with FCS
+LINKTYPE_IEEE802_15_4_NOFCS = 230
+# UDP port of the ZigBee Encapsulation Protocol (ZEP) the sniffer aggregator
+# encapsulates the captured frames in
+ZEP_PORT = 17754
+FCS_LEN = 2
+
+FRAME_TYPES = {0: 'beacon', 1: 'data', 2: 'ack', 3: 'cmd'}
+FRAGMENT_KINDS = ('frag1', 'fragn', 'rfrag')
+BROADCAST = 'ffff'
+
+# seconds within which captures of the same frame by other sniffers are
+# dropped as duplicates
+DUP_WINDOW = .005
+# seconds within which the same frame again is a link layer retransmission
+RETRANS_WINDOW = .1
+# frames per chunk returned by frame_chunks()
+CHUNK_SIZE = 65536
+# duration of a byte with the 250 kbit/s of the 2.4 GHz O-QPSK PHY in seconds
+BYTE_DURATION = 32e-6
+# bytes of synchronization and PHY header in front of each frame
+PHY_OVERHEAD = 6
+# seconds a fragment may be held by a node before it is not matched to its
+# forwarded copy anymore
+MAX_FORWARDING_DELAY = 30
+# trailing payload bytes that identify a fragment across hops
+FRAGMENT_ID_LEN = 8
+
+_BE16 = struct.Struct('>H')
+
+
+def records(capture):
+    """
+    Yields the time, link type, and data of each record of the pcap file
+    opened as binary file `capture`, reading one record at a time. A
+    truncated last record, e.g. of a capture still being written, is
+    skipped.
+    """
+    header = capture.read(24)
+    if len(header) < 24:
+        return
+    try:
+        endian, resolution = _PCAP_MAGICS[header[:4]]
+    except KeyError:
+        raise ValueError(f'{capture.name} is not a pcap file') from None
+    # the upper bits of the link type field may carry FCS information
+    linktype = struct.unpack(f'{endian}I', header[20:24])[0] & 0x0fffffff
+    record_header = struct.Struct(f'{endian}IIII')
+    read = capture.read
+    while True:
+        rec_header = read(record_header.size)
+        if len(rec_header) < record_header.size:
+            return
+        sec, frac, incl_len, _ = record_header.unpack(rec_header)
+        data = read(incl_len)
+        if len(data) < incl_len:
+            return
+        yield sec + frac * resolution, linktype, data
+
+
+def _zep_psdu(data):
+    """
+    Returns the device ID of the sniffer and the 802.15.4 frame including the
+    FCS of the ZEP packet in the Ethernet frame `data`, or `None` if `data`
+    is not a ZEP data packet.
+    """
+    ethertype = data[12:14]
+    if ethertype == b'\x08\x00':
+        udp = 14 + (data[14] & 0x0f) * 4
+        if len(data) < udp or data[23] != 17:
+            return None
+    elif ethertype == b'\x86\xdd':
+        udp = 14 + 40
+        if len(data) < udp or data[20] != 17:
+            return None
+    else:
+        return None
+    zep = udp + 8
+    if len(data) < zep + 16 or \
+       _BE16.unpack_from(data, udp + 2)[0] != ZEP_PORT or \
+       data[zep:zep + 2] != b'EX':
+        return None
+    if data[zep + 2] == 1:
+        sniffer = _BE16.unpack_from(data, zep + 4)[0]
+        start = zep + 16
+    elif data[zep + 2] == 2 and data[zep + 3] == 1 and len(data) >= zep + 32:
+        sniffer = _BE16.unpack_from(data, zep + 5)[0]
+        start = zep + 32
+    else:
+        return None
+    return sniffer, data[start:start + data[start - 1]]
+
+
+def psdus(capture):
+    """
+    Yields the time, the device ID of the sniffer (-1 if unknown), and the
+    802.15.4 frame including the FCS of each frame in the pcap file opened as
+    binary file `capture`. The frames may either be encapsulated in ZEP
+    packets, as by the sniffer aggregator, or be raw 802.15.4 frames.
+    """
+    for time, linktype, data in records(capture):
+        if linktype == LINKTYPE_ETHERNET:
+            res = _zep_psdu(data)
+            if res is None:
+                continue
+            yield (time,) + res
+        elif linktype == LINKTYPE_IEEE802_15_4:
+            yield time, -1, data
+        elif linktype == LINKTYPE_IEEE802_15_4_NOFCS:
+            yield time, -1, data + bytes(FCS_LEN)
+        else:
+            raise ValueError(f'Unsupported link type {linktype} in '
+                             f'{capture.name}')
+
+
+def _addr(frame, pos, mode):
+    """
+    Returns the 802.15.4 address in `mode` (2: short, 3: extended) at `pos`
+    in `frame` as hex string and the position after it.
+    """
+    length = {2: 2, 3: 8}.get(mode, 0)
+    # addresses are transmitted in little endian
+    return frame[pos:pos + length][::-1].hex(), pos + length
+
+
+def decode(psdu):
+    """
+    Decodes the 802.15.4 MAC header and the 6LoWPAN fragmentation header
+    (FRAG1, FRAGN, RFRAG, or RFRAG-ACK) of `psdu`, the 802.15.4 frame
+    including its FCS. Returns a dictionary with the frame `kind`, the
+    addresses `src` and `dst` as hex strings, the sequence number `seq`,
+    the datagram `tag`, datagram `size`, and fragment `offset` in bytes (-1
+    if not present), the `frame_len`, and the `payload` after the
+    fragmentation header. Returns `None` for frames that can not be decoded,
+    e.g. with security enabled.
+
+    >>> frame = bytes.fromhex('41 98 2a 23 00 ff ff 34 12 e3 02 00 07 06 aa'
+    ...                       '0000')
+    >>> res = decode(frame)
+    >>> res['kind'], res['src'], res['dst'], res['tag'], res['offset']
+    ('fragn', '1234', 'ffff', 7, 48)
+    >>> decode(bytes.fromhex('02 00 2a 0000'))['kind']
+    'ack'
+    """
+    # pylint: disable=too-many-locals,too-many-branches
+    if len(psdu) < 3 + FCS_LEN:
+        return None
+    fcf = psdu[0] | (psdu[1] << 8)
+    kind = FRAME_TYPES.get(fcf & 0x7)
+    if kind is None or fcf & 0x8:
+        # reserved frame type or security enabled
+        return None
+    frame = psdu[:-FCS_LEN]
+    dst_mode = (fcf >> 10) & 0x3
+    src_mode = (fcf >> 14) & 0x3
+    pos = 3
+    if dst_mode:
+        pos += 2
+    dst, pos = _addr(frame, pos, dst_mode)
+    if src_mode and not fcf & 0x40:
+        pos += 2
+    src, pos = _addr(frame, pos, src_mode)
+    if pos > len(frame):
+        return None
+    res = {
+        'kind': kind, 'src': src, 'dst': dst, 'seq': psdu[2], 'tag': -1,
+        'size': -1, 'offset': -1, 'frame_len': len(psdu),
+    }
+    payload = frame[pos:]
+    if kind != 'data' or not payload:
+        res['payload'] = payload
+        return res
+    dispatch = payload[0]
+    if dispatch & 0xf8 == 0xc0 and len(payload) >= 4:
+        res.update(kind='frag1', size=_BE16.unpack_from(payload)[0] & 0x7ff,
+                   tag=_BE16.unpack_from(payload, 2)[0], offset=0)
+        payload = payload[4:]
+    elif dispatch & 0xf8 == 0xe0 and len(payload) >= 5:
+        res.update(kind='fragn', size=_BE16.unpack_from(payload)[0] & 0x7ff,
+                   tag=_BE16.unpack_from(payload, 2)[0],
+                   offset=payload[4] * 8)
+        payload = payload[5:]
+    elif dispatch & 0xfe == 0xe8 and len(payload) >= 6:
+        sequence = (payload[2] >> 2) & 0x1f
+        offset = _BE16.unpack_from(payload, 4)[0]
+        # the offset field of the first fragment carries the datagram size
+        res.update(kind='rfrag', tag=payload[1],
+                   size=offset if sequence == 0 else -1,
+                   offset=0 if sequence == 0 else offset)
+        payload = payload[6:]
+    elif dispatch & 0xfe == 0xea and len(payload) >= 2:
+        res.update(kind='rfrag-ack', tag=payload[1])
+        payload = payload[2:]
+    res['payload'] = payload
+    return res
+
+
+class Transmissions:
+    """
+    Turns the captures of frames into transmissions. A frame that is captured
+    by several sniffers within `dup_window` seconds is only returned once
+    (for the first sniffer). A frame that is captured again later within
+    `retrans_window` seconds is a link layer retransmission and is marked
+    with `retrans` 1.
+    """
+    def __init__(self, dup_window=DUP_WINDOW, retrans_window=RETRANS_WINDOW):
+        self.dup_window = dup_window
+        self.retrans_window = retrans_window
+        # last capture of each frame as [time, sniffers]
+        self._last = {}
+        self._until_prune = CHUNK_SIZE
+
+    def _prune(self, now):
+        oldest = now - self.retrans_window
+        self._last = {key: last for key, last in self._last.items()
+                      if last[0] >= oldest}
+        self._until_prune = max(CHUNK_SIZE, 2 * len(self._last))
+
+    def __call__(self, time, sniffer, frame):
+        """
+        Returns `frame` with its `time`, `sniffer`, and `retrans` set, or
+        `None` if it is a duplicate capture.
+        """
+        key = (frame['src'], frame['dst'], frame['seq'], frame['frame_len'],
+               frame['kind'])
+        last = self._last.get(key)
+        retrans = 0
+        if last is not None and time - last[0] <= self.retrans_window:
+            if time - last[0] <= self.dup_window and sniffer not in last[1]:
+                last[1].add(sniffer)
+                return None
+            retrans = 1
+        self._last[key] = [time, {sniffer}]
+        self._until_prune -= 1
+        if not self._until_prune:
+            self._prune(time)
+        frame.update(time=time, sniffer=sniffer, retrans=retrans)
+        return frame
+
+
+def frame_chunks(capture, size=CHUNK_SIZE, transmissions=None):
+    """
+    Yields the decoded transmissions (see `decode()` and `Transmissions`) of
+    the pcap file opened as binary file `capture` as lists of at most `size`
+    frames, so captures of any size can be processed chunk by chunk.
+    """
+    if transmissions is None:
+        transmissions = Transmissions()
+    chunk = []
+    for time, sniffer, psdu in psdus(capture):
+        frame = decode(psdu)
+        if frame is None:
+            continue
+        frame = transmissions(time, sniffer, frame)
+        if frame is None:
+            continue
+        chunk.append(frame)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def airtime(frame_len):
+    """
+    Returns the seconds a frame of `frame_len` bytes (including FCS) occupies
+    the channel.
+
+    >>> round(airtime(127) * 1000, 3)
+    4.256
+    """
+    return (PHY_OVERHEAD + frame_len) * BYTE_DURATION
+
+
+class HopStats:
+    """
+    Accumulates the transmitted frames and their airtime per node and per
+    `bin_width` seconds, and the delay with which each node forwarded the
+    fragments it received, from the chunks of `frame_chunks()`.
+
+    A received fragment is matched to the first fragment the receiving node
+    sends afterwards with the same kind, offset, and trailing payload bytes,
+    so only fragments forwarded without reassembly (e.g. with fragment
+    forwarding or SFR) are matched. Retransmissions are not matched, and
+    fragments not forwarded within `max_delay` seconds are dropped.
+
+    >>> stats = HopStats()
+    >>> frag = {'kind': 'fragn', 'offset': 48, 'payload': b'abc',
+    ...         'frame_len': 50, 'retrans': 0}
+    >>> stats.update([dict(frag, src='0001', dst='0002', time=1.0),
+    ...               dict(frag, src='0002', dst='0003', time=1.25)])
+    >>> [(row['node'], row['frames'], row['forwarded'], row['fwd_delay_mean'])
+    ...  for row in stats.node_rows()]
+    [('0001', 1, 0, ''), ('0002', 1, 1, 0.25)]
+    >>> [(row['time'], row['frames']) for row in stats.airtime_rows()]
+    [(1.0, 2)]
+    """
+    NODE_FIELDNAMES = ['node', 'frames', 'airtime', 'forwarded',
+                       'fwd_delay_mean', 'fwd_delay_min', 'fwd_delay_max']
+    AIRTIME_FIELDNAMES = ['time', 'frames', 'airtime']
+
+    def __init__(self, bin_width=1, max_delay=MAX_FORWARDING_DELAY):
+        self.bin_width = bin_width
+        self.max_delay = max_delay
+        # per node: frames, airtime, forwarded, delay sum, min, and max
+        self._nodes = collections.defaultdict(
+            lambda: [0, 0.0, 0, 0.0, float('inf'), 0.0]
+        )
+        # per bin: frames and airtime
+        self._bins = collections.defaultdict(lambda: [0, 0.0])
+        # arrival times of unforwarded fragments by receiver and identity
+        self._pending = {}
+
+    def _forwarded(self, frame, identity):
+        arrivals = self._pending.get((frame['src'], identity))
+        if not arrivals:
+            return
+        delay = frame['time'] - arrivals.popleft()
+        if not arrivals:
+            del self._pending[(frame['src'], identity)]
+        node = self._nodes[frame['src']]
+        node[2] += 1
+        node[3] += delay
+        node[4] = min(node[4], delay)
+        node[5] = max(node[5], delay)
+
+    def _prune(self, now):
+        oldest = now - self.max_delay
+        for key in list(self._pending):
+            arrivals = self._pending[key]
+            while arrivals and arrivals[0] < oldest:
+                arrivals.popleft()
+            if not arrivals:
+                del self._pending[key]
+
+    def update(self, chunk):
+        for frame in chunk:
+            frame_airtime = airtime(frame['frame_len'])
+            bin_ = self._bins[int(frame['time'] // self.bin_width)]
+            bin_[0] += 1
+            bin_[1] += frame_airtime
+            if frame['src']:
+                # ACKs carry no source address
+                node = self._nodes[frame['src']]
+                node[0] += 1
+                node[1] += frame_airtime
+            if frame['kind'] not in FRAGMENT_KINDS or frame['retrans']:
+                continue
+            identity = (frame['kind'], frame['offset'],
+                        bytes(frame['payload'][-FRAGMENT_ID_LEN:]))
+            self._forwarded(frame, identity)
+            if frame['dst'] != BROADCAST:
+                self._pending.setdefault(
+                    (frame['dst'], identity), collections.deque()
+                ).append(frame['time'])
+        if chunk:
+            self._prune(chunk[-1]['time'])
+
+    def node_rows(self, name=None):
+        """
+        Yields a row per node sorted by address. `name` returns the node
+        name written instead of an address, or `None` if it is not known.
+        """
+        for addr, (frames, air, forwarded, delay_sum, delay_min,
+                   delay_max) in sorted(self._nodes.items()):
+            yield {
+                'node': (name(addr) if name else None) or addr,
+                'frames': frames,
+                'airtime': air,
+                'forwarded': forwarded,
+                'fwd_delay_mean': delay_sum / forwarded if forwarded else '',
+                'fwd_delay_min': delay_min if forwarded else '',
+                'fwd_delay_max': delay_max if forwarded else '',
+            }
+
+    def airtime_rows(self):
+        """
+        Yields a row per bin with at least one frame, sorted by time.
+        """
+        for num, (frames, air) in sorted(self._bins.items()):
+            yield {'time': float(num * self.bin_width), 'frames': frames,
+                   'airtime': air}
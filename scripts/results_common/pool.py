@@ -0,0 +1,84 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+
+def default_jobs():
+    return multiprocessing.cpu_count()
+
+
+def _largest_first(tasks):
+    def size(task):
+        try:
+            return os.path.getsize(task[0])
+        except OSError:
+            return 0
+    return sorted(tasks, key=size, reverse=True)
+
+
+def run(func, tasks, jobs=None, on_success=None):
+    """
+    Calls `func(logname, **kwargs)` for each `(logname, kwargs)` in `tasks`
+    with `jobs` worker processes (default: number of CPUs). For each task
+    that succeeded, `on_success(logname, result)` is called in the calling
+    process.
+
+    The largest logs are started first, so a single large log does not end
+    up running alone at the end. With `jobs=1` all tasks are run in the
+    calling process. A failing task does not stop the others; the exceptions
+    of all failed tasks are returned as a dictionary keyed by log name.
+    """
+    if jobs is None:
+        jobs = default_jobs()
+    tasks = _largest_first(tasks)
+    total = len(tasks)
+    errors = {}
+
+    def _done(num, logname, exc, result=None):
+        if exc is None:
+            logging.info('[%d/%d] Converted %s', num, total, logname)
+            if on_success is not None:
+                on_success(logname, result)
+        else:
+            logging.error('[%d/%d] Failed to convert %s: %r', num, total,
+                          logname, exc)
+            errors[logname] = exc
+
+    if jobs <= 1:
+        for num, (logname, kwargs) in enumerate(tasks, 1):
+            try:
+                result = func(logname, **kwargs)
+            except Exception as exc:    # pylint: disable=broad-except
+                _done(num, logname, exc)
+            else:
+                _done(num, logname, None, result)
+        return errors
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(func, logname, **kwargs): logname
+                   for logname, kwargs in tasks}
+        try:
+            for num, future in enumerate(
+                concurrent.futures.as_completed(futures), 1
+            ):
+                exc = future.exception()
+                _done(num, futures[future], exc,
+                      None if exc is not None else future.result())
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            raise
+    return errors
@@ -0,0 +1,72 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+
+import concurrent.futures
+import logging
+
+from . import pool
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+
+def run(figures, setup=None, setup_args=(), jobs=None):
+    """
+    Renders each figure `(name, func, args)` in `figures` by calling
+    `func(*args)` with `jobs` worker processes (default: number of CPUs).
+
+    Each worker calls `setup(*setup_args)` once before its first figure, so
+    the matplotlib backend, style, and rcParams are set up in every worker
+    the same way. `func` and its `args` need to be picklable, so `func`
+    should be a module-level function drawing and saving a figure from plain
+    data. With `jobs=1` all figures are rendered in the calling process. A
+    failing figure does not stop the others; the exceptions of all failed
+    figures are returned as a dictionary keyed by figure name.
+    """
+    if jobs is None:
+        jobs = pool.default_jobs()
+    figures = list(figures)
+    total = len(figures)
+    errors = {}
+
+    def _done(num, name, exc):
+        if exc is None:
+            logging.info('[%d/%d] Rendered %s', num, total, name)
+        else:
+            logging.error('[%d/%d] Failed to render %s: %r', num, total,
+                          name, exc)
+            errors[name] = exc
+
+    if jobs <= 1 or total <= 1:
+        if setup is not None:
+            setup(*setup_args)
+        for num, (name, func, args) in enumerate(figures, 1):
+            try:
+                func(*args)
+            except Exception as exc:    # pylint: disable=broad-except
+                _done(num, name, exc)
+            else:
+                _done(num, name, None)
+        return errors
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=min(jobs, total), initializer=setup, initargs=setup_args,
+    ) as executor:
+        futures = {executor.submit(func, *args): name
+                   for name, func, args in figures}
+        try:
+            for num, future in enumerate(
+                concurrent.futures.as_completed(futures), 1
+            ):
+                _done(num, futures[future], future.exception())
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            raise
+    return errors
@@ -0,0 +1,142 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+# pylint: disable=import-outside-toplevel
+
+import os
+import threading
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+EDGELIST_NAME_FMT = '{network}.edgelist.gz'
+
+_cache = {}
+_cache_lock = threading.RLock()
+
+
+class SinkTree:
+    """
+    Hop distance to the sink and number of DFS successors (as in
+    `nx.dfs_successors(graph, sink)`) of every node in `graph`, computed with
+    one traversal each from the sink.
+    """
+    def __init__(self, graph, sink):
+        import networkx as nx
+
+        self.sink = sink
+        self._hops = nx.single_source_shortest_path_length(graph, sink)
+        self._successors = {
+            node: len(succs)
+            for node, succs in nx.dfs_successors(graph, sink).items()
+        }
+
+    def hops_to_sink(self, node):
+        try:
+            return self._hops[node]
+        except KeyError as exc:
+            import networkx as nx
+
+            raise nx.NetworkXNoPath(
+                f'Node {node} not reachable from {self.sink}'
+            ) from exc
+
+    def known_hops_to_sink(self, node):
+        """
+        Returns the hop distance of `node` to the sink or `None` if it is not
+        reachable.
+        """
+        return self._hops.get(node)
+
+    def successors(self, node):
+        return self._successors.get(node, 0)
+
+    def sources(self):
+        """
+        Returns the nodes that are reachable from the sink, except the sink.
+        """
+        return [node for node in self._hops if node != self.sink]
+
+
+def _cached(key, version, build):
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, build())
+            _cache[key] = cached
+    return cached[1]
+
+
+def _version(edgelist):
+    return os.stat(edgelist).st_mtime_ns
+
+
+def edgelist_path(data_path, network):
+    return os.path.realpath(os.path.join(
+        data_path, EDGELIST_NAME_FMT.format(network=network)
+    ))
+
+
+def load_graph(edgelist):
+    """
+    Returns the graph stored in `edgelist`. It is read once per process and
+    only read again when the file changes, so it is shared by all parsers
+    and must not be modified.
+    """
+    # networkx takes long to import, so it is only imported once needed
+    import networkx as nx
+
+    edgelist = os.path.realpath(edgelist)
+    return _cached(
+        ('graph', edgelist), _version(edgelist),
+        lambda: nx.read_edgelist(edgelist, data=[('weight', float)]),
+    )
+
+
+def sink_tree(edgelist, sink):
+    """
+    Returns the `SinkTree` of the graph in `edgelist`. Like the graph it is
+    computed once per process, edge list, and sink.
+    """
+    edgelist = os.path.realpath(edgelist)
+    return _cached(
+        ('sink_tree', edgelist, sink), _version(edgelist),
+        lambda: SinkTree(load_graph(edgelist), sink),
+    )
+
+
+def network_index(data_path, networks):
+    """
+    Returns a mapping of the node set of each of `networks` to the network's
+    ID. For networks with the same node set the one listed first is kept.
+    """
+    edgelists = [edgelist_path(data_path, network) for network in networks]
+
+    def build():
+        index = {}
+        for network, edgelist in zip(networks, edgelists):
+            index.setdefault(frozenset(load_graph(edgelist).nodes), network)
+        return index
+
+    return _cached(
+        ('network_index', tuple(edgelists)),
+        tuple(_version(edgelist) for edgelist in edgelists),
+        build,
+    )
+
+
+def find_network(data_path, networks, nodes):
+    """
+    Returns the first of `networks` that contains all of `nodes` or `None`
+    if there is none.
+    """
+    for node_set, network in network_index(data_path, networks).items():
+        if node_set.issuperset(nodes):
+            return network
+    return None
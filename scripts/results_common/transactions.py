@@ -0,0 +1,131 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+# pylint: disable=import-outside-toplevel
+
+from . import columnar
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+# a datagram tag that is reused after its fragment buffer was destroyed
+# (event type 'cx') is counted as a new transaction with ID tag + n * TAG_STEP
+TAG_STEP = 0xff
+TRANSACTION = 'transaction'
+TRANSACTION_IDS = 'transaction_ids'
+TRANSACTION_OFFSETS = 'transaction_offsets'
+
+
+def transactions_name(congname):
+    """
+    >>> transactions_name('test.m3-2.cong.csv')
+    'test.m3-2.transactions.npz'
+    """
+    return f'{congname[:-len(".cong.csv")]}.transactions.npz'
+
+
+def _split(time, tag, is_cx):
+    """
+    Returns the order of congestion events that sorts them by transaction and
+    time, and the transaction ID of each event in that order.
+
+    The events of a tag are split into a new transaction after each `cx`
+    event but the last one, so events after the last `cx` stay in the last
+    transaction.
+
+    >>> import numpy as np
+    >>> _split(np.array([.1, .2, .3, .4, .5]), np.array([1, 1, 1, 1, 1]),
+    ...        np.array([False, True, False, True, False]))
+    (array([0, 1, 2, 3, 4]), array([  1,   1, 256, 256, 256]))
+    """
+    import numpy as np
+
+    if not len(tag):
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.int64)
+    # sort events by time per tag, keeping the order of simultaneous events
+    order = np.argsort(time, kind='stable')
+    order = order[np.argsort(tag[order], kind='stable')]
+    tag = tag[order]
+    is_cx = is_cx[order].astype(np.int64)
+    new_tag = np.r_[True, tag[1:] != tag[:-1]]
+    starts = np.flatnonzero(new_tag)
+    group = np.cumsum(new_tag) - 1
+    cxs_before = np.cumsum(is_cx) - is_cx
+    cxs_before -= cxs_before[starts][group]
+    cxs = np.add.reduceat(is_cx, starts)
+    segment = np.minimum(cxs_before, np.maximum(cxs - 1, 0)[group])
+    ids = tag + TAG_STEP * segment
+    # a split transaction may get the ID of an existing one, so sort again
+    by_id = np.argsort(time[order], kind='stable')
+    by_id = by_id[np.argsort(ids[by_id], kind='stable')]
+    return order[by_id], ids[by_id]
+
+
+def _index(columns, is_cx):
+    import numpy as np
+
+    order, ids = _split(columns['time'], columns['tag'], is_cx)
+    indexed = {name: column[order] for name, column in columns.items()}
+    tx_ids, starts = np.unique(ids, return_index=True)
+    indexed[TRANSACTION] = ids
+    indexed[TRANSACTION_IDS] = tx_ids
+    indexed[TRANSACTION_OFFSETS] = np.r_[starts, len(ids)]
+    return indexed
+
+
+class TransactionWriter(columnar.NPZWriter):
+    """
+    Collects the congestion events of a node like `columnar.NPZWriter`, but
+    saves them sorted by transaction and time, with a `transaction` column
+    and the offsets of each transaction in the rows, see `Transactions`.
+    """
+    def arrays(self):
+        arrays = super().arrays()
+        types = list(self._categories['type'])
+        cx_code = types.index('cx') if 'cx' in types else -2
+        columns = {name: arrays.pop(name) for name in self.fieldnames}
+        arrays.update(_index(columns, columns['type'] == cx_code))
+        return arrays
+
+
+class Transactions:
+    """
+    Congestion events of a node sorted by transaction and time. Indexing with
+    a transaction ID returns the columns of the events of that transaction as
+    NumPy arrays, which are slices of the columns of all events.
+    """
+    def __init__(self, columns):
+        self.ids = columns.pop(TRANSACTION_IDS)
+        self.offsets = columns.pop(TRANSACTION_OFFSETS)
+        self.columns = columns
+        self._positions = {int(tx): i for i, tx in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return (int(tx) for tx in self.ids)
+
+    def __getitem__(self, tx_id):
+        i = self._positions[tx_id]
+        rows = slice(self.offsets[i], self.offsets[i + 1])
+        return {name: column[rows] for name, column in self.columns.items()}
+
+
+def read(congname):
+    """
+    Returns the `Transactions` of the congestion events CSV `congname`, from
+    the `.transactions.npz` file written by the parser if the CSV did not
+    change since, see `columnar.is_current()`.
+    """
+    txname = transactions_name(congname)
+    if columnar.is_current(txname, congname):
+        return Transactions(columnar.load(txname))
+    columns = columnar.read(congname)
+    return Transactions(_index(columns, columns['type'] == 'cx'))
@@ -0,0 +1,94 @@
+# Copyright (C) 2021 Freie Universität Berlin
+#
+# This file is subject to the terms and conditions of the GNU Lesser
+# General Public License v2.1. See the file LICENSE in the top level
+# directory for more details.
+
+# pylint: disable=missing-module-docstring
+
+import logging
+
+__author__ = 'Martine S. Lenders'
+__copyright__ = 'Copyright 2021 Freie Universität Berlin'
+__license__ = 'LGPL v2.1'
+__email__ = 'm.lenders@fu-berlin.de'
+
+
+class ReorderWindow:
+    """
+    Merges the send and receive records of packets, keyed by their source and
+    a sequence number, such as the packet ID, that a source increments with
+    each packet, and passes the merged records to `write`.
+
+    With a `size`, a record is written as soon as it has all of
+    `complete_keys`, and at most `size` incomplete records are kept. If there
+    are more, the oldest one is written as is, e.g. for a lost packet or if
+    its receive record is more than `size` records late. Only the highest
+    sequence number written of each source is kept, so a record that is not
+    pending and not newer than that was already written. Such records are
+    dropped and counted in `late`, so they do not end up as a second row, and
+    reported by `flush()` for the log `name`. Without a `size`, all records
+    are kept until `flush()` and written in the order they were first seen.
+
+    >>> rows = []
+    >>> window = ReorderWindow(rows.append, 1)
+    >>> window.update(('a', 1), {'send_time': 0.1})
+    >>> window.update(('a', 2), {'send_time': 0.2})
+    >>> window.update(('a', 2), {'recv_time': 0.3})
+    >>> window.update(('a', 1), {'recv_time': 0.4})
+    >>> rows
+    [{'send_time': 0.1}, {'send_time': 0.2, 'recv_time': 0.3}]
+    >>> window.late, ('a', 1) in window, ('b', 1) in window
+    (1, True, False)
+    """
+    def __init__(self, write, size=None,
+                 complete_keys=('send_time', 'recv_time'), name=None):
+        self._write = write
+        self.name = name
+        self._size = size
+        self._complete_keys = complete_keys
+        self._pending = {}
+        # highest sequence number written per source
+        self._written = {}
+        self.late = 0
+
+    def __contains__(self, key):
+        return key in self._pending or self._was_written(key)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _was_written(self, key):
+        source, seq = key
+        return source in self._written and seq <= self._written[source]
+
+    def _write_pending(self, key):
+        source, seq = key
+        if not self._was_written(key):
+            self._written[source] = seq
+        self._write(self._pending.pop(key))
+
+    def update(self, key, record):
+        pending = self._pending.get(key)
+        if pending is None:
+            if self._was_written(key):
+                self.late += 1
+                return
+            pending = self._pending[key] = record
+        else:
+            pending.update(record)
+        if self._size is None:
+            return
+        if all(k in pending for k in self._complete_keys):
+            self._write_pending(key)
+        elif len(self._pending) > self._size:
+            self._write_pending(next(iter(self._pending)))
+
+    def flush(self):
+        for record in self._pending.values():
+            self._write(record)
+        self._pending.clear()
+        if self.late:
+            logging.warning('%s: dropped %d records that arrived after '
+                            'their packet was written, consider a larger '
+                            'reorder window', self.name, self.late)